@@ -1,33 +1,158 @@
-# Import flask and template operators
-from flask import Flask, render_template
+"""
+The application package. The Flask app is built by create_app(); nothing
+heavy happens at import time, so tools that only need `settings` or
+`database` don't pay for blueprints, SQLAlchemy or background jobs.
 
-# Import SQLAlchemy
-from flask_sqlalchemy import SQLAlchemy
-# Define the WSGI application object
-app = Flask(__name__)
+`from app import app` and the `import app` / `app.config` idiom used by
+settings and database still work: the default app is built on first
+use of `app.app` (see __getattr__ below). `app.config` never builds it.
+"""
 
-# Configurations
-app.config.from_object('config')
+import os
+import threading
 
-# Define the database object which is imported
-# by modules and controllers
-db = SQLAlchemy(app)
+_app = None
+_app_lock = threading.Lock()
+_config = None
+_db = None
 
-# Sample HTTP error handling
 
+def create_app(config='config'):
+    """
+    Builds the WSGI application.
 
-@app.errorhandler(404)
-def not_found(error):
-    return render_template('404.html'), 404
+    Params:
+        config (string, optional): The config object or module name.
+                                   Defaults to 'config'.
 
-# Import a module / component using its blueprint handler variable (mod_auth)
-from app.mod_auth.controllers.user import mod_auth as auth_module
+    Returns:
+        (Flask): The application.
+    """
+    # Import flask and template operators
+    from flask import Flask, render_template
 
-# Register blueprint(s)
-app.register_blueprint(auth_module)
-# app.register_blueprint(xyz_module)
-# ..
+    # Define the WSGI application object
+    app = Flask(__name__)
 
-# Build the database:
-# This will create the database file using SQLAlchemy
-db.create_all()
+    # Configurations
+    app.config.from_object(config)
+
+    # JSON encoding backend, 'json' or 'orjson'.
+    from settings import codec
+    codec.set_backend(app.config.get('JSON_BACKEND', 'json'))
+
+    # Sample HTTP error handling
+
+    @app.errorhandler(404)
+    def not_found(error):
+        return render_template('404.html'), 404
+
+    # Import a module / component using its blueprint handler variable (mod_auth)
+    from app.mod_auth.controllers.user import mod_auth as auth_module
+    from app.mod_auth.controllers import admin, batch, roles, sessions  # noqa: F401
+
+    # Register blueprint(s)
+    app.register_blueprint(auth_module)
+    # app.register_blueprint(xyz_module)
+    # ..
+
+    # Request metrics and the metrics endpoint, if METRICS_ENABLED.
+    from settings import metrics
+    metrics.install(app)
+
+    # On-demand request profiling, if PROFILE_ENABLED.
+    from settings import profiling
+    profiling.install(app)
+
+    # W3C trace context and span export, if TRACING_ENABLED.
+    from settings import tracing
+    tracing.install(app)
+
+    # Sanitized request capture for commands/replay.py, if CAPTURE_ENABLED.
+    from settings import capture
+    capture.install(app)
+
+    # Build the database:
+    # This will create the database file using SQLAlchemy
+    if app.config.get('SQLALCHEMY_DATABASE_URI'):
+        database = get_db()
+        database.init_app(app)
+        with app.app_context():
+            database.create_all()
+
+    # Drain the account provisioning outbox in the background.
+    if app.config.get('ACCOUNT_PROVISIONING') == 'outbox':
+        from app.mod_auth.models import provisioning
+        provisioning.start_dispatcher(
+            interval=app.config.get('PROVISIONING_INTERVAL', 1.0),
+            batch_size=app.config.get('PROVISIONING_BATCH_SIZE', 50))
+
+    return app
+
+
+def get_app():
+    """
+    Returns:
+        (Flask): The default application, built on first call.
+    """
+    global _app
+
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+
+    return _app
+
+
+def _default_config():
+    """
+    Returns:
+        (Config): The 'config' module loaded into a Flask Config, for
+                  code that reads settings while no app is serving.
+    """
+    global _config
+
+    if _config is None:
+        from flask import Config
+
+        config = Config(os.path.dirname(os.path.abspath(__file__)))
+        config.from_object('config')
+        _config = config
+
+    return _config
+
+
+def get_db():
+    """
+    Returns:
+        (SQLAlchemy): The database object shared by all apps.
+    """
+    global _db
+
+    if _db is None:
+        # Import SQLAlchemy
+        from flask_sqlalchemy import SQLAlchemy
+        _db = SQLAlchemy()
+
+    return _db
+
+
+def __getattr__(name):
+    if name == 'app':
+        return get_app()
+    elif name == 'config':
+        # Prefer the app handling the current request, so apps made with
+        # create_app() see their own config. Outside of one, e.g. in
+        # background threads and tools, use the default app if it has
+        # been built, or just the config module.
+        from flask import current_app, has_app_context
+        if has_app_context():
+            return current_app.config
+        if _app is not None:
+            return _app.config
+        return _default_config()
+    elif name == 'db':
+        return get_db()
+
+    raise AttributeError("module 'app' has no attribute %r" % name)
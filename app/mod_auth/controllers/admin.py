@@ -0,0 +1,45 @@
+# Import flask dependencies
+from flask import Response
+from werkzeug.exceptions import NotFound
+
+from app.mod_auth.controllers.user import mod_auth
+
+from settings.request import admin_required, query_params
+
+# Import module models (i.e. export)
+import app.mod_auth.models.export as Export
+
+
+def _export_schema():
+    return {
+        "type": "object",
+        "properties": {
+            "gzip": {"type": "boolean"},
+        }
+    }
+
+
+@mod_auth.route('/admin/export/<table>', methods=['GET'])
+@admin_required
+@query_params(_export_schema())
+def export_table(table, query_params):
+    """
+    GET /admin/export/<table> - Stream identity, identity_role or device
+    rows as NDJSON. ?gzip=true compresses the stream.
+    """
+    if table not in Export.EXPORT_COLUMNS:
+        raise NotFound()
+
+    compress = query_params.get('gzip', False)
+
+    if compress:
+        mimetype = 'application/gzip'
+        file_name = table + '.ndjson.gz'
+    else:
+        mimetype = 'application/x-ndjson'
+        file_name = table + '.ndjson'
+
+    return Response(Export.export(table, compress=compress),
+                    mimetype=mimetype,
+                    headers={'Content-Disposition':
+                             'attachment; filename=' + file_name})
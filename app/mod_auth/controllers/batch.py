@@ -0,0 +1,164 @@
+# Import flask dependencies
+from flask import current_app, request
+from werkzeug.exceptions import BadRequest
+from werkzeug.test import EnvironBuilder
+
+from app.mod_auth.controllers.user import mod_auth
+
+import app
+from settings import codec, metrics, tracing
+from settings.request import json_body, get_token, VERIFIED_TOKEN_KEY
+from settings.response import json_response
+
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import threading
+
+# Only these run in parallel. Anything else runs on its own, in order,
+# after everything before it has finished.
+_parallel_methods = ('GET', 'HEAD')
+
+# Endpoints refused as sub-requests, checked after routing so encoded
+# paths like /%62atch are caught. Exports stream whole tables, which a
+# batch would have to hold in memory.
+_not_batchable = {
+    'auth.batch': 'Batches can not be nested.',
+    'auth.export_table': 'Exports can not be batched.',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _batch_schema():
+    return {
+        "type": "object",
+        "properties": {
+            "requests": {
+                "type": "array",
+                "minItems": 1,
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "method": {"type": "string",
+                                   "enum": ["GET", "HEAD", "POST", "PUT",
+                                            "PATCH", "DELETE"]},
+                        "path": {"type": "string", "pattern": "^/"},
+                        "body": {},
+                    },
+                    "required": ["path"]
+                }
+            }
+        },
+        "required": ["requests"]
+    }
+
+
+def _batch_executor():
+    # Separate from the call_many() pool, so a sub-request that fans out
+    # itself can't wait on threads held by its own batch.
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=app.config.get('BATCH_WORKERS', 8))
+
+    return _executor
+
+
+def _dispatch(flask_app, token, authorization, sub_request):
+    """
+    Runs one sub-request through the normal routing and error handling.
+    Bodies that are neither JSON nor UTF-8 text are returned base64
+    encoded, with 'encoding': 'base64'.
+    """
+    headers = {'Authorization': authorization}
+    data = None
+
+    if 'body' in sub_request:
+        headers['Content-Type'] = 'application/json'
+        data = codec.dumps(sub_request['body'])
+
+    builder = EnvironBuilder(path=sub_request['path'],
+                             method=sub_request.get('method', 'GET'),
+                             headers=headers,
+                             data=data)
+    environ = builder.get_environ()
+    environ[VERIFIED_TOKEN_KEY] = token
+
+    try:
+        with flask_app.request_context(environ):
+            refused = _not_batchable.get(request.endpoint)
+            if refused is not None:
+                return {'status': 400,
+                        'headers': {},
+                        'body': {'debug': 'Bad Request',
+                                 'message': refused}}
+
+            response = flask_app.full_dispatch_request()
+
+        result = {'status': response.status_code,
+                  'headers': dict(response.headers)}
+
+        body = response.get_data()
+        if body and response.mimetype == 'application/json':
+            body = codec.loads(body)
+        else:
+            try:
+                body = body.decode('utf-8') or None
+            except UnicodeDecodeError:
+                body = base64.b64encode(body).decode('ascii')
+                result['encoding'] = 'base64'
+    except Exception as e:  # Same as an unhandled error in a real request.
+        flask_app.logger.exception(e)
+        return {'status': 500, 'headers': {}, 'body': None}
+
+    result['body'] = body
+    return result
+
+
+@mod_auth.route('/batch', methods=['POST'])
+@json_body(_batch_schema())
+def batch(json):
+    """
+    POST /batch - Run several API calls in one HTTP request. The bearer
+    token is verified once for all of them. Consecutive GETs run in
+    parallel; every other call waits for the ones before it.
+    """
+    sub_requests = json['requests']
+
+    if len(sub_requests) > app.config.get('BATCH_MAX_REQUESTS', 20):
+        raise BadRequest('Too many requests in batch.')
+
+    token = get_token()
+    authorization = request.headers.get('Authorization')
+    flask_app = current_app._get_current_object()
+    executor = _batch_executor()
+
+    results = []
+    parallel = []
+
+    def flush():
+        # wrap() carries the batch request's span and metrics to the
+        # pool threads.
+        dispatch = metrics.wrap(tracing.wrap(_dispatch))
+        futures = [executor.submit(dispatch, flask_app, token,
+                                   authorization, sub_request)
+                   for sub_request in parallel]
+        results.extend(future.result() for future in futures)
+        del parallel[:]
+
+    for sub_request in sub_requests:
+        if sub_request.get('method', 'GET') in _parallel_methods:
+            parallel.append(sub_request)
+            continue
+
+        flush()
+        results.append(_dispatch(flask_app, token, authorization,
+                                 sub_request))
+
+    flush()
+
+    return json_response(data={'responses': results})
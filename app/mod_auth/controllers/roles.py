@@ -0,0 +1,61 @@
+# Import flask dependencies
+from werkzeug.exceptions import BadRequest
+
+from app.mod_auth.controllers.user import mod_auth
+
+from settings import pagination
+from settings.request import role_required, query_params, account_scope
+from settings.response import json_response, conditional
+
+# Import module models (i.e. Role)
+import app.mod_auth.models.roles as Role
+
+
+def _catalog_version(**kwargs):
+    return Role.catalog_version()
+
+
+@mod_auth.route('/roles', methods=['GET'])
+@role_required(['role_read'])
+@query_params(pagination.schema())
+@conditional(_catalog_version)
+def list_roles(query_params, account_id=None, provider_id=None):
+    """
+    GET /roles - List roles, one page at a time.
+    """
+    limit = pagination.page_size(query_params)
+    after = pagination.decode_cursor(query_params, int)
+
+    roles = Role.fetch_page(after, limit + 1)
+
+    return json_response(data=pagination.page(roles,
+                                              limit,
+                                              lambda role: role.role_id))
+
+
+@mod_auth.route('/identities/<identity_id>/roles', methods=['GET'])
+@role_required(['role_read'])
+@query_params(pagination.schema())
+def list_grants(identity_id, query_params,
+                account_id=None, provider_id=None):
+    """
+    GET /identities/<identity_id>/roles - List the roles granted to an
+    identity, per account, one page at a time. Callers other than admins
+    and the identity itself only see grants on their account.
+    """
+    scope = account_scope(account_id, identity_id)
+    limit = pagination.page_size(query_params)
+    after = pagination.decode_cursor(query_params, list)
+
+    if after is not None:
+        if not (len(after) == 2 and isinstance(after[0], str) and
+                type(after[1]) is int):
+            raise BadRequest('Invalid cursor.')
+        after = tuple(after)
+
+    grants = Role.fetch_grants_page(identity_id, scope, after, limit + 1)
+
+    return json_response(data=pagination.page(
+        grants,
+        limit,
+        lambda grant: [grant['account_id'], grant['role_id']]))
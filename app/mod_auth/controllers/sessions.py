@@ -0,0 +1,39 @@
+# Import flask dependencies
+from werkzeug.exceptions import NotFound
+
+from app.mod_auth.controllers.user import mod_auth
+
+from database.db import DBKeyDoesNotExistException
+from settings import pagination
+from settings.request import role_required, query_params, account_scope
+from settings.response import json_response
+
+# Import module models (i.e. sessions)
+import app.mod_auth.models.sessions as Session
+
+
+@mod_auth.route('/identities/<identity_id>/sessions', methods=['GET'])
+@role_required(['session_read'])
+@query_params(pagination.schema())
+def list_sessions(identity_id, query_params,
+                  account_id=None, provider_id=None):
+    """
+    GET /identities/<identity_id>/sessions - List an identity's sessions,
+    one page at a time. Sessions are shown by the first 16 characters
+    of their id, as full ids are live credentials. Callers other than
+    admins and the identity itself only see identities with a role on
+    their account.
+    """
+    scope = account_scope(account_id, identity_id)
+    limit = pagination.page_size(query_params)
+    after = pagination.decode_cursor(query_params, str)
+
+    try:
+        sessions = Session.fetch_page(identity_id, scope, after, limit + 1)
+    except DBKeyDoesNotExistException:
+        raise NotFound()
+
+    return json_response(data=pagination.page(
+        sessions,
+        limit,
+        lambda row: row['session_prefix']))
@@ -3,15 +3,21 @@ from flask import Blueprint, request, render_template, \
     flash, g, session, redirect, url_for, jsonify
 
 # Import password / encryption helper tools
-from werkzeug import check_password_hash, generate_password_hash
+from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.exceptions import NotFound
 
 # Import the database object from the main app module
 from database import db
-from settings.request import json_body
+from database.db import DBKeyDoesNotExistException
+from settings import pagination
+from settings.request import json_body, role_required, query_params, \
+    account_scope
+from settings.response import json_response, conditional
 
 
-# Import module models (i.e. User)
-import app.mod_auth.models.user_model as User
+# Import module models (i.e. User, Role)
+import app.mod_auth.models.user as User
+import app.mod_auth.models.roles as Role
 
 # Define the blueprint: 'auth', set its url prefix: app.url/auth
 mod_auth = Blueprint('auth', __name__)
@@ -37,6 +43,55 @@ def signup(json):
                          headers={'X-Session': identity.session_id})
 
 
+@mod_auth.route('/identities', methods=['GET'])
+@role_required(['id_read'])
+@query_params(pagination.schema())
+def list_identities(query_params, account_id=None, provider_id=None):
+    """
+    GET /identities - List identities, one page at a time. Only admins
+    see every identity; others see those with a role on their account.
+    """
+    scope = account_scope(account_id)
+    limit = pagination.page_size(query_params)
+    after = pagination.decode_cursor(query_params, str)
+
+    identities = User.fetch_page(scope, after, limit + 1)
+    result = pagination.page(identities,
+                             limit,
+                             lambda identity: identity.identity_id)
+
+    keys = ['identity_id', 'username', 'first_name', 'last_name', 'email',
+            'admin']
+    result['items'] = [identity.json_serialize(keys)
+                       for identity in result['items']]
+
+    return json_response(data=result)
+
+
+def _identity_version(identity_id, account_id=None, **kwargs):
+    return User.version(identity_id, account_scope(account_id, identity_id))
+
+
+@mod_auth.route('/identities/<identity_id>', methods=['GET'])
+@role_required(['id_read'])
+@conditional(_identity_version)
+def get_identity(identity_id, account_id=None, provider_id=None):
+    """
+    GET /identities/<identity_id> - Fetch an identity's profile. Callers
+    other than admins and the identity itself only see identities with a
+    role on their account.
+    """
+    scope = account_scope(account_id, identity_id)
+
+    try:
+        identity = User.fetch(identity_id, scope)
+    except DBKeyDoesNotExistException:
+        raise NotFound()
+
+    return json_response(data=identity.json_serialize(
+        ['identity_id', 'first_name', 'last_name', 'gender', 'invite_code']))
+
+
 @mod_auth.route('/', methods=['GET'])
 def index():
     return jsonify({'message': 'Hello, World!'})
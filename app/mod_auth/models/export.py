@@ -0,0 +1,71 @@
+"""
+NDJSON export of the identity, identity_role and device tables for
+analytics and migrations.
+"""
+
+from database import db as db
+from settings import codec
+
+import zlib
+
+# The columns exported per table. This is an allow-list on purpose: a
+# secret column added later (like password_hash, temp_password_hash,
+# reset_token or totp_secret today) stays out until someone adds it
+# here. push_token is left out too; it can be used to message a device.
+EXPORT_COLUMNS = {
+    'identity': ('identity_id', 'username', 'first_name', 'last_name',
+                 'email', 'phone_number', 'birth_date', 'gender',
+                 'invite_code', 'admin', 'totp_enabled', 'locked',
+                 'inserted', 'updated'),
+    'identity_role': ('identity_id', 'account_id', 'role_id',
+                      'inserted', 'updated'),
+    'device': ('device_id', 'identity_id', 'os', 'inserted', 'updated'),
+}
+
+# Lines are written out in chunks of about this many bytes.
+CHUNK_SIZE = 64 * 1024
+
+
+def export(table, compress=False):
+    """
+    Streams a table as NDJSON. Rows come from a server-side cursor, so
+    memory use stays flat whatever the table size.
+    Params:
+        table (string): One of EXPORT_COLUMNS.
+        compress (bool, optional): gzip the output. Defaults to False.
+    Returns:
+        (generator): Yields chunks of bytes.
+    Raises:
+        KeyError - The table can not be exported.
+        DBException - A database error occured.
+    """
+    columns = EXPORT_COLUMNS[table]
+    sql = 'SELECT %s FROM `%s`' % (
+        ', '.join('`%s`' % column for column in columns), table)
+
+    compressor = None
+    if compress:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    buffer = []
+    size = 0
+
+    for row in db.stream(sql, None):
+        line = codec.dumps(row) + b'\n'
+        buffer.append(line)
+        size += len(line)
+
+        if size >= CHUNK_SIZE:
+            chunk = b''.join(buffer)
+            buffer = []
+            size = 0
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(buffer)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
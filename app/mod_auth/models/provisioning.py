@@ -0,0 +1,159 @@
+"""
+Account provisioning outbox. With ACCOUNT_PROVISIONING = 'outbox', signup
+only queues the new identity (see user.create_identity). The dispatcher
+here creates the accounts in the background and assigns the user role.
+"""
+
+import app
+
+from database import db as db
+from database.db import DBQueryException
+from settings import metrics
+from settings import request as service_request
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_dispatcher = None
+
+
+def _jwt_for(identity_id):
+    jwt_dict = {
+        'idt': identity_id,
+        'adm': False,
+        'acc': '',
+        'pvd': '',
+        'rol': ['id_create']
+    }
+
+    with metrics.timer('jwt'):
+        encoded_jwt, token_valid_period = service_request.create_jwt(
+            jwt_dict)
+    return encoded_jwt
+
+
+def dispatch_batch(batch_size=50):
+    """
+    Claims a batch of pending provisioning records and creates their
+    accounts, concurrently. Failed records are retried later with
+    exponential backoff.
+    Params:
+        batch_size (int, optional): Records claimed at once.
+    Returns:
+        (int): The number of records claimed.
+    Raises:
+        DBException - A database error occured.
+    """
+    claim_token = db.identifier()
+
+    connection = db.connection()
+    rows = db.call(connection,
+                   'claim_provisioning_batch',
+                   [claim_token,
+                    batch_size,
+                    app.config.get('PROVISIONING_LEASE_SECONDS', 60)],
+                   many=True)
+    db.commit(connection)
+
+    if not rows:
+        return 0
+
+    # A token that can't be minted fails its record like a failed call,
+    # so the record is backed off instead of sitting out the lease.
+    calls = []
+    results = {}
+    for row in rows:
+        try:
+            calls.append((row, {'path': 'accounts',
+                                'jwt': _jwt_for(row['identity_id']),
+                                'method': 'POST',
+                                'data': {'name': row['username']}}))
+        except Exception as e:
+            results[row['outbox_id']] = service_request.CallResult(None, e)
+
+    for (row, call), result in zip(calls, service_request.call_many(
+            [call for row, call in calls],
+            timeout=app.config.get('PROVISIONING_TIMEOUT', 30))):
+        results[row['outbox_id']] = result
+
+    # One connection and commit per record: a failed db.call rolls back
+    # and closes its connection, which must not undo or block the
+    # records already settled, whose accounts exist by now.
+    for row in rows:
+        outbox_id = row['outbox_id']
+        result = results[outbox_id]
+
+        try:
+            if result.error is not None:
+                raise result.error
+            account_id = result.response['account_id']
+        except Exception as e:
+            logger.warning('Provisioning %s failed: %r', outbox_id, e)
+            _settle(outbox_id, 'fail_provisioning',
+                    [outbox_id, claim_token, repr(e)[:255]])
+            continue
+
+        _settle(outbox_id, 'complete_provisioning',
+                [outbox_id, claim_token, account_id])
+
+    return len(rows)
+
+
+def _settle(outbox_id, procedure, params):
+    """
+    Runs complete_provisioning or fail_provisioning for one record and
+    commits it. Errors are logged; the record is then claimed again once
+    its lease runs out.
+    """
+    connection = db.connection()
+
+    try:
+        db.call(connection, procedure, params)
+    except DBQueryException as e:
+        # The lease ran out and another dispatcher has the record, or
+        # there is no 'user' role.
+        logger.warning('Provisioning %s not settled by %s: %s',
+                       outbox_id, procedure, e.message)
+        return
+    except Exception:
+        logger.exception('Provisioning %s not settled by %s',
+                         outbox_id, procedure)
+        return
+
+    db.commit(connection)
+
+
+def run_dispatcher(interval=1.0, batch_size=50):
+    """
+    Drains the outbox forever. Sleeps for interval seconds whenever
+    there was nothing to do.
+    """
+    while True:
+        try:
+            claimed = dispatch_batch(batch_size)
+        except Exception:
+            logger.exception('Provisioning dispatch failed')
+            claimed = 0
+
+        if claimed < batch_size:
+            time.sleep(interval)
+
+
+def start_dispatcher(interval=1.0, batch_size=50):
+    """
+    Starts run_dispatcher() in a daemon thread, once per process.
+    """
+    global _dispatcher
+
+    if _dispatcher is None:
+        _dispatcher = threading.Thread(
+            target=run_dispatcher,
+            kwargs={'interval': interval, 'batch_size': batch_size},
+            name='provisioning-dispatcher',
+            daemon=True)
+        _dispatcher.start()
+
+    return _dispatcher
@@ -0,0 +1,161 @@
+import app
+
+from database import db as db
+from settings.base import Base
+
+import threading
+import time
+
+# The role catalog version is cached for ROLE_CATALOG_VERSION_TTL seconds
+# so conditional GETs for roles usually don't touch the database. Roles
+# are only changed in the database, not through this service, so a
+# change can go unnoticed for up to that long: a client may get a 304
+# for a catalog that changed less than ROLE_CATALOG_VERSION_TTL ago.
+_catalog_lock = threading.Lock()
+_catalog_version = None
+_catalog_checked = 0.0
+
+
+class Role(Base):
+
+    fields = ('role_id', 'name')
+
+    # New instance instantiation procedure
+    def __init__(self, dict):
+        self.role_id = dict.get('role_id')
+        self.name = dict.get('name')
+
+    def json_keys(self):
+        return ['role_id', 'name']
+
+
+def fetch_all():
+    """
+    Fetches every role.
+    Params:
+        None
+    Returns:
+        (array): Role objects ordered by role_id.
+    Raises:
+        DBException - A database error occured.
+    """
+    connection = db.connection()
+    columns, rows = db.call(connection,
+                            'fetch_all_roles',
+                            None,
+                            many=True,
+                            tuples=True)
+    db.close(connection)
+
+    return Role.from_rows(columns, rows)
+
+
+def fetch_page(after_role_id, limit):
+    """
+    Fetches one page of roles, ordered by role_id.
+    Params:
+        after_role_id (int): The last role_id of the previous page, or
+                             None for the first page.
+        limit (int): The number of roles to fetch.
+    Returns:
+        (array): Role objects.
+    Raises:
+        DBException - A database error occured.
+    """
+    connection = db.connection()
+    columns, rows = db.call(connection,
+                            'fetch_roles_page',
+                            [after_role_id, limit],
+                            many=True,
+                            tuples=True)
+    db.close(connection)
+
+    return Role.from_rows(columns, rows)
+
+
+def fetch_grants_page(identity_id, account_id, after, limit):
+    """
+    Fetches one page of the roles granted to an identity, ordered by
+    account_id and role_id.
+    Params:
+        identity_id (string): The identity whose grants to list.
+        account_id (string): Only list grants on this account. None
+                             lists grants on every account.
+        after (tuple): The (account_id, role_id) of the last grant on the
+                       previous page, or None for the first page.
+        limit (int): The number of grants to fetch.
+    Returns:
+        (array): Dictionaries with account_id, role_id, name and
+                 inserted.
+    Raises:
+        DBException - A database error occured.
+    """
+    after_account_id, after_role_id = after or (None, None)
+
+    connection = db.connection()
+    result = db.call(connection,
+                     'fetch_identity_grants_page',
+                     [identity_id, account_id, after_account_id,
+                      after_role_id, limit],
+                     many=True)
+    db.close(connection)
+
+    return list(result)
+
+
+def fetch_for_identity(identity_id):
+    """
+    Fetches the role names granted to an identity, per account.
+    Params:
+        identity_id (string): The identity whose roles to fetch.
+    Returns:
+        (array): Dictionaries with account_id and roles, a list of role
+                 names.
+    Raises:
+        DBException - A database error occured.
+    """
+    connection = db.connection()
+    result = db.call(connection,
+                     'fetch_identity_roles',
+                     [identity_id],
+                     many=True)
+    db.close(connection)
+
+    return [{'account_id': row['account_id'],
+             'roles': row['roles'].split(',') if row['roles'] else []}
+            for row in result]
+
+
+def catalog_version():
+    """
+    Returns a version token for the role catalog, as used for ETags.
+    Params:
+        None
+    Returns:
+        (string): Changes whenever a role is added, renamed or deleted.
+    Raises:
+        DBException - A database error occured.
+    """
+    global _catalog_version, _catalog_checked
+
+    ttl = app.config.get('ROLE_CATALOG_VERSION_TTL', 5)
+    now = time.monotonic()
+
+    with _catalog_lock:
+        if _catalog_version is not None and now - _catalog_checked < ttl:
+            return _catalog_version
+
+    connection = db.connection()
+    result = db.call(connection, 'fetch_role_catalog_version', None)
+    db.close(connection)
+
+    version = '%s-%s-%s' % (result['count'],
+                            result['updated'],
+                            result['checksum'])
+
+    with _catalog_lock:
+        _catalog_version = version
+        _catalog_checked = now
+
+    return version
+
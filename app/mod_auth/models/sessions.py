@@ -0,0 +1,91 @@
+from database import db as db
+from database.db import DBKeyDoesNotExistException, DBItemExpiredException
+
+from app.mod_auth.models.user import User
+
+
+def identity_from_session_id(session_id):
+    """
+    Creates an identity object from a session_id.
+    Params:
+        session_id (string): A unique session id as defined in the database.
+    Returns:
+        (identity): The identity the session belongs to.
+    Raises:
+        DBKeyDoesNotExistException - The session does not exist.
+        DBItemExpiredException - The session has expired.
+    """
+    connection = db.connection()
+    result = db.call(connection, 'identity_from_session', [session_id])
+    db.close(connection)
+
+    # The procedure no longer SIGNALs, so raise the same exceptions
+    # callers got from `check_if_session_is_valid`.
+    if result is None:
+        raise DBKeyDoesNotExistException(10001, 'session_id')
+
+    if result['expired']:
+        raise DBItemExpiredException(10003, 'session_id')
+
+    result['session_id'] = session_id
+    identity = User(result)
+    return identity
+
+
+def delete_expired(batch_size=1000):
+    """
+    Deletes expired sessions in batches. Session lookups leave expired
+    rows in place, so this is run periodically (the database event
+    `purge_expired_sessions` does the same thing on its own).
+    Params:
+        batch_size (int, optional): Rows deleted per statement.
+    Returns:
+        (int): The number of sessions deleted.
+    Raises:
+        DBException - A database error occured.
+    """
+    total = 0
+
+    while True:
+        connection = db.connection()
+        result = db.call(connection, 'delete_expired_sessions', [batch_size])
+        db.commit(connection)
+
+        deleted = result['deleted']
+        total += deleted
+
+        if deleted < batch_size:
+            break
+
+    return total
+
+
+def fetch_page(identity_id, account_id, after_session_prefix, limit):
+    """
+    Fetches one page of an identity's sessions, ordered by session_id.
+    Sessions are identified by a prefix of their id only; the full id
+    is a live credential.
+    Params:
+        identity_id (string): The identity whose sessions to list.
+        account_id (string): The identity must have a role on this
+                             account. None skips the check.
+        after_session_prefix (string): The last session_prefix of the
+                                       previous page, or None for the
+                                       first page.
+        limit (int): The number of sessions to fetch.
+    Returns:
+        (array): Dictionaries with session_prefix, active, expires and
+                 inserted.
+    Raises:
+        DBKeyDoesNotExistException - The identity has no role on the
+                                     account.
+        DBException - A database error occured.
+    """
+    connection = db.connection()
+    result = db.call(connection,
+                     'fetch_sessions_page',
+                     [identity_id, account_id, after_session_prefix, limit],
+                     many=True)
+    db.close(connection)
+
+    return list(result)
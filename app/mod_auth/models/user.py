@@ -1,6 +1,14 @@
+import app
+
+import bcrypt
+
 # Import the database object (db) from the main application module
 # We will define this inside /app/__init__.py in the next sections.
 from database import db as db
+from database.db import DBException, DBItemAlreadyExistsException, \
+    DBKeyDoesNotExistException
+from settings import metrics, tracing
+from settings.exceptions import AlreadyExists, AuthFailed
 from settings.base import Base
 
 # Define a base model for other database tables to inherit
@@ -11,6 +19,12 @@ from settings.base import Base
 
 class User(Base):
 
+    fields = ('identity_id', 'username', 'first_name', 'last_name', 'email',
+              'phone_number', 'birth_date', 'gender', 'invite_code',
+              'session_id', 'admin', 'temp_session', 'totp_secret')
+
+    defaults = {'admin': False, 'temp_session': False}
+
     # New instance instantiation procedure
     def __init__(self, dict):
         self.identity_id = dict.get('identity_id')
@@ -54,16 +68,90 @@ def schema(required_args=None):
     return schema
 
 
+def fetch(identity_id, account_id=None):
+    """
+    Fetches an identity's profile.
+    Params:
+        identity_id (string): The identity to fetch.
+        account_id (string, optional): Only fetch the identity if it has
+                                       a role on this account.
+    Returns:
+        (identity): An identity object.
+    Raises:
+        DBKeyDoesNotExistException - The identity does not exist, or has
+                                     no role on account_id.
+    """
+    connection = db.connection()
+    result = db.call(connection, 'fetch_identity', [identity_id, account_id])
+    db.close(connection)
+
+    result['identity_id'] = identity_id
+    return User(result)
+
+
+def fetch_page(account_id, after_identity_id, limit):
+    """
+    Fetches one page of identities, ordered by identity_id.
+    Params:
+        account_id (string): Only list identities with a role on this
+                             account. None lists every identity.
+        after_identity_id (string): The last identity_id of the previous
+                                    page, or None for the first page.
+        limit (int): The number of identities to fetch.
+    Returns:
+        (array): Identity objects.
+    Raises:
+        DBException - A database error occured.
+    """
+    connection = db.connection()
+    columns, rows = db.call(connection,
+                            'fetch_identities_page',
+                            [account_id, after_identity_id, limit],
+                            many=True,
+                            tuples=True)
+    db.close(connection)
+
+    return User.from_rows(columns, rows)
+
+
+def version(identity_id, account_id=None):
+    """
+    Returns a version token for an identity, as used for ETags.
+    Params:
+        identity_id (string): The identity.
+        account_id (string, optional): As for fetch().
+    Returns:
+        (string): The identity's `updated` timestamp and a checksum of
+                  its profile, or None if the identity does not exist
+                  or has no role on account_id.
+    Raises:
+        DBException - A database error occured.
+    """
+    connection = db.connection()
+    result = db.call(connection, 'fetch_identity_version',
+                     [identity_id, account_id])
+    db.close(connection)
+
+    if result is None:
+        return None
+
+    return '%s-%s' % (result['updated'], result['checksum'])
+
+
 def create_password_hash(password):
-    bcrypt = Bcrypt(app)
-    password_hash = bcrypt.generate_password_hash(password)
+    rounds = app.config['BCRYPT_LOG_ROUNDS']
+
+    with metrics.timer('bcrypt'), tracing.span('bcrypt.hash'):
+        password_hash = bcrypt.hashpw(password.encode('utf-8'),
+                                      bcrypt.gensalt(rounds))
 
-    return password_hash
+    return password_hash.decode('utf-8')
 
 
 def check_password(password, password_hash):
-    bcrypt = Bcrypt(app)
-    password_correct = bcrypt.check_password_hash(password_hash, password)
+    with metrics.timer('bcrypt'), tracing.span('bcrypt.check'):
+        password_correct = bcrypt.checkpw(password.encode('utf-8'),
+                                          password_hash.encode('utf-8'))
 
     return password_correct
 
@@ -79,18 +167,25 @@ def create_identity(username, password):
     Raises:
         AlreadyExists - The username is already assigned to an identity.
     """
-    from app.controllers.models import role
-    from zapi_service.controllers.request import create_jwt
+    from settings.request import create_jwt
 
-    bcrypt = Bcrypt(app)
-    password_hash = bcrypt.generate_password_hash(password)
+    password_hash = create_password_hash(password)
 
     identity_id = db.identifier()
 
+    # In outbox mode the identity and its pending provisioning record
+    # are committed together, and provisioning.dispatch_batch() creates
+    # the account and assigns the role later.
+    outbox = app.config.get('ACCOUNT_PROVISIONING') == 'outbox'
+    if outbox:
+        procedure = 'create_identity_with_provisioning'
+    else:
+        procedure = 'create_identity'
+
     try:
         connection = db.connection()
         db.call(connection,
-                'create_identity',
+                procedure,
                 [identity_id, username, password_hash])
     except DBItemAlreadyExistsException:
         raise AlreadyExists
@@ -100,6 +195,10 @@ def create_identity(username, password):
     # Turns out I have to commit here or db transaction times out.
 
     db.commit(connection)
+
+    if outbox:
+        identity = session.create(identity_id)
+        return identity
 ###########################################################
 # If we are testing, stop here. This is somewhat of a problem
 # because we're not testing account creation, but we don't
@@ -118,8 +217,12 @@ def create_identity(username, password):
         'rol': ['id_create']
     }
 
-    encoded_jwt, token_valid_period = create_jwt(jwt_dict)
+    with metrics.timer('jwt'):
+        encoded_jwt, token_valid_period = create_jwt(jwt_dict)
     data = {'name': username}
+
+    from app.controllers.models import role
+
     try:
         response = zapi.request.call('accounts',
                                      encoded_jwt,
@@ -284,8 +387,7 @@ def _verify_identity(username, password):
         # We don't want to abort here.
         pass  # We want to run the hash function to avoid timing attack.
 
-    bcrypt = Bcrypt(app)
-    did_pass = bcrypt.check_password_hash(password_hash, password)
+    did_pass = check_password(password, password_hash)
 
     if identity_exists:
         # If identity and password is correct,
@@ -298,8 +400,7 @@ def _verify_identity(username, password):
             # was created, let's update it with the new cost.
             if hash_cost != current_cost:
                 identity_id = result['identity_id']
-                bcrypt = Bcrypt(app)
-                password_hash = bcrypt.generate_password_hash(password)
+                password_hash = create_password_hash(password)
 
                 connection = db.connection()
                 db.call(connection,
@@ -332,8 +433,7 @@ def _check_temp_password(dict, password):
     temp_password_hash = dict['temp_password_hash']
 
     if temp_password_hash:
-        bcrypt = Bcrypt(app)
-        did_pass = bcrypt.check_password_hash(temp_password_hash, password)
+        did_pass = check_password(password, temp_password_hash)
 
         if did_pass:
             username = dict['username']
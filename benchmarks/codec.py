@@ -0,0 +1,77 @@
+"""
+Encoding throughput for the payload shapes our endpoints return: the
+old json.dumps(indent=2, default=lambda) path against settings.codec
+with each available backend.
+
+    python -m benchmarks.codec --iterations 5000
+"""
+
+import argparse
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from settings import codec
+from settings.base import Base
+from benchmarks import timing
+
+
+class Identity(Base):
+
+    def __init__(self, index):
+        self.identity_id = '%064x' % index
+        self.username = 'user%d' % index
+        self.first_name = 'First'
+        self.last_name = 'Last'
+        self.email = 'user%d@example.com' % index
+        self.admin = False
+        self.balance = Decimal('10.25')
+        self.updated = datetime(2018, 1, 1, 12, 30)
+
+    def json_keys(self):
+        return ['identity_id', 'username', 'first_name', 'last_name',
+                'email', 'admin', 'balance', 'updated']
+
+
+def payloads():
+    """
+    Returns (name, data) pairs modelled on real responses.
+    """
+    return [
+        ('error', {'debug': 'Bad Request',
+                   'message': "'username' is a required property"}),
+        ('identity roles', [{'account_id': '%064x' % i,
+                             'roles': 'user,admin,id_create'}
+                            for i in range(20)]),
+        ('role listing', [{'role_id': i, 'name': 'role%d' % i}
+                          for i in range(500)]),
+        ('identities', [Identity(i) for i in range(100)]),
+    ]
+
+
+def _old(data):
+    return lambda: json.dumps(data, indent=2,
+                              default=lambda o: o.json_serialize())
+
+
+def _new(data):
+    return lambda: codec.dumps(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    for name, data in payloads():
+        timing.report(name + ' / json indent (old)',
+                      timing.run(_old(data), args.iterations))
+
+        for backend in sorted(codec._backends):
+            codec.set_backend(backend)
+            timing.report(name + ' / codec ' + backend,
+                          timing.run(_new(data), args.iterations))
+
+
+if __name__ == '__main__':
+    main()
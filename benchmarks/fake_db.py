@@ -0,0 +1,201 @@
+"""
+An in-process stand-in for the MySQL database: just enough of the pymysql
+connection and cursor interface for database.db, backed by dictionaries
+that implement the stored procedures on the hot paths. Lets the
+benchmarks measure our code without a database round trip.
+
+    fake = FakeDatabase()
+    fake.install()
+"""
+
+from datetime import datetime, timedelta
+
+import pymysql.cursors
+
+from database import db
+
+
+class FakeDatabaseError(Exception):
+    """
+    Raised like a procedure SIGNAL: args are (code, message), which is
+    what db.raise_exception() expects.
+    """
+    pass
+
+
+class FakeCursor(object):
+
+    def __init__(self, database, tuples):
+        self.database = database
+        self.tuples = tuples
+        self.description = None
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def callproc(self, procedure, params=()):
+        if procedure not in self.database.procedures:
+            raise AssertionError(
+                'FakeDatabase does not implement procedure %r; add it to '
+                'FakeDatabase.procedures' % procedure)
+
+        columns, rows = self.database.procedures[procedure](*params)
+        self.description = tuple((column,) for column in columns)
+
+        if self.tuples:
+            self._rows = [tuple(row[column] for column in columns)
+                          for row in rows]
+        else:
+            self._rows = rows
+
+    def execute(self, sql, params=None):
+        # None of the benchmarked paths use raw SQL. A new one that does
+        # needs the statement added here, or a procedure instead.
+        raise AssertionError(
+            'FakeDatabase runs stored procedures only (%s); got raw SQL: %s'
+            % (', '.join(sorted(self.database.procedures)), sql))
+
+    def executemany(self, sql, rows):
+        self.execute(sql)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class FakeConnection(object):
+
+    def __init__(self, database):
+        self.database = database
+        self.open = True
+
+    def cursor(self, cursorclass=None):
+        return FakeCursor(self.database, cursorclass is pymysql.cursors.Cursor)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+IDENTITY_COLUMNS = ('identity_id', 'username', 'password_hash',
+                    'temp_password_hash', 'totp_secret', 'locked', 'admin',
+                    'first_name', 'last_name', 'email', 'updated')
+
+SESSION_COLUMNS = ('session_prefix', 'active', 'expires', 'inserted')
+
+
+class FakeDatabase(object):
+    """
+    Identities, their sessions and accounts, and the procedures that
+    read them.
+    """
+
+    def __init__(self):
+        self.identities = {}  # identity_id: row
+        self.usernames = {}   # username: identity_id
+        self.sessions = {}    # session_id: row
+        self.accounts = set()  # (identity_id, account_id) with a role
+        self.procedures = {
+            'fetch_identity_credentials': self.fetch_identity_credentials,
+            'update_identity_reset_auth_count': self._no_rows,
+            'update_identity_password_hash': self.update_password_hash,
+            'identity_from_session': self.identity_from_session,
+            'fetch_sessions_page': self.fetch_sessions_page,
+        }
+
+    def install(self):
+        """
+        Makes db.connection() hand out connections to this database.
+        """
+        db.connection = lambda: FakeConnection(self)
+
+    def add_identity(self, username, password_hash, admin=False):
+        identity_id = db.identifier()
+        now = datetime.utcnow()
+
+        self.identities[identity_id] = {
+            'identity_id': identity_id,
+            'username': username,
+            'password_hash': password_hash,
+            'temp_password_hash': None,
+            'totp_secret': None,
+            'locked': False,
+            'admin': admin,
+            'first_name': 'First',
+            'last_name': 'Last',
+            'email': username + '@example.com',
+            'updated': now,
+        }
+        self.usernames[username] = identity_id
+        return identity_id
+
+    def add_account(self, identity_id, account_id):
+        self.accounts.add((identity_id, account_id))
+
+    def add_session(self, identity_id, ttl=timedelta(days=1)):
+        session_id = db.identifier()
+        now = datetime.utcnow()
+
+        self.sessions[session_id] = {
+            'session_id': session_id,
+            'identity_id': identity_id,
+            'active': True,
+            'expires': now + ttl,
+            'inserted': now,
+        }
+        return session_id
+
+    def _no_rows(self, *params):
+        return (), []
+
+    def fetch_identity_credentials(self, username):
+        identity_id = self.usernames.get(username)
+
+        if identity_id is None:
+            raise FakeDatabaseError(10001, 'username')
+
+        return IDENTITY_COLUMNS, [dict(self.identities[identity_id])]
+
+    def update_password_hash(self, identity_id, password_hash):
+        self.identities[identity_id]['password_hash'] = password_hash
+        return (), []
+
+    def identity_from_session(self, session_id):
+        session = self.sessions.get(session_id)
+
+        if session is None:
+            return (), []
+
+        row = dict(self.identities[session['identity_id']])
+        row['expired'] = session['expires'] <= datetime.utcnow()
+        return IDENTITY_COLUMNS + ('expired',), [row]
+
+    def fetch_sessions_page(self, identity_id, account_id,
+                            after_session_prefix, limit):
+        if (account_id is not None and
+                (identity_id, account_id) not in self.accounts):
+            raise FakeDatabaseError(10001, 'identity_id')
+
+        rows = sorted(
+            (session for session in self.sessions.values()
+             if session['identity_id'] == identity_id and
+             (after_session_prefix is None or
+              session['session_id'][:16] > after_session_prefix)),
+            key=lambda session: session['session_id'])
+
+        return SESSION_COLUMNS, [{'session_prefix': row['session_id'][:16],
+                                  'active': row['active'],
+                                  'expires': row['expires'],
+                                  'inserted': row['inserted']}
+                                 for row in rows[:limit]]
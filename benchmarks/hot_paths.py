@@ -0,0 +1,171 @@
+"""
+Hot-path benchmarks: authenticate, identity_from_session_id, a
+role_required endpoint and json_response, run against the in-process
+database stand-in in benchmarks/fake_db.py, so no MySQL is needed.
+
+Results are compared with a stored baseline; a run that is slower by
+more than --tolerance exits with status 1.
+
+    python -m benchmarks.hot_paths --save-baseline   # on the old build
+    python -m benchmarks.hot_paths                   # on the new build
+
+bcrypt dominates authenticate at production cost, so it runs at
+--bcrypt-rounds (default 4) to keep the rest of the path visible.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+import bcrypt
+
+import app
+from app.mod_auth.models import sessions as Session
+from app.mod_auth.models import user as User
+from settings import test
+from settings.response import json_response
+from benchmarks import timing
+from benchmarks.fake_db import FakeDatabase
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+PASSWORD = 'correct horse battery staple'
+
+
+class Harness(object):
+    """
+    What the settings/test.py helpers expect of a test case.
+    """
+
+    def __init__(self, flask_app):
+        self.zapi_service_app = flask_app
+        self.app = flask_app.test_client()
+
+
+def _config(key_file, bcrypt_rounds):
+    import config
+
+    class BenchmarkConfig(object):
+        pass
+
+    for key in dir(config):
+        if key.isupper():
+            setattr(BenchmarkConfig, key, getattr(config, key))
+
+    BenchmarkConfig.DEBUG = False
+    BenchmarkConfig.TESTING = False
+    BenchmarkConfig.SQLALCHEMY_DATABASE_URI = None
+    BenchmarkConfig.ACCOUNT_PROVISIONING = 'sync'
+    BenchmarkConfig.BCRYPT_LOG_ROUNDS = bcrypt_rounds
+    BenchmarkConfig.JWT_SERVICE_ALGO = 'HS256'
+    BenchmarkConfig.JWT_SERVICE_KEY_FILE = key_file
+    BenchmarkConfig.JWT_SERVICE_TTL = 3600
+    return BenchmarkConfig
+
+
+def _key_file(directory):
+    # HS256 uses the same secret to sign (.private) and verify (.public).
+    key_file = os.path.join(directory, 'jwt')
+    secret = os.urandom(32).hex()
+
+    for suffix in ('.private', '.public'):
+        with open(key_file + suffix, 'w') as file:
+            file.write(secret)
+
+    return key_file
+
+
+def benchmarks(flask_app, fake, bcrypt_rounds):
+    """
+    Returns (name, function) pairs, each function making one call.
+    """
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'),
+                                  bcrypt.gensalt(bcrypt_rounds))
+    identity_id = fake.add_identity('bench', password_hash.decode('utf-8'))
+    fake.add_account(identity_id, test.global_account_id)
+    session_ids = [fake.add_session(identity_id) for _ in range(50)]
+
+    harness = Harness(flask_app)
+    token = test.create_authorization_token(
+        harness, {'account_id': test.global_account_id},
+        roles=['session_read'])
+    sessions_url = '/identities/%s/sessions?limit=20' % identity_id
+
+    identities = [User.User(row) for row in fake.identities.values()] * 100
+
+    def authenticate():
+        with flask_app.app_context():
+            User.authenticate('bench', PASSWORD)
+
+    def identity_from_session_id():
+        with flask_app.app_context():
+            Session.identity_from_session_id(random.choice(session_ids))
+
+    def role_required():
+        response = test.get(harness, sessions_url, jwt=token)
+        assert response.status_code == 200, response.status_code
+
+    def serialize():
+        with flask_app.test_request_context('/'):
+            json_response(data=identities)
+
+    return [
+        ('authenticate', authenticate),
+        ('identity_from_session_id', identity_from_session_id),
+        ('role_required GET sessions', role_required),
+        ('json_response 100 identities', serialize),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write the results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed slowdown, as a fraction.')
+    parser.add_argument('--only', action='append',
+                        help='Run only benchmarks whose name contains this.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        flask_app = app.create_app(
+            _config(_key_file(directory), args.bcrypt_rounds))
+
+        fake = FakeDatabase()
+        fake.install()
+
+        baseline = timing.load_baseline(args.baseline)
+        results = {}
+        regressed = False
+
+        for name, fn in benchmarks(flask_app, fake, args.bcrypt_rounds):
+            if args.only and not any(part in name for part in args.only):
+                continue
+
+            fn()  # Warm up caches and compiled validators/serializers.
+            result = timing.run(fn, args.iterations, threads=args.threads)
+            results[name] = result
+
+            if not args.save_baseline:
+                regressed |= timing.compare(name, result, baseline.get(name),
+                                            args.tolerance)
+            else:
+                timing.report(name, result)
+
+    if args.save_baseline:
+        baseline.update(results)
+        timing.save_baseline(args.baseline, baseline)
+        print('Baseline written to ' + args.baseline)
+
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Memory and serialization throughput for 100k User objects, comparing
+__slots__ models with a generated serializer against the __dict__ based
+path models used before.
+
+    python -m benchmarks.models --count 100000
+"""
+
+import argparse
+import time
+import tracemalloc
+from datetime import date
+
+from app.mod_auth.models.user import User
+from settings.base import Base
+
+KEYS = ['identity_id', 'username', 'first_name', 'last_name', 'email',
+        'birth_date', 'admin']
+
+
+class LegacyUser(Base):
+    """
+    User as it was: same constructor, no `fields`, so a __dict__ per
+    instance and the generic json_serialize() loop.
+    """
+    __init__ = User.__init__
+
+
+def _rows(count):
+    return [{'identity_id': '%064x' % i,
+             'username': 'user%d' % i,
+             'first_name': 'First',
+             'last_name': 'Last',
+             'email': 'user%d@example.com' % i,
+             'birth_date': date(1990, 1, 1)}
+            for i in range(count)]
+
+
+def _measure(cls, rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = [cls(row) for row in rows]
+    build = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for obj in objects:
+        obj.json_serialize(KEYS)
+    serialize = time.perf_counter() - start
+
+    count = len(rows)
+    print('{:<12} {:>8.1f} MB  build {:>10.0f} obj/s  serialize {:>10.0f} '
+          'obj/s'.format(cls.__name__, memory / 1024.0 / 1024.0,
+                         count / build, count / serialize))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    rows = _rows(args.count)
+    _measure(LegacyUser, rows)
+    _measure(User, rows)
+
+
+if __name__ == '__main__':
+    main()
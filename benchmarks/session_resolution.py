@@ -0,0 +1,102 @@
+"""
+Compares the old two-step session resolution (validity check, then a
+joined SELECT) with the single-read `identity_from_session` procedure.
+
+Needs a MySQL database with database/users_db.py loaded and the DB_*
+settings in config.
+
+    python -m benchmarks.session_resolution --threads 8 --iterations 500
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from database import db
+from benchmarks import timing
+
+LEGACY_SELECT = """
+SELECT
+  `identity`.`identity_id`,
+  `identity`.`username`,
+  `identity`.`admin`,
+  `identity`.`totp_secret`,
+  `session`.`expires`
+FROM
+  `session`
+INNER JOIN
+  `identity`
+ON
+  `identity`.`identity_id` = `session`.`identity_id`
+WHERE
+  `session`.`session_id` = %s
+LIMIT 1
+"""
+
+
+def _setup(session_count):
+    identity_id = db.identifier()
+    connection = db.connection()
+    db.call(connection,
+            'create_identity',
+            [identity_id, 'bench-' + identity_id[:16], None])
+
+    expires = datetime.utcnow() + timedelta(days=1)
+    session_ids = []
+    for _ in range(session_count):
+        session_id = db.identifier()
+        db.call(connection, 'create_session',
+                [session_id, identity_id, expires])
+        session_ids.append(session_id)
+
+    db.commit(connection)
+    return identity_id, session_ids
+
+
+def _teardown(identity_id):
+    db.write('DELETE FROM `identity` WHERE `identity_id` = %s',
+             (identity_id,))
+
+
+def _legacy(session_ids):
+    def resolve():
+        session_id = random.choice(session_ids)
+        connection = db.connection()
+        db.call(connection, 'check_if_session_is_valid', [session_id])
+        with connection.cursor() as cursor:
+            cursor.execute(LEGACY_SELECT, (session_id,))
+            cursor.fetchone()
+        db.close(connection)
+    return resolve
+
+
+def _single_read(session_ids):
+    def resolve():
+        session_id = random.choice(session_ids)
+        connection = db.connection()
+        db.call(connection, 'identity_from_session', [session_id])
+        db.close(connection)
+    return resolve
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--sessions', type=int, default=1000)
+    args = parser.parse_args()
+
+    identity_id, session_ids = _setup(args.sessions)
+    try:
+        for name, factory in (('check + join (old)', _legacy),
+                              ('identity_from_session (new)', _single_read)):
+            result = timing.run(factory(session_ids),
+                                args.iterations,
+                                threads=args.threads)
+            timing.report(name, result)
+    finally:
+        _teardown(identity_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Cold-start cost: wall time and peak RSS of a fresh interpreter that
+imports only `settings` versus one that builds the full app, plus an
+import-time profile (python -X importtime) of the slowest modules.
+
+    python -m benchmarks.startup --runs 10 --top 15
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks import timing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each scenario prints its peak RSS (KB on Linux) so the parent can read it.
+_REPORT_RSS = ('import resource; '
+               'print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)')
+
+SCENARIOS = [
+    ('interpreter', ''),
+    ('import settings', 'import settings.request, settings.response; '),
+    ('import app', 'import app; '),
+    ('create_app()', 'import app; app.create_app(); '),
+]
+
+
+def _run(code, *flags):
+    return subprocess.run([sys.executable] + list(flags) + ['-c', code],
+                          cwd=ROOT,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+
+def cold_start(code, runs):
+    """
+    Params:
+        code (string): Python source run in a fresh interpreter.
+        runs (int): Number of interpreters to start.
+
+    Returns:
+        (dictionary): p50/p95 wall time in milliseconds and the peak
+                      RSS in MB, or an 'error' if the code failed.
+    """
+    latencies = []
+    rss = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = _run(code + _REPORT_RSS)
+        latencies.append(time.perf_counter() - start)
+
+        if result.returncode:
+            return {'error': result.stderr.strip().splitlines()[-1]}
+
+        rss.append(int(result.stdout.split()[-1]) / 1024.0)
+
+    latencies.sort()
+    return {'p50': timing.percentile(latencies, 50) * 1000,
+            'p95': timing.percentile(latencies, 95) * 1000,
+            'rss': max(rss)}
+
+
+def import_profile(code, top):
+    """
+    Params:
+        code (string): Python source to profile.
+        top (int): Number of modules to return.
+
+    Returns:
+        (array): (cumulative microseconds, self microseconds, module)
+                 for the slowest imports, slowest first.
+    """
+    result = _run(code, '-X', 'importtime')
+    rows = []
+
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        own, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), int(own), name.rstrip()))
+
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    for name, code in SCENARIOS:
+        result = cold_start(code, args.runs)
+
+        if 'error' in result:
+            print('{:<20} failed: {}'.format(name, result['error']))
+            continue
+
+        print('{:<20} p50 {:>8.1f}ms  p95 {:>8.1f}ms  rss {:>6.1f}MB'.format(
+            name, result['p50'], result['p95'], result['rss']))
+
+    for name, code in SCENARIOS[1:]:
+        print('\nslowest imports: ' + name)
+        for cumulative, own, module in import_profile(code, args.top):
+            print('{:>10.1f}ms {:>10.1f}ms  {}'.format(
+                cumulative / 1000.0, own / 1000.0, module))
+
+
+if __name__ == '__main__':
+    main()
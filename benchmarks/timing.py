@@ -0,0 +1,136 @@
+"""
+timing module. Small helpers shared by the benchmark scripts.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+def percentile(samples, pct):
+    """
+    Params:
+        samples (array): Sorted latencies in seconds.
+        pct (float): The percentile to return, 0-100.
+
+    Returns:
+        (float): The latency at that percentile.
+    """
+    if not samples:
+        return 0.0
+
+    index = int(round((pct / 100.0) * (len(samples) - 1)))
+    return samples[index]
+
+
+def run(fn, iterations, threads=1):
+    """
+    Calls fn repeatedly, optionally from several threads at once.
+
+    Params:
+        fn (function): The function to measure. Called without arguments.
+        iterations (int): Calls per thread.
+        threads (int, optional): Number of concurrent threads. Defaults to 1.
+
+    Returns:
+        (dictionary): ops/sec and latency percentiles in milliseconds.
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'ops': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+    }
+
+
+def report(name, result):
+    """
+    Prints one result line as returned by run().
+    """
+    print('{:<40} {:>12.1f} ops/s  p50 {:>8.3f}ms  p95 {:>8.3f}ms  '
+          'p99 {:>8.3f}ms'.format(name, result['ops'], result['p50'],
+                                  result['p95'], result['p99']))
+
+
+def load_baseline(path):
+    """
+    Params:
+        path (string): A file written by save_baseline().
+
+    Returns:
+        (dictionary): Results of run() by benchmark name, empty if the
+                      file does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(path, results):
+    """
+    Params:
+        path (string): The file to write.
+        results (dictionary): Results of run() by benchmark name.
+    """
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def compare(name, result, baseline, tolerance=0.1):
+    """
+    Prints one result line with the change against its baseline.
+
+    Params:
+        name (string): The benchmark name.
+        result (dictionary): As returned by run().
+        baseline (dictionary): The baseline result, or None.
+        tolerance (float, optional): Fraction by which ops/sec may drop,
+                                     or p99 may grow, before the result
+                                     counts as a regression.
+
+    Returns:
+        (bool): True if the result regressed.
+    """
+    report(name, result)
+
+    if not baseline:
+        return False
+
+    ops = _change(result['ops'], baseline['ops'])
+    p99 = _change(result['p99'], baseline['p99'])
+    regressed = ops < -tolerance or p99 > tolerance
+
+    print('{:<40} {:>+11.1%} ops/s  p99 {:>+8.1%}{}'.format(
+        '  vs baseline', ops, p99, '  REGRESSION' if regressed else ''))
+
+    return regressed
+
+
+def _change(new, old):
+    return (new - old) / old if old else 0.0
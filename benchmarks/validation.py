@@ -0,0 +1,44 @@
+"""
+Validations per second for jsonschema.validate() against the compiled,
+cached validators used by json_body and query_params.
+
+    python -m benchmarks.validation --iterations 20000
+"""
+
+import argparse
+
+import jsonschema
+
+from app.mod_auth.models.user import schema
+from settings.request import _validator
+from benchmarks import timing
+
+PAYLOAD = {
+    'username': 'someone',
+    'password': 'correct horse battery staple',
+    'first_name': 'Some',
+    'last_name': 'One',
+    'email': 'someone@example.com',
+    'birth_date': '1990-01-01',
+    'gender': 'x',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    user_schema = schema(['username', 'password'])
+    validator = _validator(user_schema)
+
+    timing.report('jsonschema.validate (old)',
+                  timing.run(lambda: jsonschema.validate(PAYLOAD, user_schema),
+                             args.iterations))
+    timing.report('cached validator (new)',
+                  timing.run(lambda: validator.validate(PAYLOAD),
+                             args.iterations))
+
+
+if __name__ == '__main__':
+    main()
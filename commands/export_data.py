@@ -0,0 +1,38 @@
+"""
+Exports the identity, identity_role or device table as NDJSON. Secret
+columns are never included, see app/mod_auth/models/export.py.
+
+    python -m commands.export_data identity -o identity.ndjson.gz --gzip
+"""
+
+import argparse
+import sys
+
+from app.mod_auth.models import export
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('table', choices=sorted(export.EXPORT_COLUMNS))
+    parser.add_argument('-o', '--output',
+                        help='Output file. Defaults to stdout.')
+    parser.add_argument('--gzip', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.output:
+        output = open(args.output, 'wb')
+    else:
+        output = sys.stdout.buffer
+
+    try:
+        for chunk in export.export(args.table, compress=args.gzip):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""
+Bulk identity import.
+
+Reads a CSV (with a header row) or NDJSON file of identities, hashes the
+passwords on every core, and inserts identities and their 'user' role
+grants in chunked multi-row batches. Each committed chunk is recorded in
+a checkpoint file, so running the same command again after an
+interruption continues where it stopped.
+
+Usernames that already exist, or repeat within a chunk, are skipped
+(the first one wins) and listed at the end.
+
+Recognised fields: username, password (required), first_name,
+last_name, email, account_id (adds the 'user' role on that account).
+
+    python -m commands.import_identities identities.csv --chunk-size 1000
+"""
+
+import app
+
+from database import db
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+INSERT_IDENTITY = (
+    'INSERT INTO `identity` '
+    '(`identity_id`, `username`, `password_hash`, '
+    '`first_name`, `last_name`, `email`) '
+    'VALUES (%s, %s, %s, %s, %s, %s) '
+    # A username taken since _existing() looked is left alone rather
+    # than failing the whole chunk; _insert() notices and retries.
+    'ON DUPLICATE KEY UPDATE `identity_id` = `identity_id`')
+
+SELECT_USERNAMES = 'SELECT `username` FROM `identity` WHERE `username` IN %s'
+
+INSERT_GRANT = (
+    'INSERT INTO `identity_role` '
+    '(`identity_id`, `account_id`, `role_id`) '
+    'VALUES (%s, %s, %s)')
+
+
+def _hash_passwords(passwords, rounds):
+    """
+    Runs in a worker process.
+    """
+    import bcrypt
+
+    return [bcrypt.hashpw(password.encode('utf-8'),
+                          bcrypt.gensalt(rounds)).decode('utf-8')
+            for password in passwords]
+
+
+def read_records(file_name):
+    """
+    Yields one dictionary per identity, without reading the whole file.
+    """
+    with open(file_name, 'r', encoding='utf-8', newline='') as file:
+        if file_name.endswith(('.ndjson', '.jsonl')):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            for row in csv.DictReader(file):
+                yield row
+
+
+def _chunks(records, size):
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _load_checkpoint(checkpoint):
+    if not os.path.exists(checkpoint):
+        return 0
+
+    with open(checkpoint, 'r') as file:
+        return json.load(file)['done']
+
+
+def _save_checkpoint(checkpoint, done):
+    # Write then rename, so a crash never leaves a half-written file.
+    temp_name = checkpoint + '.tmp'
+    with open(temp_name, 'w') as file:
+        json.dump({'done': done}, file)
+    os.replace(temp_name, checkpoint)
+
+
+def _submit(executor, chunk, workers, rounds):
+    """
+    Splits a chunk's passwords over the worker processes.
+    """
+    passwords = [record['password'] for record in chunk]
+    size = -(-len(passwords) // workers)  # Ceiling division.
+    return [executor.submit(_hash_passwords, passwords[i:i + size], rounds)
+            for i in range(0, len(passwords), size)]
+
+
+def _existing(usernames):
+    rows = db.read(SELECT_USERNAMES, [usernames], many=True)
+    return {row['username'].lower() for row in rows}
+
+
+def _insert(chunk, password_hashes, role_id):
+    """
+    Inserts a chunk's new identities and their grants.
+
+    Returns:
+        (array): The usernames skipped because they were already taken.
+    """
+    while True:
+        taken = _existing([record['username'] for record in chunk])
+        identities = []
+        grants = []
+        skipped = []
+
+        for record, password_hash in zip(chunk, password_hashes):
+            # Usernames compare case-insensitively, like the unique key.
+            username = record['username'].lower()
+            if username in taken:
+                skipped.append(record['username'])
+                continue
+            taken.add(username)
+
+            identity_id = db.identifier()
+            identities.append((identity_id,
+                               record['username'],
+                               password_hash,
+                               record.get('first_name') or None,
+                               record.get('last_name') or None,
+                               record.get('email') or None))
+
+            if record.get('account_id'):
+                grants.append((identity_id, record['account_id'], role_id))
+
+        if not identities:
+            return skipped
+
+        # Identities and grants of a chunk are committed together, so the
+        # checkpoint never points into the middle of a chunk.
+        connection = db.connection()
+        inserted = db.execute_many(connection, INSERT_IDENTITY, identities)
+
+        if inserted == len(identities):
+            break
+
+        # A username was taken between _existing() and the insert, and
+        # its grant would point at an identity that isn't there. Start
+        # the chunk over.
+        connection.rollback()
+        db.close(connection)
+
+    if grants:
+        db.execute_many(connection, INSERT_GRANT, grants)
+    db.commit(connection)
+
+    return skipped
+
+
+def run(file_name, checkpoint, chunk_size, workers, rounds):
+    done = _load_checkpoint(checkpoint)
+
+    connection = db.connection()
+    role_id = db.call(connection, 'role_for_user', None)['role_id']
+    db.close(connection)
+
+    records = read_records(file_name)
+    skipped = sum(1 for _ in itertools.islice(records, done))
+    if skipped:
+        print('Resuming after %d identities.' % skipped)
+
+    imported = 0
+    skipped = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Hash the next chunk while the current one is being inserted.
+        pending = deque()
+        chunks = _chunks(records, chunk_size)
+
+        for chunk in itertools.islice(chunks, 2):
+            pending.append((chunk, _submit(executor, chunk, workers, rounds)))
+
+        while pending:
+            chunk, futures = pending.popleft()
+            password_hashes = [password_hash
+                               for future in futures
+                               for password_hash in future.result()]
+
+            next_chunk = next(chunks, None)
+            if next_chunk is not None:
+                pending.append((next_chunk,
+                                _submit(executor, next_chunk, workers, rounds)))
+
+            chunk_skipped = _insert(chunk, password_hashes, role_id)
+            skipped.extend(chunk_skipped)
+
+            done += len(chunk)
+            imported += len(chunk) - len(chunk_skipped)
+            _save_checkpoint(checkpoint, done)
+
+            elapsed = time.perf_counter() - start
+            print('%d imported, %d skipped (%d total), %.1f identities/s'
+                  % (imported, len(skipped), done, imported / elapsed))
+
+    elapsed = time.perf_counter() - start
+    print('Done: %d identities in %.1fs, %.1f identities/s'
+          % (imported, elapsed, imported / elapsed if elapsed else 0.0))
+
+    if skipped:
+        print('Skipped %d existing or repeated usernames:' % len(skipped))
+        for username in skipped:
+            print('  ' + username)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', help='CSV or NDJSON (.ndjson/.jsonl) file')
+    parser.add_argument('--checkpoint',
+                        help='Progress file. Defaults to <file>.checkpoint')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--rounds', type=int,
+                        help='bcrypt cost. Defaults to BCRYPT_LOG_ROUNDS.')
+    args = parser.parse_args(argv)
+
+    run(args.file,
+        args.checkpoint or args.file + '.checkpoint',
+        args.chunk_size,
+        args.workers,
+        args.rounds or app.config.get('BCRYPT_LOG_ROUNDS', 12))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,413 @@
+"""
+Load generator. Replays a weighted mix of scenarios against a running
+instance (--url) or an in-process app through Flask's test client, and
+reports throughput, error rate and p50/p95/p99/p99.9 latency.
+
+Closed loop: --concurrency workers each send a request as soon as the
+previous one returns. Open loop: requests arrive at --rate per second
+(Poisson) whatever the response times; latency is measured from the
+scheduled arrival, so queueing shows up instead of being hidden.
+Giving several comma separated levels runs each in turn, which is how
+to find the saturation point.
+
+    python -m commands.loadtest --url http://127.0.0.1:8080 \\
+        --concurrency 1,4,16,64 --duration 30
+    python -m commands.loadtest --in-process --rate 50,100,200 \\
+        --scenario roles=5 --scenario signup=1
+
+Scenarios use the post()/get() helpers and create_authorization_token()
+from settings/test.py, so tokens are signed with JWT_SERVICE_KEY_FILE
+from config.py; --jwt-key-file and --jwt-algo override it to match a
+remote instance. Authenticated reads carry a service JWT. There is no
+login route in this service yet; the login scenario posts to
+--login-path and is off unless weighted.
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from settings import test
+from benchmarks.timing import percentile
+
+# run(target, context) makes one request and returns the response.
+Scenario = namedtuple('Scenario', ['name', 'weight', 'run', 'expected'])
+
+DEFAULT_WEIGHTS = {'roles': 5, 'identities': 4, 'signup': 1, 'login': 0}
+
+_usernames = itertools.count()
+
+
+class HttpClient(object):
+    """
+    The part of Flask's test client the settings/test.py helpers use,
+    over real HTTP with a pooled keep-alive session.
+    """
+
+    def __init__(self, base_url, pool_size, timeout):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount(self.base_url, HTTPAdapter(pool_connections=1,
+                                                      pool_maxsize=pool_size))
+
+    def open(self, url, method='GET', data=None, headers=None):
+        return self.session.request(method, self.base_url + url,
+                                    data=data,
+                                    headers=headers,
+                                    timeout=self.timeout)
+
+    def get(self, url, **kwargs):
+        return self.open(url, method='GET', **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.open(url, method='POST', **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.open(url, method='PUT', **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.open(url, method='PATCH', **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.open(url, method='DELETE', **kwargs)
+
+
+class ConfigOnly(object):
+    """
+    Stands in for the Flask app when only its config is needed, i.e.
+    for create_authorization_token() against a remote instance.
+    """
+
+    def __init__(self):
+        from flask import Config
+
+        self.config = Config(os.getcwd())
+        self.config.from_object('config')
+
+
+def add_jwt_arguments(parser):
+    """
+    Adds --jwt-key-file and --jwt-algo, see apply_jwt_arguments().
+    """
+    parser.add_argument('--jwt-key-file',
+                        help='Key file prefix for signing tokens; the '
+                             'private key is read from <prefix>.private. '
+                             'Defaults to JWT_SERVICE_KEY_FILE.')
+    parser.add_argument('--jwt-algo',
+                        help='Signing algorithm, e.g. RS256 or HS256. '
+                             'Defaults to JWT_SERVICE_ALGO.')
+
+
+def apply_jwt_arguments(config, args):
+    """
+    Overrides the JWT settings in `config` with those given on the
+    command line.
+    """
+    if args.jwt_key_file:
+        config['JWT_SERVICE_KEY_FILE'] = args.jwt_key_file
+    if args.jwt_algo:
+        config['JWT_SERVICE_ALGO'] = args.jwt_algo
+
+
+class Target(object):
+    """
+    What the settings/test.py helpers expect of a test case: `app` to
+    send requests with and `zapi_service_app` for the JWT settings.
+    """
+
+    def __init__(self, client, service_app):
+        self.app = client
+        self.zapi_service_app = service_app
+
+
+def _username():
+    return 'load-%d-%d' % (os.getpid(), next(_usernames))
+
+
+def scenarios(weights, login_path, password):
+    """
+    Params:
+        weights (dictionary): Relative weight per scenario name.
+        login_path (string): The path the login scenario posts to.
+        password (string): Password for identities made by signup.
+
+    Returns:
+        (array): The Scenarios with a weight above zero.
+    """
+    def roles(target, context):
+        return test.get(target, '/roles', jwt=context['role_read'])
+
+    def identities(target, context):
+        return test.get(target, '/identities?limit=20',
+                        jwt=context['id_read'])
+
+    def signup(target, context):
+        return test.post(target, '/signup',
+                         {'username': _username(), 'password': password})
+
+    def login(target, context):
+        return test.post(target, login_path, context['credentials'])
+
+    available = [
+        Scenario('roles', 0, roles, (200, 304)),
+        Scenario('identities', 0, identities, (200,)),
+        Scenario('signup', 0, signup, (201,)),
+        Scenario('login', 0, login, (200, 201)),
+    ]
+
+    return [scenario._replace(weight=weights[scenario.name])
+            for scenario in available
+            if weights.get(scenario.name, 0) > 0]
+
+
+def _context(target, password, need_login):
+    context = {
+        'role_read': test.create_authorization_token(target, {},
+                                                     roles=['role_read']),
+        # Listing every identity takes an admin token.
+        'id_read': test.create_authorization_token(target, {},
+                                                   roles=['id_read'],
+                                                   admin=True),
+    }
+
+    if need_login:
+        username = _username()
+        test.post(target, '/signup',
+                  {'username': username, 'password': password})
+        context['credentials'] = {'username': username,
+                                  'password': password}
+
+    return context
+
+
+def _attempt(scenario, target, context):
+    try:
+        response = scenario.run(target, context)
+        return response.status_code in scenario.expected
+    except Exception:
+        return False
+
+
+def _picker(chosen):
+    weights = list(itertools.accumulate(scenario.weight
+                                        for scenario in chosen))
+
+    def pick(rng):
+        return rng.choices(chosen, cum_weights=weights)[0]
+
+    return pick
+
+
+def closed_loop(make_target, chosen, context, concurrency, duration):
+    """
+    Runs `concurrency` workers back to back for `duration` seconds.
+
+    Returns:
+        (tuple): (samples, elapsed seconds). Each sample is
+                 (scenario name, latency in seconds, ok).
+    """
+    pick = _picker(chosen)
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        target = make_target()
+        rng = random.Random()
+        local = []
+
+        while time.monotonic() < deadline:
+            scenario = pick(rng)
+            start = time.perf_counter()
+            ok = _attempt(scenario, target, context)
+            local.append((scenario.name, time.perf_counter() - start, ok))
+
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    return samples, time.perf_counter() - start
+
+
+def open_loop(make_target, chosen, context, rate, duration, concurrency):
+    """
+    Starts requests at `rate` per second (exponential inter-arrival
+    times) for `duration` seconds, on at most `concurrency` threads.
+
+    Returns:
+        (tuple): (samples, elapsed seconds), as closed_loop().
+    """
+    pick = _picker(chosen)
+    samples = []
+    lock = threading.Lock()
+    local = threading.local()
+    rng = random.Random()
+
+    def run_one(scenario, scheduled):
+        target = getattr(local, 'target', None)
+        if target is None:
+            target = local.target = make_target()
+
+        ok = _attempt(scenario, target, context)
+        # From the scheduled arrival: time spent waiting for a free
+        # thread counts, as it would for a real client.
+        latency = time.perf_counter() - scheduled
+
+        with lock:
+            samples.append((scenario.name, latency, ok))
+
+    start = time.perf_counter()
+    arrival = start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while arrival < start + duration:
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            executor.submit(run_one, pick(rng), arrival)
+            arrival += rng.expovariate(rate)
+
+    return samples, time.perf_counter() - start
+
+
+def report(title, samples, elapsed):
+    """
+    Prints throughput, errors and latency percentiles per scenario and
+    for all requests.
+    """
+    print(title)
+    print('  {:<12} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'scenario', 'requests', 'errors', 'req/s',
+        'p50 ms', 'p95 ms', 'p99 ms', 'p99.9 ms'))
+
+    by_name = {}
+    for name, latency, ok in samples:
+        by_name.setdefault(name, []).append((latency, ok))
+    by_name['all'] = [(latency, ok) for name, latency, ok in samples]
+
+    for name in sorted(by_name, key=lambda name: (name == 'all', name)):
+        rows = by_name[name]
+        latencies = sorted(latency for latency, ok in rows)
+        errors = sum(1 for latency, ok in rows if not ok)
+
+        print('  {:<12} {:>8} {:>6.1%} {:>9.1f} {:>9.2f} {:>9.2f} '
+              '{:>9.2f} {:>9.2f}'.format(
+                  name, len(rows), errors / len(rows) if rows else 0.0,
+                  len(rows) / elapsed if elapsed else 0.0,
+                  percentile(latencies, 50) * 1000,
+                  percentile(latencies, 95) * 1000,
+                  percentile(latencies, 99) * 1000,
+                  percentile(latencies, 99.9) * 1000))
+
+
+def _levels(value):
+    return [float(level) for level in value.split(',')] if value else []
+
+
+def _weights(pairs):
+    weights = dict(DEFAULT_WEIGHTS)
+
+    if pairs:
+        weights = dict.fromkeys(weights, 0)
+        for pair in pairs:
+            name, _, weight = pair.partition('=')
+            if name not in weights:
+                raise SystemExit('Unknown scenario: ' + name)
+            weights[name] = float(weight or 1)
+
+    return weights
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    target_group = parser.add_mutually_exclusive_group(required=True)
+    target_group.add_argument('--url', help='Base URL of a running instance.')
+    target_group.add_argument('--in-process', action='store_true',
+                              help="Use the app through Flask's test client.")
+    parser.add_argument('--concurrency', default='8',
+                        help='Closed-loop workers, or open-loop thread '
+                             'limit. Comma separate to step through levels.')
+    parser.add_argument('--rate',
+                        help='Open-loop arrivals per second. Comma separate '
+                             'to step through levels.')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=2,
+                        help='Seconds to run before each measured level.')
+    parser.add_argument('--scenario', action='append',
+                        help='name=weight. Scenarios: ' +
+                             ', '.join(sorted(DEFAULT_WEIGHTS)))
+    parser.add_argument('--login-path', default='/sessions')
+    parser.add_argument('--password', default='load-test-password')
+    parser.add_argument('--timeout', type=float, default=30)
+    add_jwt_arguments(parser)
+    args = parser.parse_args(argv)
+
+    concurrency_levels = [int(level) for level in _levels(args.concurrency)]
+    rates = _levels(args.rate)
+    chosen = scenarios(_weights(args.scenario), args.login_path,
+                       args.password)
+
+    if not chosen:
+        raise SystemExit('No scenarios with a weight above zero.')
+
+    if args.in_process:
+        import app
+
+        service_app = app.get_app()
+
+        def make_target():
+            return Target(service_app.test_client(), service_app)
+    else:
+        service_app = ConfigOnly()
+        client = HttpClient(args.url, max(concurrency_levels), args.timeout)
+
+        def make_target():
+            return Target(client, service_app)
+
+    apply_jwt_arguments(service_app.config, args)
+
+    context = _context(make_target(), args.password,
+                       any(scenario.name == 'login' for scenario in chosen))
+
+    if rates:
+        threads = max(concurrency_levels)
+        for rate in rates:
+            if args.warmup:
+                open_loop(make_target, chosen, context, rate, args.warmup,
+                          threads)
+            samples, elapsed = open_loop(make_target, chosen, context, rate,
+                                         args.duration, threads)
+            report('open loop, %.1f req/s offered, %d threads'
+                   % (rate, threads), samples, elapsed)
+    else:
+        for concurrency in concurrency_levels:
+            if args.warmup:
+                closed_loop(make_target, chosen, context, concurrency,
+                            args.warmup)
+            samples, elapsed = closed_loop(make_target, chosen, context,
+                                           concurrency, args.duration)
+            report('closed loop, %d workers' % concurrency, samples, elapsed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
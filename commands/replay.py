@@ -0,0 +1,334 @@
+"""
+Replays traffic recorded by settings/capture.py and compares latency
+per route between builds.
+
+    # Re-issue a capture at its original pace (or --speed times faster)
+    # and record what happened.
+    python -m commands.replay run capture.ndjson --url http://old:8080 \\
+        -o old.ndjson
+    python -m commands.replay run capture.ndjson --url http://new:8080 \\
+        -o new.ndjson
+
+    # Compare two runs route by route.
+    python -m commands.replay diff old.ndjson new.ndjson
+
+Replays are deterministic: requests go out in captured order at the
+same relative times, and body placeholders are filled from a seeded
+generator (--seed). Query parameters whose values were not captured
+(see CAPTURE_QUERY_KEEP) are left out: a made-up paging cursor would
+only be rejected. Tokens are minted with create_authorization_token()
+from settings/test.py with the captured claims, signed as set by
+--jwt-key-file and --jwt-algo (see commands/loadtest.py).
+
+Only runs can be diffed: a capture's durations are measured inside the
+service, a run's include the network and the client, so comparing one
+with the other would flag every route.
+"""
+
+import argparse
+import json
+import random
+import string
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from settings import test
+from benchmarks.timing import percentile
+from commands.loadtest import ConfigOnly, HttpClient, Target, \
+    add_jwt_arguments, apply_jwt_arguments
+
+# Set by the client or meaningless on another host.
+SKIP_HEADERS = frozenset(['host', 'content-length', 'connection'])
+
+
+def load(path):
+    """
+    Params:
+        path (string): A capture or replay NDJSON file.
+
+    Returns:
+        (array): The records, oldest first.
+    """
+    with open(path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+
+    records.sort(key=lambda record: record.get('timestamp', 0))
+    return records
+
+
+def fill(shape, rng):
+    """
+    Turns a body shape from settings.capture.shape() back into a body,
+    with generated values of the recorded types and lengths.
+    """
+    if isinstance(shape, dict):
+        return {key: fill(item, rng) for key, item in shape.items()}
+    elif isinstance(shape, list):
+        return [fill(item, rng) for item in shape]
+    elif shape == '<int>':
+        return rng.randint(0, 1000)
+    elif shape == '<float>':
+        return rng.random()
+    elif isinstance(shape, str) and shape.startswith('<str:'):
+        length = int(shape[len('<str:'):-1])
+        return ''.join(rng.choice(string.ascii_lowercase)
+                       for _ in range(length))
+
+    return shape
+
+
+def _captured_query(query):
+    pairs = urllib.parse.parse_qsl(query or '', keep_blank_values=True)
+    return urllib.parse.urlencode(
+        [(key, value) for key, value in pairs
+         if not (value.startswith('<') and value.endswith('>'))])
+
+
+class Replayer(object):
+    """
+    Sends captured requests to a target, minting one token per distinct
+    set of captured claims.
+    """
+
+    def __init__(self, make_target, seed):
+        self.make_target = make_target
+        self.rng = random.Random(seed)
+        self.tokens = {}
+        self.local = threading.local()
+
+    def prepare(self, record):
+        """
+        Builds (method, url, data, headers) for a record. Runs on the
+        scheduling thread, in order, so generated bodies don't depend
+        on thread timing.
+        """
+        headers = {name: value
+                   for name, value in record.get('headers', {}).items()
+                   if name.lower() not in SKIP_HEADERS}
+
+        auth = record.get('auth')
+        if auth is not None:
+            key = (auth.get('idt'), auth.get('acc'), auth.get('pvd'),
+                   tuple(auth['rol']), auth['adm'])
+            token = self.tokens.get(key)
+
+            if token is None:
+                token = test.create_authorization_token(
+                    self.make_target(),
+                    {'identity_id': auth.get('idt'),
+                     'account_id': auth.get('acc'),
+                     'provider_id': auth.get('pvd')},
+                    roles=list(auth['rol']), admin=auth['adm'])
+                self.tokens[key] = token
+
+            headers['Authorization'] = 'Bearer ' + token
+
+        data = None
+        if record.get('body') is not None:
+            data = json.dumps(fill(record['body'], self.rng))
+
+        url = record['path']
+        query = _captured_query(record.get('query'))
+        if query:
+            url += '?' + query
+
+        return record['method'], url, data, headers
+
+    def send(self, record, prepared):
+        """
+        Returns:
+            (dictionary): The replay result for the record.
+        """
+        target = getattr(self.local, 'target', None)
+        if target is None:
+            target = self.local.target = self.make_target()
+
+        method, url, data, headers = prepared
+
+        start = time.perf_counter()
+        try:
+            status = target.app.open(url, method=method, data=data,
+                                     headers=headers).status_code
+        except Exception as e:
+            status = type(e).__name__
+        duration = time.perf_counter() - start
+
+        return {'method': record['method'],
+                'route': record.get('route'),
+                'path': record['path'],
+                'status': status,
+                'captured_status': record.get('status'),
+                'duration': duration}
+
+
+def run(records, replayer, speed, concurrency):
+    """
+    Replays records open loop: each starts at its captured offset
+    divided by speed, or back to back if speed is 0.
+
+    Returns:
+        (array): Replay results, in record order.
+    """
+    if not records:
+        return []
+
+    first = records[0].get('timestamp', 0)
+    futures = []
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+
+        for record in records:
+            prepared = replayer.prepare(record)
+
+            if speed:
+                offset = (record.get('timestamp', first) - first) / speed
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            futures.append(executor.submit(replayer.send, record, prepared))
+
+    return [future.result() for future in futures]
+
+
+def _by_route(records):
+    routes = {}
+    for record in records:
+        key = (record['method'], record.get('route') or record['path'])
+        routes.setdefault(key, []).append(record['duration'])
+
+    for durations in routes.values():
+        durations.sort()
+
+    return routes
+
+
+def is_run(records):
+    """
+    Returns:
+        (bool): True if records were written by `run`, not captured.
+    """
+    return all('captured_status' in record for record in records)
+
+
+def diff(before, after, threshold, min_count):
+    """
+    Prints p50/p95/p99 per route for two runs and flags routes whose
+    p99 grew by more than threshold.
+
+    Returns:
+        (bool): True if any route regressed.
+    """
+    before_routes = _by_route(before)
+    after_routes = _by_route(after)
+    regressed = False
+
+    print('{:<40} {:>6} {:>6} {:>9} {:>9} {:>9} {:>9} {:>8}'.format(
+        'route', 'n old', 'n new', 'p50 old', 'p50 new',
+        'p99 old', 'p99 new', 'p99'))
+
+    for key in sorted(set(before_routes) | set(after_routes)):
+        old = before_routes.get(key, [])
+        new = after_routes.get(key, [])
+
+        old_p99 = percentile(old, 99)
+        new_p99 = percentile(new, 99)
+        change = (new_p99 - old_p99) / old_p99 if old_p99 else 0.0
+
+        flagged = (len(old) >= min_count and len(new) >= min_count and
+                   change > threshold)
+        regressed |= flagged
+
+        print('{:<40} {:>6} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} '
+              '{:>+7.0%}{}'.format(
+                  ' '.join(key)[:40], len(old), len(new),
+                  percentile(old, 50) * 1000, percentile(new, 50) * 1000,
+                  old_p99 * 1000, new_p99 * 1000, change,
+                  '  REGRESSION' if flagged else ''))
+
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='Replay a capture.')
+    run_parser.add_argument('capture')
+    target_group = run_parser.add_mutually_exclusive_group(required=True)
+    target_group.add_argument('--url')
+    target_group.add_argument('--in-process', action='store_true')
+    run_parser.add_argument('-o', '--output', required=True,
+                            help='Where to write the replay results.')
+    run_parser.add_argument('--speed', type=float, default=1.0,
+                            help='Replay rate as a multiple of the '
+                                 'captured rate. 0 sends back to back.')
+    run_parser.add_argument('--concurrency', type=int, default=32)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--timeout', type=float, default=30)
+    add_jwt_arguments(run_parser)
+
+    diff_parser = commands.add_parser(
+        'diff', help='Compare latency per route between two runs.')
+    diff_parser.add_argument('before')
+    diff_parser.add_argument('after')
+    diff_parser.add_argument('--threshold', type=float, default=0.1,
+                             help='Allowed p99 growth, as a fraction.')
+    diff_parser.add_argument('--min-count', type=int, default=20,
+                             help='Routes with fewer samples are not '
+                                  'flagged.')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'diff':
+        before = load(args.before)
+        after = load(args.after)
+
+        for path, records in ((args.before, before), (args.after, after)):
+            if not is_run(records):
+                parser.error('%s is not a replay run; replay it with '
+                             '`run` first.' % path)
+
+        if diff(before, after, args.threshold, args.min_count):
+            return 1
+        return 0
+
+    if args.in_process:
+        import app
+
+        service_app = app.get_app()
+
+        def make_target():
+            return Target(service_app.test_client(), service_app)
+    else:
+        service_app = ConfigOnly()
+        client = HttpClient(args.url, args.concurrency, args.timeout)
+
+        def make_target():
+            return Target(client, service_app)
+
+    apply_jwt_arguments(service_app.config, args)
+
+    records = load(args.capture)
+    results = run(records, Replayer(make_target, args.seed),
+                  args.speed, args.concurrency)
+
+    with open(args.output, 'w') as file:
+        for result in results:
+            file.write(json.dumps(result) + '\n')
+
+    changed = sum(1 for result in results
+                  if result['status'] != result['captured_status'])
+    print('Replayed %d requests, %d with a different status than captured. '
+          'Results in %s' % (len(results), changed, args.output))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
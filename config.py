@@ -16,6 +16,18 @@ DATABASE_CONNECT_OPTIONS = {}
 # operations using the other.
 THREADS_PER_PAGE = 2
 
+# Production server (serve.py). WORKERS defaults to one per core; each
+# worker runs THREADS_PER_PAGE threads. Workers are replaced after
+# MAX_REQUESTS requests (plus up to MAX_REQUESTS_JITTER, so they don't
+# all restart at once) or once they use more than WORKER_MAX_RSS_MB.
+BIND = '127.0.0.1:8080'
+WORKERS = None
+MAX_REQUESTS = 10000
+MAX_REQUESTS_JITTER = 1000
+WORKER_MAX_RSS_MB = 512
+GRACEFUL_TIMEOUT = 30
+KEEPALIVE = 5
+
 # Enable protection agains *Cross-site Request Forgery (CSRF)*
 CSRF_ENABLED = True
 
@@ -26,6 +38,121 @@ CSRF_SESSION_KEY = "secret"
 # Secret key for signing cookies
 SECRET_KEY = "secret"
 
+# bcrypt cost (log2 rounds) for new password hashes.
+BCRYPT_LOG_ROUNDS = 12
+
+# Service JWTs (settings/request.py). Tokens are signed with the key in
+# JWT_SERVICE_KEY_FILE + '.private' and verified with the one in
+# JWT_SERVICE_KEY_FILE + '.public'; for HS* algorithms both files hold
+# the same secret. Tokens are valid for JWT_SERVICE_TTL seconds.
+JWT_SERVICE_ALGO = 'RS256'
+JWT_SERVICE_KEY_FILE = os.path.join(BASE_DIR, 'keys', 'zapi-id')
+JWT_SERVICE_TTL = 3600
+
 
 # SQLALCHEMY_TRACK_MODIFICATIONS
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Indent JSON responses. Leave off in production; compact output is
+# smaller and faster to encode.
+JSON_PRETTY = False
+# 'json' (standard library) or 'orjson' (faster, must be installed).
+JSON_BACKEND = 'json'
+
+# Compress JSON responses with gzip/deflate when the client accepts it
+# and the body is at least COMPRESSION_MIN_SIZE bytes.
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVEL = 6
+
+# Seconds the role catalog version used for ETags is cached in-process.
+# Role changes made in the database show up in ETags at most this late.
+ROLE_CATALOG_VERSION_TTL = 5
+
+# Calls to other services (settings.request.call). Connections are kept
+# alive and pooled per target host; idempotent methods are retried.
+SERVICE_POOL_SIZE = 10
+SERVICE_CONNECT_TIMEOUT = 3.05
+SERVICE_READ_TIMEOUT = 10
+SERVICE_RETRIES = 2
+
+# Threads shared by settings.request.call_many() for concurrent calls.
+SERVICE_FANOUT_WORKERS = 16
+
+# Instances per downstream service, e.g.
+# {'accounts': ['http://10.0.0.5:5003', 'http://10.0.0.6:5003']}.
+# Can also come from the SERVICE_ROUTES (JSON) or SERVICE_ROUTES_FILE
+# environment variables. See settings/routing.py.
+SERVICE_ROUTES = None
+# Eject an instance for SERVICE_EJECT_SECONDS after this many failures
+# in a row.
+SERVICE_EJECT_FAILURES = 3
+SERVICE_EJECT_SECONDS = 30
+
+# Let identical concurrent downstream GETs share one request, and keep
+# successful results for SERVICE_COALESCE_TTL seconds (0 disables).
+SERVICE_COALESCE = True
+SERVICE_COALESCE_TTL = 0
+SERVICE_COALESCE_CACHE_SIZE = 1024
+
+# How signup creates the identity's account. 'sync' calls the accounts
+# service during the request; 'outbox' queues it for the background
+# dispatcher in app/mod_auth/models/provisioning.py.
+ACCOUNT_PROVISIONING = 'sync'
+PROVISIONING_BATCH_SIZE = 50
+PROVISIONING_INTERVAL = 1.0
+PROVISIONING_LEASE_SECONDS = 60
+PROVISIONING_TIMEOUT = 30
+# Our own URL root for downstream calls made outside of a request.
+SERVICE_URL_ROOT = 'http://localhost/'
+
+# Default and maximum page sizes for listing endpoints.
+PAGE_SIZE = 50
+PAGE_SIZE_MAX = 200
+
+# POST /batch: most sub-requests per batch and threads for running
+# independent ones in parallel.
+BATCH_MAX_REQUESTS = 20
+BATCH_WORKERS = 8
+
+# Per-route request counts, in-flight gauges and latency histograms
+# (with db, bcrypt, jwt and http time broken out), served in the
+# Prometheus text format at METRICS_PATH. Nothing is recorded when off.
+# Scrapers need an admin JWT as a bearer token.
+METRICS_ENABLED = False
+METRICS_PATH = '/metrics'
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+# Sampling profiler for single requests (settings/profiling.py). Admins
+# ask for a profile with the PROFILE_HEADER header ('memory' also traces
+# allocations); PROFILE_SAMPLE_RATE profiles that fraction of all
+# requests. Collapsed stacks are written to PROFILE_DIR.
+PROFILE_ENABLED = False
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_INTERVAL = 0.001
+PROFILE_TRACEMALLOC = False
+PROFILE_TRACEMALLOC_FRAMES = 25
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Span tracing (settings/tracing.py). Incoming W3C traceparent headers
+# are honoured; new traces are started for TRACE_SAMPLE_RATE of requests.
+# Spans are appended to TRACE_FILE as Zipkin v2 JSON lines.
+TRACING_ENABLED = False
+TRACE_SERVICE_NAME = 'zapi-id'
+TRACE_SAMPLE_RATE = 1.0
+TRACE_FILE = os.path.join(BASE_DIR, 'traces.ndjson')
+TRACE_FLUSH_SIZE = 100
+
+# Record sanitized request traces for commands/replay.py
+# (settings/capture.py). Bodies are kept as shapes only; credentials
+# headers are never kept. Query parameter values are kept only for
+# CAPTURE_QUERY_KEEP names. CAPTURE_REDACT names extra headers and query
+# parameters to leave out.
+CAPTURE_ENABLED = False
+CAPTURE_SAMPLE_RATE = 1.0
+CAPTURE_FILE = os.path.join(BASE_DIR, 'capture.ndjson')
+CAPTURE_FLUSH_SIZE = 100
+CAPTURE_REDACT = ()
+CAPTURE_QUERY_KEEP = ('limit', 'gzip')
@@ -6,6 +6,8 @@ import app
 
 import pymysql.cursors
 
+from settings import metrics, tracing
+
 import os
 import hashlib
 
@@ -148,7 +150,7 @@ def commit(connection):
         close(connection)
 
 
-def read(sql, params, many=False):
+def read(sql, params, many=False, tuples=False):
     """
     Makes a read query from database.
 
@@ -158,10 +160,13 @@ def read(sql, params, many=False):
         many (bool, optional): A flag to indicate a query that spans
                                more than one row.
         Defaults to False.
+        tuples (bool, optional): Return rows as tuples instead of
+                                 dictionaries. Defaults to False.
 
     Returns:
         (array): in the case of a many query
         (dictionary): in the case of a single row query
+        (tuple): (column names, rows) when tuples is set. See _fetch().
 
     Raises:
         DBException - A database error occured.
@@ -169,13 +174,11 @@ def read(sql, params, many=False):
     a_connection = connection()
 
     try:
-        with a_connection.cursor() as cursor:
+        with metrics.timer('db'), \
+                tracing.span('db.read', **{'db.statement': sql}), \
+                _cursor(a_connection, tuples) as cursor:
             cursor.execute(sql, params)
-
-            if many:
-                result = cursor.fetchall()
-            else:
-                result = cursor.fetchone()
+            result = _fetch(cursor, many, tuples)
 
     except Exception as e:
         close(a_connection)
@@ -184,6 +187,38 @@ def read(sql, params, many=False):
     return result
 
 
+def stream(sql, params):
+    """
+    Makes a read query and yields the rows one by one from a server-side
+    cursor, so memory use doesn't grow with the size of the result.
+    The connection is closed when the generator is exhausted or closed.
+
+    Params:
+        sql (string): The SQL query.
+        params (tulip): The parameters to be inserted into the query.
+
+    Returns:
+        (generator): Yields a dictionary per row.
+
+    Raises:
+        DBException - A database error occured.
+    """
+    a_connection = connection()
+
+    try:
+        with a_connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+            cursor.execute(sql, params)
+
+            for row in cursor:
+                yield row
+
+    except Exception as e:
+        raise raise_exception(e)
+
+    finally:
+        close(a_connection)
+
+
 def write(sql, params):
     """
     Makes a read query from database.
@@ -206,11 +241,13 @@ def write(sql, params):
     a_connection = connection()
 
     try:
-        with a_connection.cursor() as cursor:
-            cursor.execute(sql, params)
-            result = cursor.lastrowid
+        with metrics.timer('db'), \
+                tracing.span('db.write', **{'db.statement': sql}):
+            with a_connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                result = cursor.lastrowid
 
-        a_connection.commit()
+            a_connection.commit()
 
     except Exception as e:
 
@@ -223,7 +260,40 @@ def write(sql, params):
     return result
 
 
-def call(a_connection, procedure, params, many=False):
+def execute_many(a_connection, sql, rows):
+    """
+    Runs one statement for many parameter rows. For INSERT ... VALUES
+    statements pymysql sends the rows as multi-row INSERTs. Does not
+    commit.
+
+    Params:
+        connection (PySQL Connection): A connection created by above method.
+        sql (string): The SQL statement.
+        rows (array): A parameter tuple per row.
+
+    Returns:
+        (int): The number of affected rows.
+
+    Raises:
+        DBException - A database error occured.
+        DBItemAlreadyExistsException - An item with specified key alread exists
+    """
+    try:
+        with metrics.timer('db'), \
+                tracing.span('db.execute_many', **{'db.statement': sql,
+                                                   'db.rows': len(rows)}), \
+                a_connection.cursor() as cursor:
+            result = cursor.executemany(sql, rows)
+
+    except Exception as e:
+        a_connection.rollback()
+        close(a_connection)
+        raise raise_exception(e)
+
+    return result
+
+
+def call(a_connection, procedure, params, many=False, tuples=False):
     """
     Calls stored procedure from database.
 
@@ -234,10 +304,13 @@ def call(a_connection, procedure, params, many=False):
         many (bool, optional): A flag to indicate a query that spans
                                more than one row.
         Defaults to False.
+        tuples (bool, optional): Return rows as tuples instead of
+                                 dictionaries. Defaults to False.
 
     Returns:
         (array): in the case of a many query
         (dictionary): in the case of a single row query
+        (tuple): (column names, rows) when tuples is set. See _fetch().
 
     Raises:
         DBException - A non-specified database error occured. Used in prod.
@@ -247,17 +320,16 @@ def call(a_connection, procedure, params, many=False):
         DBPolicyForbiddenException - A user-made policy forbids this action.
     """
     try:
-        with a_connection.cursor() as cursor:
+        with metrics.timer('db'), \
+                tracing.span('db.call', procedure=procedure), \
+                _cursor(a_connection, tuples) as cursor:
 
             if params:
                 cursor.callproc(procedure, params)
             else:
                 cursor.callproc(procedure)
 
-            if many:
-                result = cursor.fetchall()
-            else:
-                result = cursor.fetchone()
+            result = _fetch(cursor, many, tuples)
 
     except Exception as e:
         a_connection.rollback()
@@ -267,6 +339,37 @@ def call(a_connection, procedure, params, many=False):
     return result
 
 
+def _cursor(a_connection, tuples):
+    """
+    A tuple cursor skips building a dictionary for every row.
+    """
+    if tuples:
+        return a_connection.cursor(pymysql.cursors.Cursor)
+    return a_connection.cursor()
+
+
+def _fetch(cursor, many, tuples):
+    """
+    Fetches the result of the last query.
+
+    Returns:
+        The row(s) as is, or when tuples is set a (columns, rows) pair
+        where columns holds the column names in row order. Models turn
+        that into objects with Base.from_rows().
+    """
+    if many:
+        result = cursor.fetchall()
+    else:
+        result = cursor.fetchone()
+
+    if tuples:
+        description = cursor.description or ()
+        columns = tuple(column[0] for column in description)
+        return columns, result
+
+    return result
+
+
 def raise_exception(e):
     """
     Exception helper. Raises the given exception when testing,
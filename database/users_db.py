@@ -50,6 +50,7 @@ CREATE TABLE `session` (`session_id` CHAR(64) NOT NULL COMMENT 'An random number
     ON UPDATE CURRENT_TIMESTAMP,
   PRIMARY KEY(`session_id`, `identity_id`),
   INDEX(`identity_id`),
+  INDEX(`expires`),
   CONSTRAINT FOREIGN KEY(`identity_id`) REFERENCES `identity` (`identity_id`)
     ON UPDATE CASCADE
     ON DELETE CASCADE
@@ -80,6 +81,25 @@ CREATE TABLE `identity_role` (`identity_id` CHAR(64) NOT NULL COMMENT 'Identity
     ON DELETE CASCADE
 ) ENGINE = InnoDB DEFAULT CHARSET = utf8;
 
+DROP TABLE IF EXISTS `provisioning_outbox`;
+CREATE TABLE `provisioning_outbox` (`outbox_id` BIGINT UNSIGNED NOT NULL PRIMARY KEY AUTO_INCREMENT COMMENT 'Order in which identities were queued for account provisioning.',
+  `identity_id` CHAR(64) NOT NULL COMMENT 'Identity that needs an account.',
+  `username` VARCHAR(50) NOT NULL COMMENT 'Used as the name of the new account.',
+  `attempts` INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Failed attempts to provision so far.',
+  `next_attempt` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT 'Not dispatched before this time. Pushed forward while claimed and after failures.',
+  `claim_token` CHAR(64) NULL COMMENT 'Set by the dispatcher that claimed the row.',
+  `last_error` VARCHAR(255) NULL COMMENT 'Why the last attempt failed.',
+  `completed` TIMESTAMP NULL COMMENT 'When the account was created and the role assigned. NULL while pending.',
+  `inserted` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ON UPDATE CURRENT_TIMESTAMP,
+  INDEX(`completed`, `next_attempt`),
+  INDEX(`claim_token`),
+  CONSTRAINT FOREIGN KEY(`identity_id`) REFERENCES `identity` (`identity_id`)
+    ON UPDATE CASCADE
+    ON DELETE CASCADE
+) ENGINE = InnoDB DEFAULT CHARSET = utf8;
+
 -- ----------------------------------------------------------------------------
 
 DELIMITER $$
@@ -105,13 +125,191 @@ DELIMITER;
 
 -- ----------------------------------------------------------------------------
 
+-- Same as `create_identity`, but also queues the identity for account
+-- provisioning. Both rows are committed together by the caller.
+DELIMITER $$
+CREATE PROCEDURE `create_identity_with_provisioning` (
+  IN in_identity_id CHAR(64),
+  IN in_username VARCHAR(50),
+  IN in_password_hash CHAR(60)
+)
+BEGIN
+
+CALL abort_if_identity_username_exists(in_username);
+
+INSERT INTO
+  `identity`
+  (`identity_id`, `username`, `password_hash`)
+VALUES
+  (in_identity_id, in_username, in_password_hash);
+
+INSERT INTO
+  `provisioning_outbox`
+  (`identity_id`, `username`)
+VALUES
+  (in_identity_id, in_username);
+
+CALL fetch_identity(in_identity_id);
+
+END$$
+DELIMITER;
+
+-- ----------------------------------------------------------------------------
+
+-- Claims up to `in_limit` due rows for one dispatcher. The claim is a
+-- lease: `next_attempt` moves `in_lease_seconds` ahead, so rows of a
+-- dispatcher that dies are picked up again once it runs out.
+DELIMITER $$
+CREATE PROCEDURE `claim_provisioning_batch` (
+  IN in_claim_token CHAR(64),
+  IN in_limit INT UNSIGNED,
+  IN in_lease_seconds INT UNSIGNED
+)
+BEGIN
+
+UPDATE
+  `provisioning_outbox`
+SET
+  `claim_token` = in_claim_token,
+  `next_attempt` = DATE_ADD(NOW(), INTERVAL in_lease_seconds SECOND)
+WHERE
+  `completed` IS NULL
+AND
+  `next_attempt` <= CURRENT_TIMESTAMP
+ORDER BY `outbox_id`
+LIMIT in_limit;
+
+SELECT
+  `outbox_id`,
+  `identity_id`,
+  `username`,
+  `attempts`
+FROM
+  `provisioning_outbox`
+WHERE
+  `claim_token` = in_claim_token
+AND
+  `completed` IS NULL
+ORDER BY `outbox_id`;
+
+END$$
+DELIMITER;
+
+-- ----------------------------------------------------------------------------
+
+-- Only the dispatcher holding the claim may complete a record. If the
+-- lease ran out and another dispatcher claimed it, or it was completed
+-- already, nothing is changed.
+DELIMITER $$
+CREATE PROCEDURE `complete_provisioning` (
+  IN in_outbox_id BIGINT UNSIGNED,
+  IN in_claim_token CHAR(64),
+  IN in_account_id CHAR(64)
+)
+BEGIN
+
+DECLARE a_identity_id CHAR(64);
+DECLARE a_role_id INT UNSIGNED;
+
+SELECT
+  `role_id` INTO a_role_id
+FROM
+  `role`
+WHERE
+  `name` = 'user'
+LIMIT 1;
+
+IF a_role_id IS NULL THEN -- The 'user' role does not exist.
+  SIGNAL SQLSTATE '45000' -- 45000 is a user-generic number.
+    -- Throw exception using code 10001 which is zapi defined as
+    -- 'key does not exist'
+    -- We pass the key name so app can handle it appropriately.
+    SET MESSAGE_TEXT = 'role', MYSQL_ERRNO = 10001;
+END IF;
+
+UPDATE
+  `provisioning_outbox`
+SET
+  `completed` = CURRENT_TIMESTAMP,
+  `claim_token` = NULL,
+  `last_error` = NULL
+WHERE
+  `outbox_id` = in_outbox_id
+AND
+  `claim_token` = in_claim_token
+AND
+  `completed` IS NULL
+LIMIT 1;
+
+IF ROW_COUNT() = 0 THEN -- The claim is no longer ours.
+  SIGNAL SQLSTATE '45000' -- 45000 is a user-generic number.
+    -- Throw exception using code 10003 which is zapi defined as
+    -- 'expired'
+    -- We pass the key name so app can handle it appropriately.
+    SET MESSAGE_TEXT = 'claim_token', MYSQL_ERRNO = 10003;
+END IF;
+
+SELECT
+  `identity_id` INTO a_identity_id
+FROM
+  `provisioning_outbox`
+WHERE
+  `outbox_id` = in_outbox_id
+LIMIT 1;
+
+-- Give the identity the 'user' role on its new account. IGNORE only
+-- covers the grant already being there.
+INSERT IGNORE INTO
+  `identity_role`
+  (`identity_id`, `account_id`, `role_id`)
+VALUES
+  (a_identity_id, in_account_id, a_role_id);
+
+END$$
+DELIMITER;
+
+-- ----------------------------------------------------------------------------
+
+DELIMITER $$
+CREATE PROCEDURE `fail_provisioning` (
+  IN in_outbox_id BIGINT UNSIGNED,
+  IN in_claim_token CHAR(64),
+  IN in_error VARCHAR(255)
+)
+BEGIN
+
+-- Exponential backoff, capped at an hour. A record whose claim is no
+-- longer ours belongs to another dispatcher and is left alone.
+UPDATE
+  `provisioning_outbox`
+SET
+  `attempts` = `attempts` + 1,
+  `next_attempt` = DATE_ADD(NOW(),
+    INTERVAL LEAST(POW(2, `attempts`), 3600) SECOND),
+  `claim_token` = NULL,
+  `last_error` = in_error
+WHERE
+  `outbox_id` = in_outbox_id
+AND
+  `claim_token` = in_claim_token
+LIMIT 1;
+
+END$$
+DELIMITER;
+
+-- ----------------------------------------------------------------------------
+
+-- With `in_account_id` the identity must hold a role on that account,
+-- otherwise it is reported as not existing; NULL skips the check.
 DELIMITER $$
 CREATE PROCEDURE `fetch_identity` (
-  IN in_identity_id CHAR(64)
+  IN in_identity_id CHAR(64),
+  IN in_account_id CHAR(64)
 )
 BEGIN
 
 CALL check_if_identity_id_exists(in_identity_id);
+CALL check_if_identity_on_account(in_identity_id, in_account_id);
 
 SELECT
   `first_name`,
@@ -129,6 +327,85 @@ DELIMITER;
 
 -- ----------------------------------------------------------------------------
 
+-- Cheap version token for conditional GETs, so clients polling an
+-- unchanged identity never cost a full fetch. `updated` alone has one
+-- second resolution, so the checksum over the columns `fetch_identity`
+-- returns catches changes within the same second. `in_account_id` limits
+-- as for `fetch_identity`, returning no row instead of signalling.
+DELIMITER $$
+CREATE PROCEDURE `fetch_identity_version` (
+  IN in_identity_id CHAR(64),
+  IN in_account_id CHAR(64)
+)
+BEGIN
+
+SELECT
+  `updated`,
+  CRC32(CONCAT_WS(',', `first_name`, `last_name`, `gender`,
+                  `invite_code`)) as `checksum`
+FROM
+  `identity`
+WHERE
+  `identity_id` = in_identity_id
+AND
+  (in_account_id IS NULL OR EXISTS (
+    SELECT
+      1
+    FROM
+      `identity_role`
+    WHERE
+      `identity_role`.`identity_id` = in_identity_id
+    AND
+      `identity_role`.`account_id` = in_account_id
+  ))
+LIMIT 1;
+
+END$$
+DELIMITER;
+
+-- ----------------------------------------------------------------------------
+
+-- Keyset pagination over the primary key, see `fetch_roles_page`.
+-- With `in_account_id` only identities holding a role on that account
+-- are listed; NULL lists everyone and is for admins only.
+DELIMITER $$
+CREATE PROCEDURE `fetch_identities_page` (
+  IN in_account_id CHAR(64),
+  IN in_after_identity_id CHAR(64),
+  IN in_limit INT UNSIGNED
+)
+BEGIN
+
+SELECT
+  `identity_id`,
+  `username`,
+  `first_name`,
+  `last_name`,
+  `email`,
+  `admin`
+FROM
+  `identity`
+WHERE
+  `identity_id` > COALESCE(in_after_identity_id, '')
+AND
+  (in_account_id IS NULL OR EXISTS (
+    SELECT
+      1
+    FROM
+      `identity_role`
+    WHERE
+      `identity_role`.`identity_id` = `identity`.`identity_id`
+    AND
+      `identity_role`.`account_id` = in_account_id
+  ))
+ORDER BY `identity_id`
+LIMIT in_limit;
+
+END$$
+DELIMITER;
+
+-- ----------------------------------------------------------------------------
+
 DELIMITER $$
 CREATE PROCEDURE `update_identity` (
   IN in_identity_id CHAR(64),
@@ -406,14 +683,22 @@ CREATE PROCEDURE `delete_session` (
 )
 BEGIN
 
-CALL check_if_session_is_valid(in_session_id);
-
+-- No separate validity check here. Deleting an expired session is
+-- harmless, so we only need to know whether a row was there at all.
 DELETE FROM
   `session`
 WHERE
   `session_id` = in_session_id
 LIMIT 1;
 
+IF ROW_COUNT() = 0 THEN -- session_id does not exist.
+  SIGNAL SQLSTATE '45000' -- 45000 is a user-generic number.
+    -- Throw exception using code 10001 which is zapi defined as
+    -- 'key does not exist'
+    -- We pass the key name so app can handle it appropriately.
+    SET MESSAGE_TEXT = 'session_id', MYSQL_ERRNO = 10001;
+END IF;
+
 END$$
 DELIMITER;
 
@@ -426,7 +711,35 @@ CREATE PROCEDURE `update_session` (
 )
 BEGIN
 
-CALL check_if_session_is_valid(in_session_id);
+DECLARE session_count INT UNSIGNED DEFAULT 0;
+DECLARE session_expired BOOL DEFAULT FALSE;
+
+-- One indexed read for both existence and expiry. Expired rows are
+-- left in place for `delete_expired_sessions` to clean up.
+SELECT
+  COUNT(*),
+  COALESCE(MAX(`expires` < CURRENT_TIMESTAMP), FALSE)
+INTO
+  session_count,
+  session_expired
+FROM
+  `session`
+WHERE
+  `session_id` = in_session_id;
+
+IF session_count = 0 THEN -- session_id does not exist.
+  SIGNAL SQLSTATE '45000' -- 45000 is a user-generic number.
+    -- Throw exception using code 10001 which is zapi defined as
+    -- 'key does not exist'
+    -- We pass the key name so app can handle it appropriately.
+    SET MESSAGE_TEXT = 'session_id', MYSQL_ERRNO = 10001;
+ELSEIF session_expired THEN
+  SIGNAL SQLSTATE '45000' -- 45000 is a user-generic number.
+    -- Throw exception using code 10003 which is zapi defined as
+    -- 'expired'
+    -- We pass the key name so app can handle it appropriately.
+    SET MESSAGE_TEXT = 'session_id', MYSQL_ERRNO = 10003;
+END IF;
 
 UPDATE
   `session`
@@ -441,6 +754,60 @@ DELIMITER;
 
 -- ----------------------------------------------------------------------------
 
+-- Keyset pagination over an identity's sessions, see `fetch_roles_page`.
+-- Session ids are live credentials, so only the first 16 characters are
+-- returned, and used as the page key. The `identity_id` index also holds
+-- `session_id`, so this is a range scan of that identity's entries,
+-- starting after the cursor. Ids are lowercase hex, so padding the
+-- prefix with 'z' sorts it after every id that starts with it; the
+-- comparison stays on the bare column so the index can seek to it.
+-- With `in_account_id` the identity must hold a role on that account,
+-- otherwise it is reported as not existing; NULL skips the check.
+DELIMITER $$
+CREATE PROCEDURE `fetch_sessions_page` (
+  IN in_identity_id CHAR(64),
+  IN in_account_id CHAR(64),
+  IN in_after_session_prefix CHAR(16),
+  IN in_limit INT UNSIGNED
+)
+BEGIN
+
+IF in_account_id IS NOT NULL AND NOT EXISTS (
+  SELECT
+    1
+  FROM
+    `identity_role`
+  WHERE
+    `identity_id` = in_identity_id
+  AND
+    `account_id` = in_account_id
+) THEN
+  SIGNAL SQLSTATE '45000' -- 45000 is a user-generic number.
+    -- Throw exception using code 10001 which is zapi defined as
+    -- 'key does not exist'
+    -- We pass the key name so app can handle it appropriately.
+    SET MESSAGE_TEXT = 'identity_id', MYSQL_ERRNO = 10001;
+END IF;
+
+SELECT
+  LEFT(`session_id`, 16) as `session_prefix`,
+  `active`,
+  `expires`,
+  `inserted`
+FROM
+  `session`
+WHERE
+  `identity_id` = in_identity_id
+AND
+  `session_id` > COALESCE(RPAD(in_after_session_prefix, 64, 'z'), '')
+ORDER BY `session_id`
+LIMIT in_limit;
+
+END$$
+DELIMITER;
+
+-- ----------------------------------------------------------------------------
+
 DELIMITER $$
 CREATE PROCEDURE `create_role` (
   IN in_name VARCHAR(20)
@@ -562,6 +929,49 @@ DELIMITER;
 
 -- ----------------------------------------------------------------------------
 
+-- Version token for the role catalog. `updated` alone has one second
+-- resolution, so the checksum catches renames within the same second.
+DELIMITER $$
+CREATE PROCEDURE `fetch_role_catalog_version` ()
+BEGIN
+
+SELECT
+  COUNT(*) as `count`,
+  MAX(`updated`) as `updated`,
+  BIT_XOR(CRC32(CONCAT_WS(',', `role_id`, `name`))) as `checksum`
+FROM
+  `role`;
+
+END$$
+DELIMITER;
+
+-- ----------------------------------------------------------------------------
+
+-- Keyset pagination: pass the last `role_id` of the previous page, or
+-- NULL for the first page. Callers ask for one row more than they show
+-- to find out whether there is a next page.
+DELIMITER $$
+CREATE PROCEDURE `fetch_roles_page` (
+  IN in_after_role_id INT UNSIGNED,
+  IN in_limit INT UNSIGNED
+)
+BEGIN
+
+SELECT
+  `role_id`,
+  `name`
+FROM
+  `role`
+WHERE
+  `role_id` > COALESCE(in_after_role_id, 0)
+ORDER BY `role_id`
+LIMIT in_limit;
+
+END$$
+DELIMITER;
+
+-- ----------------------------------------------------------------------------
+
 DELIMITER $$
 CREATE PROCEDURE `add_role_to_identity` (
   IN in_identity_id CHAR(64),
@@ -645,6 +1055,49 @@ DELIMITER ;
 
 -- ----------------------------------------------------------------------------
 
+-- Keyset pagination over an identity's grants in primary key order, see
+-- `fetch_roles_page`. The page key is (`account_id`, `role_id`); pass
+-- NULLs for the first page. With `in_account_id` only grants on that
+-- account are listed; NULL lists all of them.
+DELIMITER $$
+CREATE PROCEDURE `fetch_identity_grants_page` (
+  IN in_identity_id CHAR(64),
+  IN in_account_id CHAR(64),
+  IN in_after_account_id CHAR(64),
+  IN in_after_role_id INT UNSIGNED,
+  IN in_limit INT UNSIGNED
+)
+BEGIN
+
+SELECT
+  `identity_role`.`account_id`,
+  `identity_role`.`role_id`,
+  `role`.`name`,
+  `identity_role`.`inserted`
+FROM
+  `identity_role`, `role`
+WHERE
+  `identity_role`.`role_id` = `role`.`role_id`
+AND
+  `identity_role`.`identity_id` = in_identity_id
+AND
+  (in_account_id IS NULL OR `identity_role`.`account_id` = in_account_id)
+AND
+  (in_after_account_id IS NULL
+    OR
+  `identity_role`.`account_id` > in_after_account_id
+    OR
+  (`identity_role`.`account_id` = in_after_account_id
+    AND
+  `identity_role`.`role_id` > in_after_role_id))
+ORDER BY `identity_role`.`account_id`, `identity_role`.`role_id`
+LIMIT in_limit;
+
+END$$
+DELIMITER ;
+
+-- ----------------------------------------------------------------------------
+
 DELIMITER $$
 CREATE PROCEDURE `fetch_identity_roles_for_account` (
   IN in_identity_id CHAR(64),
@@ -711,14 +1164,18 @@ CREATE PROCEDURE `identity_from_session` (
 )
 BEGIN
 
-CALL check_if_session_is_valid(in_session_id);
-
+-- A single indexed read on the `session` primary key. Rather than
+-- SIGNAL here, the expiry status is returned with the row and the
+-- app decides what to do with it. An empty result means the
+-- session_id does not exist. Expired rows are removed in bulk by
+-- `delete_expired_sessions`.
 SELECT
   `identity`.`identity_id`,
   `identity`.`username`,
   `identity`.`admin`,
   `identity`.`totp_secret`,
-  `session`.`expires`
+  `session`.`expires`,
+  COALESCE(`session`.`expires` < CURRENT_TIMESTAMP, FALSE) as `expired`
 FROM
   `session`
 INNER JOIN
@@ -883,6 +1340,37 @@ DELIMITER ;
 
 -- ----------------------------------------------------------------------------
 
+-- Reports the identity as not existing unless it holds a role on
+-- `in_account_id`. A NULL account skips the check.
+DELIMITER $$
+CREATE PROCEDURE `check_if_identity_on_account` (
+  IN in_identity_id CHAR(64),
+  IN in_account_id CHAR(64)
+  )
+BEGIN
+
+IF in_account_id IS NOT NULL AND NOT EXISTS (
+  SELECT
+    1
+  FROM
+    `identity_role`
+  WHERE
+    `identity_id` = in_identity_id
+  AND
+    `account_id` = in_account_id
+) THEN
+  SIGNAL SQLSTATE '45000' -- 45000 is a user-generic number.
+    -- Throw exception using code 10001 which is zapi defined as
+    -- 'key does not exist'
+    -- We pass the key name so app can handle it appropriately.
+    SET MESSAGE_TEXT = 'identity_id', MYSQL_ERRNO = 10001;
+END IF;
+
+END$$
+DELIMITER ;
+
+-- ----------------------------------------------------------------------------
+
 DELIMITER $$
 CREATE PROCEDURE `abort_if_role_name_exists` (
   IN in_name VARCHAR(20)
@@ -1140,3 +1628,37 @@ END IF;
 
 END$$
 DELIMITER ;
+
+-- ----------------------------------------------------------------------------
+
+DELIMITER $$
+CREATE PROCEDURE `delete_expired_sessions` (
+  IN in_limit INT UNSIGNED
+  )
+BEGIN
+
+-- Deletes at most `in_limit` expired sessions so a single run never
+-- holds locks on a large part of the table. Callers repeat until
+-- `deleted` comes back smaller than `in_limit`, which means no expired
+-- rows were left.
+DELETE FROM
+  `session`
+WHERE
+  `expires` < CURRENT_TIMESTAMP
+LIMIT in_limit;
+
+SELECT
+  ROW_COUNT() as `deleted`;
+
+END$$
+DELIMITER ;
+
+-- ----------------------------------------------------------------------------
+
+-- Background cleanup for expired sessions. Requires the server to run
+-- with `event_scheduler=ON`; otherwise call
+-- `app.mod_auth.models.sessions.delete_expired()` from cron.
+DROP EVENT IF EXISTS `purge_expired_sessions`;
+CREATE EVENT `purge_expired_sessions`
+  ON SCHEDULE EVERY 5 MINUTE
+  DO CALL delete_expired_sessions(10000);
@@ -1,4 +1,7 @@
 # Run a test server.
-from app import app
+from app import get_app
 
+# The default app, so background threads that read app.config outside
+# of a request see the same settings as the server.
+app = get_app()
 app.run(host='127.0.0.1', port=8080)
@@ -0,0 +1,78 @@
+# Run the production server.
+#
+# Pre-forks WORKERS processes (one per core by default) that share the
+# listening socket, each serving requests on THREADS_PER_PAGE threads.
+# Workers are recycled after MAX_REQUESTS requests or once their memory
+# grows past WORKER_MAX_RSS_MB. Send SIGHUP to the master process for a
+# graceful reload: new workers start before the old ones finish their
+# in-flight requests and exit.
+#
+#     python serve.py
+import os
+import resource
+
+from gunicorn.app.base import BaseApplication
+
+import config
+
+
+def _rss_mb():
+    """
+    The current resident set size of this process in MB.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024.0 / 1024.0
+    except (IOError, OSError, ValueError):
+        # No /proc (e.g. macOS): fall back to the peak, in bytes there.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0 / 1024.0
+
+
+def post_request(worker, req, environ, resp):
+    """
+    Recycles the worker once it uses too much memory. The worker stops
+    accepting requests, finishes the ones it has and is replaced.
+    """
+    limit = getattr(config, 'WORKER_MAX_RSS_MB', None)
+
+    if limit and worker.alive and _rss_mb() > limit:
+        worker.log.info('Worker %s over %s MB RSS, recycling.',
+                        worker.pid, limit)
+        worker.alive = False
+
+
+def options():
+    workers = getattr(config, 'WORKERS', None) or os.cpu_count() or 1
+
+    return {
+        'bind': getattr(config, 'BIND', '127.0.0.1:8080'),
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': config.THREADS_PER_PAGE,
+        'max_requests': getattr(config, 'MAX_REQUESTS', 0),
+        'max_requests_jitter': getattr(config, 'MAX_REQUESTS_JITTER', 0),
+        'graceful_timeout': getattr(config, 'GRACEFUL_TIMEOUT', 30),
+        'keepalive': getattr(config, 'KEEPALIVE', 5),
+        'post_request': post_request,
+    }
+
+
+class Server(BaseApplication):
+
+    def __init__(self, options):
+        self.options = options
+        super(Server, self).__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Imported in each worker, so a SIGHUP reload picks up new code.
+        from app import app
+        return app
+
+
+if __name__ == '__main__':
+    Server(options()).run()
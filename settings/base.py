@@ -1,13 +1,180 @@
 from datetime import date, datetime
 from decimal import Decimal
+from types import MemberDescriptorType
 
+# How json_serialize() converts values JSON doesn't know about.
+_convert = {
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    Decimal: str,
+}
 
-class Base(object):
+# _convert resolved for every class seen so far, subclasses included.
+# None means the value is used as is.
+_converters = dict(_convert)
+
+# Generated serializers, keyed by (class, keys).
+_serializers = {}
+
+# Generated row constructors, keyed by (class, columns).
+_builders = {}
+
+
+class ModelMeta(type):
+    """
+    Metaclass for models. A model that declares its properties in
+    `fields` gets them as __slots__, so instances carry no __dict__.
+
+    A field already slotted by a parent model is reused. A field named
+    like any other attribute of a base, e.g. `defaults` or `from_rows`,
+    raises TypeError rather than being silently dropped.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        fields = namespace.get('fields')
+
+        if fields is not None and '__slots__' not in namespace:
+            slots = []
+
+            for field in fields:
+                inherited = [getattr(base, field) for base in bases
+                             if hasattr(base, field)]
+
+                if not inherited:
+                    slots.append(field)
+                elif not all(isinstance(attribute, MemberDescriptorType)
+                             for attribute in inherited):
+                    raise TypeError('%s.fields: %r collides with an '
+                                    'attribute of a base class'
+                                    % (name, field))
+
+            namespace['__slots__'] = tuple(slots)
+
+        return type.__new__(mcs, name, bases, namespace)
+
+
+def _converter(cls):
+    """
+    Looks up how to convert values of `cls`, falling back to the
+    nearest class in its MRO so subclasses of datetime, date or Decimal
+    are converted too. The result is cached in _converters.
+    """
+    converter = None
+
+    for base in cls.__mro__:
+        if base in _convert:
+            converter = _convert[base]
+            break
+
+    _converters[cls] = converter
+    return converter
+
+
+def _compile_serializer(cls, keys):
+    """
+    Generates a function that returns the requested properties of a
+    `cls` instance as a dictionary. Properties not in cls.fields are
+    skipped, just like properties that were never set used to be.
+    """
+    wanted = set(keys)
+    lines = ['def serialize(obj):', '    d = {}']
+
+    for field in cls.fields:
+        if field in wanted:
+            lines.append('    try:')
+            lines.append('        v = obj.%s' % field)
+            lines.append('    except AttributeError:')
+            lines.append('        pass')
+            lines.append('    else:')
+            lines.append('        t = v.__class__')
+            lines.append('        c = (converters[t] if t in converters '
+                         'else converter(t))')
+            lines.append('        d[%r] = c(v) if c else v' % field)
+
+    lines.append('    return d')
+
+    namespace = {'converters': _converters, 'converter': _converter}
+    exec('\n'.join(lines), namespace)
+    return namespace['serialize']
+
+
+def _compile_builder(cls, columns):
+    """
+    Generates a function that turns tuple rows with the given column
+    order into `cls` instances. Column positions are looked up here,
+    once per result set, rather than per row.
+    """
+    positions = {column: index for index, column in enumerate(columns)}
+    lines = ['def build(rows):',
+             '    objects = []',
+             '    append = objects.append',
+             '    for row in rows:',
+             '        obj = new(cls)']
+
+    for field in cls.fields:
+        index = positions.get(field)
+        value = 'None' if index is None else 'row[%d]' % index
+
+        if field in cls.defaults:
+            if index is None:
+                value = 'defaults[%r]' % field
+            else:
+                value = '%s or defaults[%r]' % (value, field)
+
+        lines.append('        obj.%s = %s' % (field, value))
+
+    lines.append('        append(obj)')
+    lines.append('    return objects')
+
+    namespace = {'new': object.__new__, 'cls': cls, 'defaults': cls.defaults}
+    exec('\n'.join(lines), namespace)
+    return namespace['build']
+
+
+class Base(object, metaclass=ModelMeta):
     """
     The base object that all models inherit from.
     Right now its sole purpose is to handle JSON serialization.
+
+    Subclasses should list their properties in `fields`. They then use
+    __slots__ and a generated serializer. Models without `fields` fall
+    back to walking the instance __dict__.
     """
 
+    __slots__ = ()
+
+    fields = None
+
+    # Values used by from_rows() for falsy or missing columns.
+    defaults = {}
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        """
+        Builds model objects from tuple rows, as returned by db.call() and
+        db.read() with tuples=True, without calling __init__.
+
+        Params:
+            columns (tuple): The column names, in row order.
+            rows (array): The rows as tuples.
+
+        Returns:
+            (array): A list of cls objects.
+
+        Raises:
+            None
+        """
+        if cls.fields is None:
+            return [cls(dict(zip(columns, row))) for row in rows]
+
+        builder = _builders.get((cls, columns))
+
+        if builder is None:
+            builder = _compile_builder(cls, columns)
+            _builders[(cls, columns)] = builder
+
+        return builder(rows)
+
     def json_serialize(self, keys=None):
         """
         Params:
@@ -20,16 +187,27 @@ class Base(object):
         Raises:
             None
         """
-        keys_filter = keys or self.json_keys()
-        current_dict = self.__dict__
+        keys_filter = tuple(keys or self.json_keys())
+
+        if self.fields is not None:
+            cls = self.__class__
+            serializer = _serializers.get((cls, keys_filter))
+
+            if serializer is None:
+                serializer = _compile_serializer(cls, keys_filter)
+                _serializers[(cls, keys_filter)] = serializer
+
+            return serializer(self)
+
+        keys_filter = set(keys_filter)
         new_dict = {}
-        for item in current_dict:
+        for item, value in self.__dict__.items():
             if item in keys_filter:
-                if isinstance(current_dict.get(item), (datetime, date)):
-                    current_dict[item] = current_dict.get(item).isoformat()
-                elif isinstance(current_dict.get(item), (Decimal)):
-                    current_dict[item] = str(current_dict.get(item))
-                new_dict[item] = current_dict[item]
+                if isinstance(value, (datetime, date)):
+                    value = value.isoformat()
+                elif isinstance(value, (Decimal)):
+                    value = str(value)
+                new_dict[item] = value
 
         return new_dict
 
@@ -0,0 +1,209 @@
+"""
+capture module. Records a sanitized trace of each request so that real
+traffic can be replayed against another build (commands/replay.py).
+
+Per request it keeps the method, path, route, timing, status and sizes,
+the headers minus credentials and the identity, account, provider and
+roles claimed by the caller's JWT (not the token). JSON bodies are kept only as their shape: strings become
+'<str:LENGTH>' and numbers '<int>' / '<float>', so no values are stored.
+Query parameter values are only kept for CAPTURE_QUERY_KEEP names;
+others are recorded as '<str:LENGTH>'.
+
+Nothing is installed unless CAPTURE_ENABLED is set; then
+CAPTURE_SAMPLE_RATE of requests are appended to CAPTURE_FILE as NDJSON.
+"""
+
+from flask import request
+
+import atexit
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+from settings.request import VERIFIED_TOKEN_KEY
+
+# Never recorded, whatever CAPTURE_REDACT says.
+SECRET_HEADERS = frozenset(['authorization', 'cookie', 'set-cookie',
+                            'x-session', 'proxy-authorization'])
+
+# Key of the in-progress capture in the WSGI environ.
+_CAPTURE_KEY = 'zapi.capture'
+
+_lock = threading.Lock()
+_pending = []
+# Keeps concurrent flushes from interleaving lines in CAPTURE_FILE.
+_file_lock = threading.Lock()
+
+_config = {}
+
+
+def install(flask_app):
+    """
+    Hooks request capture into flask_app. Does nothing unless
+    CAPTURE_ENABLED.
+
+    Params:
+        flask_app (Flask): The application.
+    """
+    config = flask_app.config
+
+    if not config.get('CAPTURE_ENABLED', False):
+        return
+
+    _config.update(
+        sample_rate=config.get('CAPTURE_SAMPLE_RATE', 1.0),
+        file=config.get('CAPTURE_FILE', 'capture.ndjson'),
+        flush_size=config.get('CAPTURE_FLUSH_SIZE', 100),
+        redact=frozenset(name.lower() for name in
+                         config.get('CAPTURE_REDACT', ())),
+        query_keep=frozenset(name.lower() for name in
+                             config.get('CAPTURE_QUERY_KEEP', ())))
+
+    flask_app.before_request(_before_request)
+    flask_app.after_request(_after_request)
+
+    atexit.register(flush)
+
+
+def shape(value):
+    """
+    Params:
+        value: A decoded JSON value.
+
+    Returns:
+        The same structure with every string and number replaced by a
+        placeholder for its type (and, for strings, length).
+    """
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [shape(item) for item in value]
+    elif isinstance(value, bool) or value is None:
+        return value
+    elif isinstance(value, int):
+        return '<int>'
+    elif isinstance(value, float):
+        return '<float>'
+    elif isinstance(value, str):
+        return '<str:%d>' % len(value)
+
+    return '<%s>' % type(value).__name__
+
+
+def _query(query_string):
+    pairs = urllib.parse.parse_qsl(query_string, keep_blank_values=True)
+    return urllib.parse.urlencode(
+        [(key, value if key.lower() in _config['query_keep'] and
+          key.lower() not in _config['redact'] else shape(value))
+         for key, value in pairs])
+
+
+def _headers():
+    return {name: value for name, value in request.headers.items()
+            if name.lower() not in SECRET_HEADERS and
+            name.lower() not in _config['redact']}
+
+
+def _auth():
+    """
+    The claims replay needs to mint an equivalent token. The signature
+    has already been checked by role_required/admin_required, or the
+    request fails anyway; the token itself is not kept.
+    """
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+
+    import jwt
+
+    try:
+        claims = jwt.decode(header[len('Bearer '):], verify=False)
+    except Exception:
+        return None
+
+    return {'idt': claims.get('idt'),
+            'acc': claims.get('acc'),
+            'pvd': claims.get('pvd'),
+            'rol': claims.get('rol') or [],
+            'adm': claims.get('adm') is True}
+
+
+def _body():
+    if not request.is_json:
+        return None
+
+    try:
+        return shape(json.loads(request.get_data(cache=True)))
+    except Exception:
+        return '<invalid>'
+
+
+def _before_request():
+    # /batch sub-requests are part of the captured /batch request.
+    if request.environ.get(VERIFIED_TOKEN_KEY) is not None:
+        return
+
+    if random.random() >= _config['sample_rate']:
+        return
+
+    request.environ[_CAPTURE_KEY] = (time.time(), time.perf_counter())
+
+
+def _after_request(response):
+    started = request.environ.pop(_CAPTURE_KEY, None)
+
+    if started is None:
+        return response
+
+    timestamp, start = started
+
+    if request.url_rule is not None:
+        route = request.url_rule.rule
+    else:
+        route = None
+
+    record = {
+        'timestamp': timestamp,
+        'method': request.method,
+        'path': request.path,
+        'query': _query(request.query_string.decode('latin-1')),
+        'route': route,
+        'headers': _headers(),
+        'auth': _auth(),
+        'body': _body(),
+        'request_size': request.content_length or 0,
+        'status': response.status_code,
+        'response_size': response.calculate_content_length(),
+        'duration': time.perf_counter() - start,
+    }
+
+    with _lock:
+        _pending.append(record)
+        full = len(_pending) >= _config['flush_size']
+
+    if full:
+        flush()
+
+    return response
+
+
+def flush():
+    """
+    Appends the captured requests to CAPTURE_FILE.
+    """
+    global _pending
+
+    with _lock:
+        records, _pending = _pending, []
+
+    if not records:
+        return
+
+    # Outside the lock so requests don't wait on the disk. Batches from
+    # concurrent flushes may land out of order; replay sorts by time.
+    lines = ''.join(json.dumps(record) + '\n' for record in records)
+
+    with _file_lock, open(_config['file'], 'a') as file:
+        file.write(lines)
@@ -0,0 +1,121 @@
+"""
+codec module. JSON encoding and decoding for requests and responses.
+
+Uses the standard library by default. orjson is faster and can be
+selected with JSON_BACKEND = 'orjson' when it is installed. Either way
+datetime, date, Decimal, Base models and non-string dictionary keys are
+encoded the same.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+import json
+
+from settings.base import Base
+
+try:
+    import orjson
+except ImportError:  # Optional accelerated backend.
+    orjson = None
+
+
+def default(o):
+    """
+    Encodes the types JSON doesn't know about.
+
+    Params:
+        o (object): The object to encode.
+
+    Returns:
+        (object): A JSON serializable representation of o.
+
+    Raises:
+        TypeError - o can not be encoded.
+    """
+    if isinstance(o, Base):
+        return o.json_serialize()
+    elif isinstance(o, (datetime, date)):
+        return o.isoformat()
+    elif isinstance(o, Decimal):
+        return str(o)
+
+    raise TypeError('%r is not JSON serializable' % o)
+
+
+# Encoders are built once and reused for every response.
+_compact_encoder = json.JSONEncoder(default=default, separators=(',', ':'))
+_pretty_encoder = json.JSONEncoder(default=default, indent=2)
+
+
+def _json_dumps(data, pretty):
+    encoder = _pretty_encoder if pretty else _compact_encoder
+    return encoder.encode(data).encode('utf-8')
+
+
+def _orjson_dumps(data, pretty):
+    # json.dumps turns int (and other scalar) keys into strings; orjson
+    # raises TypeError for them unless told otherwise.
+    option = orjson.OPT_NON_STR_KEYS
+    if pretty:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(data, default=default, option=option)
+
+
+_backends = {
+    'json': (_json_dumps, json.loads),
+}
+
+if orjson is not None:
+    _backends['orjson'] = (_orjson_dumps, orjson.loads)
+
+# See set_backend(); create_app() selects JSON_BACKEND.
+backend = 'json'
+_dumps, _loads = _backends[backend]
+
+
+def set_backend(name):
+    """
+    Selects the JSON backend.
+
+    Params:
+        name (string): 'json' or 'orjson'.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError - The backend is unknown or not installed.
+    """
+    global backend, _dumps, _loads
+
+    if name not in _backends:
+        raise ValueError('JSON backend not available: ' + name)
+
+    backend = name
+    _dumps, _loads = _backends[name]
+
+
+def dumps(data, pretty=False):
+    """
+    Params:
+        data (object): The object to encode.
+        pretty (bool, optional): Indent the output. Defaults to False.
+
+    Returns:
+        (bytes): UTF-8 encoded JSON.
+    """
+    return _dumps(data, pretty)
+
+
+def loads(data):
+    """
+    Params:
+        data (bytes): UTF-8 encoded JSON.
+
+    Returns:
+        (object): The decoded object.
+
+    Raises:
+        ValueError - data is not valid JSON.
+    """
+    return _loads(data)
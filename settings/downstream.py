@@ -0,0 +1,269 @@
+"""
+downstream module. Pooled keep-alive HTTP sessions for calls to other
+services, with per-service latency metrics.
+"""
+
+import app
+
+import copy
+import threading
+import time
+import urllib
+
+# Only these are retried. A retried POST could create things twice.
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+_lock = threading.Lock()
+_sessions = {}  # One session (and connection pool) per target host.
+_metrics = {}   # Latency counters per service.
+
+_flight_lock = threading.Lock()
+_flights = {}   # Calls in progress, by key. See coalesce().
+_recent = {}    # key: (expires, result) for the optional micro-cache.
+
+
+def _origin(url):
+    components = urllib.parse.urlparse(url)
+    return components.scheme + '://' + components.netloc
+
+
+def session_for(url):
+    """
+    Returns the pooled session for the host url points at, creating it
+    on first use.
+
+    Params:
+        url (string): Any URL on the target host.
+
+    Returns:
+        (Session): A requests session with keep-alive and retries.
+    """
+    origin = _origin(url)
+    session = _sessions.get(origin)
+
+    if session is not None:
+        return session
+
+    with _lock:
+        session = _sessions.get(origin)
+
+        if session is None:
+            # Imported here; requests is slow to import and most tools
+            # never make downstream calls.
+            import requests as url_request  # Not Flask's 'request'
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retries = Retry(total=app.config.get('SERVICE_RETRIES', 2),
+                            backoff_factor=0.1,
+                            status_forcelist=(502, 503, 504),
+                            method_whitelist=IDEMPOTENT_METHODS,
+                            raise_on_status=False)
+            # pool_block keeps the number of open connections bounded;
+            # extra callers wait for a free connection.
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=app.config.get('SERVICE_POOL_SIZE', 10),
+                pool_block=True,
+                max_retries=retries)
+
+            session = url_request.Session()
+            session.mount(origin, adapter)
+            _sessions[origin] = session
+
+    return session
+
+
+def request(service, method, url, headers=None, data=None, timeout=None):
+    """
+    Sends a request through the pooled session for url.
+
+    Params:
+        service (string): Name used for metrics, e.g. 'accounts'.
+        method (string): The HTTP method.
+        url (string): The full URL.
+        headers (dictionary, optional): Request headers.
+        data (bytes, optional): The request body.
+        timeout (tuple, optional): (connect, read) timeouts in seconds.
+                                   Defaults to SERVICE_CONNECT_TIMEOUT
+                                   and SERVICE_READ_TIMEOUT.
+
+    Returns:
+        (Response): A requests response object.
+
+    Raises:
+        RequestException - The request failed after any retries.
+    """
+    if timeout is None:
+        timeout = (app.config.get('SERVICE_CONNECT_TIMEOUT', 3.05),
+                   app.config.get('SERVICE_READ_TIMEOUT', 10))
+
+    session = session_for(url)
+    failed = True
+    start = time.perf_counter()
+
+    try:
+        response = session.request(method, url,
+                                   headers=headers,
+                                   data=data,
+                                   timeout=timeout)
+        failed = response.status_code >= 500
+    finally:
+        _record(service, time.perf_counter() - start, failed)
+
+    return response
+
+
+def _record(service, elapsed, failed):
+    with _lock:
+        counters = _metrics.get(service)
+
+        if counters is None:
+            counters = {'requests': 0, 'errors': 0,
+                        'seconds': 0.0, 'max_seconds': 0.0}
+            _metrics[service] = counters
+
+        counters['requests'] += 1
+        counters['seconds'] += elapsed
+        if failed:
+            counters['errors'] += 1
+        if elapsed > counters['max_seconds']:
+            counters['max_seconds'] = elapsed
+
+
+def stats():
+    """
+    Returns:
+        (dictionary): 'services' maps each service to its request, error
+                      and latency counters. 'pools' maps each target host
+                      to the connections opened and requests sent over
+                      them; 'reused' is how many requests went over an
+                      already open connection.
+    """
+    with _lock:
+        services = {name: dict(counters)
+                    for name, counters in _metrics.items()}
+        sessions = list(_sessions.items())
+
+    for counters in services.values():
+        requests = counters['requests']
+        counters['mean_seconds'] = (counters['seconds'] / requests
+                                    if requests else 0.0)
+
+    pools = {}
+    for origin, session in sessions:
+        adapter = session.get_adapter(origin)
+        pool = adapter.poolmanager.connection_from_url(origin)
+        pools[origin] = {'connections': pool.num_connections,
+                         'requests': pool.num_requests,
+                         'reused': pool.num_requests - pool.num_connections}
+
+    return {'services': services, 'pools': pools}
+
+
+class CoalescedCallFailed(Exception):
+    """
+    Raised in the callers sharing a coalesced call when its error can't
+    be handed to them as is: the thread making it was interrupted, e.g.
+    by KeyboardInterrupt or SystemExit, which only concern that thread,
+    or the exception could not be copied.
+    """
+
+
+class _Flight(object):
+    """
+    A call in progress that other threads can wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def coalesce(key, fn, ttl=0, cacheable=None):
+    """
+    Single-flight: concurrent callers with the same key share one call of
+    fn and its result (or exception) instead of each making their own.
+
+    Params:
+        key (tuple): Identifies identical calls.
+        fn (function): Makes the call. Called without arguments.
+        ttl (float, optional): Also keep the result for this many seconds
+                               and hand it to later callers. Defaults to 0.
+        cacheable (function, optional): Called with the result; only
+                                        results it accepts are kept.
+
+    Returns:
+        The result of fn.
+
+    Raises:
+        Whatever fn raised. Callers that only waited get their own copy
+        of the exception, chained to the original, or
+        CoalescedCallFailed if fn was stopped by something other than an
+        Exception.
+    """
+    now = time.monotonic()
+
+    with _flight_lock:
+        cached = _recent.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            _flights[key] = flight
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise _follower_error(flight.error) from flight.error
+        return flight.result
+
+    try:
+        flight.result = fn()
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flight_lock:
+            del _flights[key]
+
+            if (ttl > 0 and flight.error is None and
+                    (cacheable is None or cacheable(flight.result))):
+                _remember(key, flight.result, ttl)
+
+        flight.done.set()
+
+    return flight.result
+
+
+def _follower_error(error):
+    # Raising the leader's exception object in several threads at once
+    # would have them all rewrite its __traceback__.
+    if not isinstance(error, Exception):
+        return CoalescedCallFailed('The coalesced call was interrupted '
+                                        'by %s' % type(error).__name__)
+
+    try:
+        return copy.copy(error)
+    except Exception:
+        return CoalescedCallFailed('The coalesced call failed with %r'
+                                        % error)
+
+
+def _remember(key, result, ttl):
+    # Called with _flight_lock held.
+    now = time.monotonic()
+
+    if len(_recent) >= app.config.get('SERVICE_COALESCE_CACHE_SIZE', 1024):
+        for expired in [item for item, (expires, _) in _recent.items()
+                        if expires <= now]:
+            del _recent[expired]
+
+        if len(_recent) >= app.config.get('SERVICE_COALESCE_CACHE_SIZE', 1024):
+            _recent.clear()
+
+    _recent[key] = (now + ttl, result)
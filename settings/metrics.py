@@ -0,0 +1,374 @@
+"""
+metrics module. Per-route request counters, in-flight gauges and latency
+histograms, with the time spent in the database, bcrypt, JWT handling
+and downstream HTTP calls broken out, exposed in the Prometheus text
+format.
+
+Nothing is recorded unless METRICS_ENABLED is set: install() is then a
+no-op and timer() returns a shared do-nothing context manager. The
+metrics endpoint takes an admin JWT, like the admin endpoints.
+
+Work handed to other threads counts against the request when the
+callable is bound with wrap(). Component times are added up across
+threads, so concurrent calls can total more than the request took.
+"""
+
+from flask import Response, request
+
+from functools import wraps
+import threading
+import time
+
+# Components time is broken out into. See timer().
+COMPONENTS = ('db', 'bcrypt', 'jwt', 'http')
+
+# Any other method is counted as 'OTHER', so clients sending made-up
+# methods can't create new series.
+METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE',
+                     'OPTIONS'])
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+# Key of the in-progress request's frame in the WSGI environ.
+_FRAME_KEY = 'zapi.metrics'
+
+_lock = threading.Lock()
+_local = threading.local()
+
+_buckets = DEFAULT_BUCKETS
+_requests = {}    # (method, route, status): count
+_in_flight = {}   # (method, route): count
+_durations = {}   # (method, route): _Histogram
+_components = {}  # (route, component): _Histogram
+
+
+class _Histogram(object):
+    """
+    Cumulative-style histogram. counts[i] is the number of observations
+    in (buckets[i - 1], buckets[i]]; the last slot is +Inf.
+    """
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(_buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        for bound in _buckets:
+            if value <= bound:
+                break
+            index += 1
+
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Frame(object):
+    """
+    The in-progress request: its labels, start time and the seconds
+    spent per component so far.
+    """
+
+    __slots__ = ('method', 'route', 'start', 'status', 'components', 'lock')
+
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.start = time.perf_counter()
+        self.status = 500
+        self.components = dict.fromkeys(COMPONENTS, 0.0)
+        # Threads bound with wrap() add to components concurrently.
+        self.lock = threading.Lock()
+
+    def add(self, component, seconds):
+        with self.lock:
+            self.components[component] += seconds
+
+
+class _Timer(object):
+    """
+    Adds the time spent in the with block to a component of the frame.
+    """
+
+    __slots__ = ('frame', 'component', 'start')
+
+    def __init__(self, frame, component):
+        self.frame = frame
+        self.component = component
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.frame.add(self.component, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(component):
+    """
+    Times a block of work against the current request:
+
+        with metrics.timer('db'):
+            ...
+
+    Params:
+        component (string): One of COMPONENTS.
+
+    Returns:
+        A context manager. When metrics are off, or outside of a request
+        on this thread, it does nothing.
+    """
+    stack = getattr(_local, 'stack', None)
+
+    if not stack:
+        return _NULL_TIMER
+
+    return _Timer(stack[-1], component)
+
+
+def wrap(fn):
+    """
+    Binds fn to the current request, so timer() in it counts against
+    this request on another thread (e.g. in a ThreadPoolExecutor).
+    """
+    stack = getattr(_local, 'stack', None)
+
+    if not stack:
+        return fn
+
+    frame = stack[-1]
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+
+        stack.append(frame)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stack.pop()
+
+    return wrapper
+
+
+def install(flask_app):
+    """
+    Hooks the request counters into flask_app and adds the metrics
+    endpoint at METRICS_PATH, for admins only. Does nothing unless
+    METRICS_ENABLED.
+
+    Params:
+        flask_app (Flask): The application.
+    """
+    # Imported here: settings.request itself uses timer().
+    from settings.request import admin_required
+
+    global _buckets
+
+    if not flask_app.config.get('METRICS_ENABLED', False):
+        return
+
+    _buckets = tuple(flask_app.config.get('METRICS_BUCKETS') or
+                     DEFAULT_BUCKETS)
+
+    flask_app.before_request(_before_request)
+    flask_app.after_request(_after_request)
+    flask_app.teardown_request(_teardown_request)
+    flask_app.add_url_rule(flask_app.config.get('METRICS_PATH', '/metrics'),
+                           'metrics', admin_required(_metrics_endpoint),
+                           methods=['GET'])
+
+
+def _before_request():
+    # The rule, not the path, so /identities/<identity_id> is one series.
+    if request.url_rule is not None:
+        route = request.url_rule.rule
+    else:
+        route = 'unmatched'
+
+    method = request.method
+    if method not in METHODS:
+        method = 'OTHER'
+
+    frame = _Frame(method, route)
+    request.environ[_FRAME_KEY] = frame
+
+    # A stack: /batch dispatches sub-requests on the same thread.
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(frame)
+
+    key = (frame.method, frame.route)
+    with _lock:
+        _in_flight[key] = _in_flight.get(key, 0) + 1
+
+
+def _after_request(response):
+    frame = request.environ.get(_FRAME_KEY)
+
+    if frame is not None:
+        frame.status = response.status_code
+
+    return response
+
+
+def _teardown_request(exc):
+    frame = request.environ.pop(_FRAME_KEY, None)
+
+    if frame is None:
+        return
+
+    elapsed = time.perf_counter() - frame.start
+
+    stack = _local.stack
+    stack.pop()
+    if stack:
+        # Time a nested sub-request spent also belongs to its parent.
+        parent = stack[-1]
+        for component, seconds in frame.components.items():
+            if seconds:
+                parent.add(component, seconds)
+
+    key = (frame.method, frame.route)
+    with _lock:
+        _in_flight[key] -= 1
+
+        status_key = key + (str(frame.status),)
+        _requests[status_key] = _requests.get(status_key, 0) + 1
+
+        histogram = _durations.get(key)
+        if histogram is None:
+            histogram = _durations[key] = _Histogram()
+        histogram.observe(elapsed)
+
+        for component, seconds in frame.components.items():
+            if not seconds:
+                continue
+
+            component_key = (frame.route, component)
+            histogram = _components.get(component_key)
+            if histogram is None:
+                histogram = _components[component_key] = _Histogram()
+            histogram.observe(seconds)
+
+
+def _metrics_endpoint():
+    """
+    GET /metrics - Prometheus text exposition.
+    """
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\')
+            .replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def _labels(**labels):
+    return '{' + ','.join('%s="%s"' % (name, _escape(value))
+                          for name, value in sorted(labels.items())) + '}'
+
+
+def _render_histogram(lines, name, histogram, labels):
+    cumulative = 0
+    for bound, count in zip(_buckets + (float('inf'),), histogram.counts):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append('%s_bucket%s %d' % (name, _labels(le=le, **labels),
+                                         cumulative))
+
+    lines.append('%s_sum%s %r' % (name, _labels(**labels), histogram.sum))
+    lines.append('%s_count%s %d' % (name, _labels(**labels), histogram.count))
+
+
+def render():
+    """
+    Returns:
+        (string): All metrics in the Prometheus text format.
+    """
+    from settings import downstream
+    from settings.response import compression_stats
+
+    lines = []
+
+    with _lock:
+        lines.append('# HELP zapi_http_requests_total Requests handled, '
+                     'by route and status.')
+        lines.append('# TYPE zapi_http_requests_total counter')
+        for (method, route, status), count in sorted(_requests.items()):
+            lines.append('zapi_http_requests_total%s %d' % (
+                _labels(method=method, route=route, status=status), count))
+
+        lines.append('# HELP zapi_http_requests_in_flight Requests being '
+                     'handled right now.')
+        lines.append('# TYPE zapi_http_requests_in_flight gauge')
+        for (method, route), count in sorted(_in_flight.items()):
+            lines.append('zapi_http_requests_in_flight%s %d' % (
+                _labels(method=method, route=route), count))
+
+        lines.append('# HELP zapi_http_request_duration_seconds Request '
+                     'latency.')
+        lines.append('# TYPE zapi_http_request_duration_seconds histogram')
+        for (method, route), histogram in sorted(_durations.items()):
+            _render_histogram(lines, 'zapi_http_request_duration_seconds',
+                              histogram, {'method': method, 'route': route})
+
+        lines.append('# HELP zapi_http_request_component_seconds Time per '
+                     'request spent in db, bcrypt, jwt and http.')
+        lines.append('# TYPE zapi_http_request_component_seconds histogram')
+        for (route, component), histogram in sorted(_components.items()):
+            _render_histogram(lines, 'zapi_http_request_component_seconds',
+                              histogram,
+                              {'route': route, 'component': component})
+
+    services = downstream.stats()['services']
+
+    lines.append('# HELP zapi_downstream_requests_total Calls to other '
+                 'services.')
+    lines.append('# TYPE zapi_downstream_requests_total counter')
+    for service, counters in sorted(services.items()):
+        lines.append('zapi_downstream_requests_total%s %d' % (
+            _labels(service=service), counters['requests']))
+
+    lines.append('# TYPE zapi_downstream_errors_total counter')
+    for service, counters in sorted(services.items()):
+        lines.append('zapi_downstream_errors_total%s %d' % (
+            _labels(service=service), counters['errors']))
+
+    lines.append('# TYPE zapi_downstream_seconds_total counter')
+    for service, counters in sorted(services.items()):
+        lines.append('zapi_downstream_seconds_total%s %r' % (
+            _labels(service=service), counters['seconds']))
+
+    compression = compression_stats()
+    lines.append('# TYPE zapi_compressed_responses_total counter')
+    lines.append('zapi_compressed_responses_total %d' % compression['responses'])
+    lines.append('# TYPE zapi_compression_bytes_saved_total counter')
+    lines.append('zapi_compression_bytes_saved_total %d' %
+                 compression['bytes_saved'])
+
+    return '\n'.join(lines) + '\n'
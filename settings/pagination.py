@@ -0,0 +1,110 @@
+"""
+pagination module. Keyset pagination helpers for listing endpoints.
+
+A page is fetched with `WHERE key > last key seen ORDER BY key LIMIT n`,
+so every page costs the same no matter how deep into the table it is.
+The last key is handed to the client as an opaque continuation token.
+"""
+
+import app
+
+from werkzeug.exceptions import BadRequest
+
+from settings import codec
+
+import base64
+
+
+def schema(properties=None):
+    """
+    Params:
+        properties (dictionary, optional): Extra query params to accept.
+
+    Returns:
+        (dictionary): A query_params schema with 'limit' and 'cursor'.
+    """
+    schema = {
+        "type": "object",
+        "properties": {
+            "limit": {"type": "integer", "minimum": 1},
+            "cursor": {"type": "string", "minLength": 1, "maxLength": 200},
+        }
+    }
+
+    if properties:
+        schema['properties'].update(properties)
+
+    return schema
+
+
+def page_size(query_params):
+    """
+    Returns:
+        (int): The requested page size, capped at PAGE_SIZE_MAX.
+    """
+    limit = query_params.get('limit') or app.config.get('PAGE_SIZE', 50)
+    return min(limit, app.config.get('PAGE_SIZE_MAX', 200))
+
+
+def encode_cursor(key):
+    """
+    Params:
+        key (object): The key of the last row on a page.
+
+    Returns:
+        (string): An opaque continuation token.
+    """
+    token = base64.urlsafe_b64encode(codec.dumps([key]))
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_cursor(query_params, type):
+    """
+    Params:
+        query_params (dictionary): The validated query params.
+        type (type): The type the key must have, e.g. int or str.
+
+    Returns:
+        (object): The key to continue after, or None for the first page.
+
+    Raises:
+        BadRequest - The cursor is not one we issued.
+    """
+    token = query_params.get('cursor')
+
+    if token is None:
+        return None
+
+    try:
+        padding = '=' * (-len(token) % 4)
+        key, = codec.loads(base64.urlsafe_b64decode(token + padding))
+    except Exception:
+        raise BadRequest('Invalid cursor.')
+
+    if not isinstance(key, type) or isinstance(key, bool):
+        raise BadRequest('Invalid cursor.')
+
+    return key
+
+
+def page(items, limit, key):
+    """
+    Builds a page from rows fetched with `limit + 1`. The extra row only
+    tells us whether there is a next page.
+
+    Params:
+        items (array): Up to limit + 1 rows, in key order.
+        limit (int): The page size.
+        key (function): Returns the key of a row.
+
+    Returns:
+        (dictionary): 'items' on this page and the 'next' token, which
+                      is None on the last page.
+    """
+    next_cursor = None
+
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(key(items[-1]))
+
+    return {'items': items, 'next': next_cursor}
@@ -0,0 +1,247 @@
+"""
+profiling module. Runs a statistical profiler around a single request
+and writes the stacks it saw in the collapsed format flamegraph.pl and
+speedscope read ("module:function;module:function count" per line).
+
+A request is profiled when an admin sends the PROFILE_HEADER header, or
+at random with probability PROFILE_SAMPLE_RATE. With the header value
+'memory' (or PROFILE_TRACEMALLOC set) allocations are traced as well and
+written as a second collapsed file weighted by bytes. The file names are
+returned in the X-Profile-Id response header.
+
+Nothing is installed unless PROFILE_ENABLED is set.
+"""
+
+from flask import request
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# Key of the in-progress request's profile in the WSGI environ.
+_PROFILE_KEY = 'zapi.profile'
+
+_local = threading.local()
+# tracemalloc is process-wide, so only one request traces memory at once.
+_tracemalloc_lock = threading.Lock()
+
+_config = {}
+
+
+class _Sampler(threading.Thread):
+    """
+    Samples the stack of one thread every `interval` seconds and counts
+    how often each stack was seen.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+
+            if frame is None:
+                continue
+
+            stack = _collapse(frame)
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class _Profile(object):
+    """
+    The profiling state of one request.
+    """
+
+    __slots__ = ('name', 'sampler', 'memory', 'start')
+
+    def __init__(self, name, sampler, memory):
+        self.name = name
+        self.sampler = sampler
+        self.memory = memory
+        self.start = time.perf_counter()
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return '%s:%s' % (frame.f_globals.get('__name__', '?'), code.co_name)
+
+
+def _collapse(frame):
+    names = []
+
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+
+    names.reverse()  # Root first.
+    return ';'.join(names)
+
+
+def install(flask_app):
+    """
+    Hooks the profiler into flask_app. Does nothing unless
+    PROFILE_ENABLED.
+
+    Params:
+        flask_app (Flask): The application.
+    """
+    config = flask_app.config
+
+    if not config.get('PROFILE_ENABLED', False):
+        return
+
+    _config.update(
+        header=config.get('PROFILE_HEADER', 'X-Profile'),
+        sample_rate=config.get('PROFILE_SAMPLE_RATE', 0.0),
+        interval=config.get('PROFILE_INTERVAL', 0.001),
+        tracemalloc=config.get('PROFILE_TRACEMALLOC', False),
+        tracemalloc_frames=config.get('PROFILE_TRACEMALLOC_FRAMES', 25),
+        directory=config.get('PROFILE_DIR', 'profiles'))
+
+    os.makedirs(_config['directory'], exist_ok=True)
+
+    flask_app.before_request(_before_request)
+    flask_app.after_request(_after_request)
+    flask_app.teardown_request(_teardown_request)
+
+
+def _requested():
+    """
+    Returns:
+        (string): 'cpu' or 'memory' if this request should be profiled,
+                  otherwise None.
+    """
+    value = request.headers.get(_config['header'])
+
+    if value is not None:
+        # Only admins may ask for a profile; anyone else is ignored
+        # rather than refused, so the header can't be used to probe.
+        from settings.request import get_token
+
+        try:
+            encoded_jwt, decoded_token = get_token()
+        except Exception:
+            return None
+
+        if decoded_token.get('adm') is not True:
+            return None
+
+        return 'memory' if value.lower() == 'memory' else 'cpu'
+
+    rate = _config['sample_rate']
+    if rate and random.random() < rate:
+        return 'memory' if _config['tracemalloc'] else 'cpu'
+
+    return None
+
+
+def _before_request():
+    # /batch dispatches sub-requests on the same thread; the outer
+    # profile already covers them.
+    if getattr(_local, 'active', False):
+        return
+
+    mode = _requested()
+    if mode is None:
+        return
+
+    memory = False
+    if mode == 'memory' and _tracemalloc_lock.acquire(blocking=False):
+        tracemalloc.start(_config['tracemalloc_frames'])
+        memory = True
+
+    name = '%s-%s-%s' % (time.strftime('%Y%m%dT%H%M%S'),
+                         (request.endpoint or 'unmatched').replace('.', '_'),
+                         os.urandom(4).hex())
+
+    sampler = _Sampler(threading.get_ident(), _config['interval'])
+    sampler.start()
+
+    request.environ[_PROFILE_KEY] = _Profile(name, sampler, memory)
+    _local.active = True
+
+
+def _after_request(response):
+    profile = request.environ.get(_PROFILE_KEY)
+
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.name
+
+    return response
+
+
+def _teardown_request(exc):
+    profile = request.environ.pop(_PROFILE_KEY, None)
+
+    if profile is None:
+        return
+
+    _local.active = False
+    profile.sampler.stop()
+    elapsed = time.perf_counter() - profile.start
+
+    snapshot = None
+    if profile.memory:
+        try:
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+            _tracemalloc_lock.release()
+
+    try:
+        _write(profile.name + '.cpu.collapsed', profile.sampler.stacks)
+
+        if snapshot is not None:
+            _write(profile.name + '.alloc.collapsed', _allocations(snapshot))
+
+    except OSError:
+        logger.exception('Could not write profile %s', profile.name)
+        return
+
+    logger.info('Profiled %s %s: %.1fms, %d samples -> %s',
+                request.method, request.path, elapsed * 1000,
+                profile.sampler.samples, profile.name)
+
+
+def _allocations(snapshot):
+    """
+    Bytes still allocated at the end of the request, by allocation stack.
+    """
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+
+    stacks = {}
+    for statistic in snapshot.statistics('traceback'):
+        # Tracebacks are oldest frame first, as collapsed stacks are.
+        stack = ';'.join('%s:%d' % (frame.filename, frame.lineno)
+                         for frame in statistic.traceback)
+        stacks[stack] = stacks.get(stack, 0) + statistic.size
+
+    return stacks
+
+
+def _write(file_name, stacks):
+    path = os.path.join(_config['directory'], file_name)
+
+    with open(path, 'w') as file:
+        for stack, count in sorted(stacks.items()):
+            file.write('%s %d\n' % (stack, count))
@@ -4,20 +4,137 @@ requests module.
 
 import app
 
-from flask import request
+from flask import request, has_request_context
 from werkzeug.exceptions import BadRequest, Unauthorized
 
-import jwt
-import jsonschema
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from functools import wraps
+import re
+import threading
+import time
 import urllib
-import json
-import requests as url_request  # To avoid confusion with Flask's 'request'
 
+from settings import codec, downstream, metrics, routing, tracing
 
-def call(path, jwt, method='GET', data=None):
-    root = request.url_root
 
+# The result of one call made by call_many(). Exactly one of response
+# and error is set.
+CallResult = namedtuple('CallResult', ['response', 'error'])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def call(path, jwt, method='GET', data=None, timeout=None):
+    return _call(_root(), path, jwt, method, data, timeout)
+
+
+def call_many(calls, timeout=None):
+    """
+    Makes several downstream calls concurrently, so the total latency is
+    that of the slowest call rather than the sum.
+
+    Params:
+        calls (array): Dictionaries with the arguments of call(): 'path',
+                       'jwt' and optionally 'method', 'data' and
+                       'timeout' (seconds allowed for that call).
+        timeout (float, optional): Seconds allowed for all the calls
+                                   together. Defaults to no limit.
+
+    Returns:
+        (array): A CallResult per call, in the same order. Calls that
+                 failed or ran out of time have `error` set; the others
+                 are unaffected.
+
+    Each call is sent with what is left of its deadline as the request
+    timeout, so it gives up on its own around the time it is reported
+    as timed out. Cancelling on the deadline only stops calls that have
+    not started yet; one already in progress runs until that request
+    timeout fires, on a worker thread, and its result is discarded.
+    """
+    root = _root()  # The request is not available in the worker threads.
+    executor = _fan_out_executor()
+    start = time.monotonic()
+
+    futures = []
+    deadlines = []
+    for item in calls:
+        deadline = min(filter(None, [item.get('timeout'), timeout]),
+                       default=None)
+        deadline = deadline and start + deadline
+
+        # Keep the request's span and metrics on the pool thread.
+        call = metrics.wrap(tracing.wrap(_call_before))
+        futures.append(executor.submit(call,
+                                       deadline,
+                                       root,
+                                       item['path'],
+                                       item['jwt'],
+                                       item.get('method', 'GET'),
+                                       item.get('data')))
+        deadlines.append(deadline)
+
+    results = []
+    for future, deadline in zip(futures, deadlines):
+        remaining = None
+        if deadline is not None:
+            remaining = max(0, deadline - time.monotonic())
+
+        try:
+            results.append(CallResult(future.result(timeout=remaining), None))
+        except Exception as e:  # Includes TimeoutError for late calls.
+            future.cancel()
+            results.append(CallResult(None, e))
+
+    return results
+
+
+def _call_before(deadline, root, path, jwt, method, data):
+    """
+    Runs _call() for call_many() with the time left until deadline as
+    its timeout. A call that waited for a free worker past its deadline
+    is not sent at all.
+    """
+    timeout = None
+
+    if deadline is not None:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise TimeoutError('Deadline passed before the call started')
+
+    return _call(root, path, jwt, method, data, timeout)
+
+
+def _root():
+    """
+    Our own URL root, used to reach services without a routing table
+    entry. Outside of a request, e.g. in background jobs, it comes from
+    SERVICE_URL_ROOT.
+    """
+    if has_request_context():
+        return request.url_root
+    return app.config.get('SERVICE_URL_ROOT', 'http://localhost/')
+
+
+def _fan_out_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=app.config.get('SERVICE_FANOUT_WORKERS', 16))
+
+    return _executor
+
+
+def _url(root, path):
+    """
+    Where to send path when the service has no routing table entry:
+    the fixed local port in development, otherwise our own host.
+    """
     components = urllib.parse.urlparse(root)
     scheme = components.scheme
     hostname = components.hostname
@@ -36,17 +153,71 @@ def call(path, jwt, method='GET', data=None):
     # TODO Do this right
     url = scheme + '://' + hostname + ':' + str(port) + '/' + path
     # url = urllib.parse.urlunparse((scheme, hostname, str(port), path))
+    return url
+
+
+def _call(root, path, jwt, method, data, timeout):
+    # Timed here rather than around the request itself, so callers
+    # waiting on a coalesced call count the wait too.
+    with metrics.timer('http'):
+        if method == 'GET' and app.config.get('SERVICE_COALESCE', True):
+            # Identical GETs in flight at the same time (same path, same
+            # bearer token) share a single downstream request. Each caller
+            # decodes the body itself so nobody sees another's mutations.
+            req = downstream.coalesce(
+                ('GET', path, jwt),
+                lambda: _send(root, path, jwt, method, data, timeout),
+                ttl=app.config.get('SERVICE_COALESCE_TTL', 0),
+                cacheable=lambda req: req.status_code < 400)
+        else:
+            req = _send(root, path, jwt, method, data, timeout)
+
+    response = codec.loads(req.content)
+    return response
+
+
+def _send(root, path, jwt, method, data, timeout):
+    service = path.split('/', 1)[0]
+    service_route = routing.route(service)
+
+    if service_route is not None:
+        instance = service_route.acquire()
+        url = instance.url + '/' + path
+    else:
+        instance = None
+        url = _url(root, path)
+
     headers = {'Authorization': 'Bearer ' + jwt,
                'Content-Type': 'application/json'}
 
-    if method == 'GET':
-        req = url_request.get(url, headers=headers)
-    elif method == 'POST':
-        json_body = json.dumps(data)
-        req = url_request.post(url, headers=headers, data=json_body)
+    if method == 'POST':
+        json_body = codec.dumps(data)
+    else:
+        json_body = None
 
-    response = req.json()
-    return response
+    failed = True
+    try:
+        with tracing.span('http.client', 'CLIENT',
+                          **{'http.method': method,
+                             'http.url': url,
+                             'peer.service': service}) as span:
+            if span is not None:
+                headers['traceparent'] = span.traceparent()
+
+            req = downstream.request(service, method, url,
+                                     headers=headers,
+                                     data=json_body,
+                                     timeout=timeout)
+
+            if span is not None:
+                span.tag('http.status_code', req.status_code)
+
+        failed = req.status_code >= 500
+    finally:
+        if instance is not None:
+            service_route.release(instance, failed)
+
+    return req
 
     # try:
     #     auth_request = urllib2.Request(url)
@@ -61,9 +232,35 @@ def call(path, jwt, method='GET', data=None):
     #     raise Unauthorized('Malformed Authentication header')
 
 
-def _validate(dict, schema):
+# Compiled validators keyed by id() of the schema dict. The schema is kept
+# in the value so its id can not be reused by another object.
+_validators = {}
+
+
+def _validator(schema):
+    """
+    Returns a compiled validator for schema, building it on first use.
+    The schema itself is checked only once, here, instead of on every
+    request as jsonschema.validate() does.
+    """
+    cached = _validators.get(id(schema))
+
+    if cached is None or cached[0] is not schema:
+        import jsonschema
+
+        cls = jsonschema.validators.validator_for(schema)
+        cls.check_schema(schema)
+        cached = (schema, cls(schema))
+        _validators[id(schema)] = cached
+
+    return cached[1]
+
+
+def _validate(dict, validator):
+    import jsonschema
+
     try:
-        jsonschema.validate(dict, schema)
+        validator.validate(dict)
     except jsonschema.ValidationError as e:
         raise BadRequest(e.message)
     except Exception as e:  # Perhaps some other exception is thrown?
@@ -71,35 +268,191 @@ def _validate(dict, schema):
 
 
 def json_body(schema):
+    validator = _validator(schema)
+
     def json_body_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            try:
-                json_body = request.get_json()
-            except Exception:
-                raise BadRequest('JSON body required.')
+            if request.is_json:
+                try:
+                    json_body = codec.loads(request.get_data(cache=True))
+                except Exception:
+                    raise BadRequest('JSON body required.')
+            else:
+                json_body = None  # Same as get_json() for other types.
 
-            _validate(json_body, schema)
+            _validate(json_body, validator)
 
             return f(*args, json=json_body, **kwargs)
         return wrapper
     return json_body_decorator
 
 
+# Strict forms only: int() and float() also accept surrounding
+# whitespace, underscores ('1_000') and non-ASCII digits.
+_INTEGER = re.compile(r'-?[0-9]+\Z')
+_NUMBER = re.compile(r'-?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?\Z')
+
+_booleans = {'true': True, '1': True, 'false': False, '0': False}
+
+
+def _to_integer(value):
+    if not _INTEGER.match(value):
+        raise ValueError(value)
+    return int(value)
+
+
+def _to_number(value):
+    if not _NUMBER.match(value):
+        raise ValueError(value)
+    return float(value)
+
+
+def _to_boolean(value):
+    try:
+        return _booleans[value.lower()]
+    except KeyError:
+        raise ValueError(value)
+
+
+def _to_null(value):
+    if value not in ('', 'null'):
+        raise ValueError(value)
+    return None
+
+
+# Tried in this order when a property allows several types, so '1' is
+# an integer rather than a number or a boolean.
+_converters = (('integer', _to_integer),
+               ('number', _to_number),
+               ('boolean', _to_boolean),
+               ('null', _to_null))
+
+
+def _scalar_coercer(types):
+    converters = [convert for name, convert in _converters if name in types]
+
+    if not converters:
+        return None
+
+    keep_string = 'string' in types
+    expected = ' or '.join("'%s'" % type for type in types)
+
+    def coerce(value):
+        for convert in converters:
+            try:
+                return convert(value)
+            except ValueError:
+                pass
+
+        if keep_string:
+            return value
+
+        raise BadRequest('%r is not of type %s' % (value, expected))
+
+    return coerce
+
+
+def _unchanged(value):
+    return value
+
+
+def _items_coercer(property):
+    """
+    Builds the function that coerces the list of parts of a delimited
+    array param, for both a single `items` schema and a list of them.
+    """
+    items = property.get('items', {})
+
+    if not isinstance(items, list):
+        item = _coercer(items) or _unchanged
+        return lambda parts: [item(part) for part in parts]
+
+    positional = [_coercer(item) or _unchanged for item in items]
+    additional = property.get('additionalItems')
+    if isinstance(additional, dict):
+        rest = _coercer(additional) or _unchanged
+    else:
+        rest = _unchanged
+
+    def coerce(parts):
+        return [(positional[index] if index < len(positional) else rest)(part)
+                for index, part in enumerate(parts)]
+
+    return coerce
+
+
+def _coercer(property):
+    """
+    Builds the function that converts one query param string to the type
+    the schema property declares. Returns None when the string can be
+    used as is.
+    """
+    types = property.get('type')
+    if types is None:
+        types = []
+    elif not isinstance(types, list):
+        types = [types]
+
+    if 'array' in types:
+        # Arrays are passed as one delimited string, e.g. ?ids=1,2,3.
+        # 'delimiter' is our own keyword; jsonschema ignores it.
+        delimiter = property.get('delimiter', ',')
+        items = _items_coercer(property)
+
+        def coerce(value):
+            if value == '':
+                return []
+            return items(value.split(delimiter))
+    else:
+        coerce = _scalar_coercer(types)
+
+    enum = property.get('enum')
+    if enum is not None:
+        convert = coerce or _unchanged
+
+        def coerce(value):
+            converted = convert(value)
+            if converted not in enum:
+                raise BadRequest('%r is not one of %r' % (converted, enum))
+            return converted
+
+    return coerce
+
+
+def _coercion_plan(schema):
+    """
+    Returns a dictionary of param name to coercer for every property
+    of schema that is not a plain string.
+    """
+    plan = {}
+
+    for key, property in schema.get('properties', {}).items():
+        coerce = _coercer(property)
+        if coerce is not None:
+            plan[key] = coerce
+
+    return plan
+
+
 def query_params(schema):
+    validator = _validator(schema)
+    # URL query params are always strings. Work out once, from the types
+    # the schema declares, which ones need converting so validation
+    # against the schema will pass.
+    plan = _coercion_plan(schema)
+
     def query_params_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             query_params = request.args.to_dict()
 
-            for key, value in query_params.items():
-                # Because URL query params are always strings, we need to
-                # convert paramters that are integers from string to integer
-                # so validation against schema will pass.
-                if value.isnumeric():
-                    query_params[key] = int(value)
+            for key, coerce in plan.items():
+                value = query_params.get(key)
+                if value is not None:
+                    query_params[key] = coerce(value)
 
-            _validate(query_params, schema)
+            _validate(query_params, validator)
 
             return f(*args, query_params=query_params, **kwargs)
         return wrapper
@@ -139,21 +492,52 @@ def role_required(required_roles):
     return authorization_required_decorator
 
 
-# def admin_required(f):
-#     @wraps(f)
-#     def wrapper(*args, **kwargs):
+def admin_required(f):
+    """
+    Wrapper for endpoints only admin identities may use.
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+
+        encoded_jwt, decoded_token = get_token()
+        admin = decoded_token.get('adm')
+
+        if admin is not True:
+            raise Unauthorized('ACL Fail')
+
+        return f(*args, **kwargs)
+
+    return wrapper
 
-#         encoded_jwt, decoded_token = get_token()
-#         admin = decoded_token['admin']
 
-#         if admin is not True:
-#             raise Unauthorized
+def account_scope(account_id, identity_id=None):
+    """
+    The account a listing is limited to for the caller of the current
+    request. Admins, and an identity looking at itself, are not limited.
+
+    Params:
+        account_id (string): The JWT's account, as passed by
+                             role_required.
+        identity_id (string, optional): The identity being looked at.
 
-#         return f(*args,
-#                  jwt=encoded_jwt,
-#                  **kwargs)
+    Returns:
+        (string): The account to limit to, or None for no limit.
+
+    Raises:
+        Unauthorized - The caller is neither an admin nor on an account.
+    """
+    encoded_jwt, decoded_token = get_token()
 
-#     return wrapper
+    if decoded_token.get('adm') is True:
+        return None
+
+    if identity_id is not None and decoded_token.get('idt') == identity_id:
+        return None
+
+    if not account_id:
+        raise Unauthorized('ACL Fail')
+
+    return account_id
 
 
 # def verify(required_scope, jwt_scope):
@@ -182,7 +566,16 @@ def role_required(required_roles):
 #         raise Unauthorized('ACL Fail')
 
 
+# WSGI environ key under which an already verified token is passed to
+# sub-requests of /batch. Clients can't set environ keys directly.
+VERIFIED_TOKEN_KEY = 'zapi.verified_token'
+
+
 def get_token():
+    verified = request.environ.get(VERIFIED_TOKEN_KEY)
+    if verified is not None:
+        return verified
+
     authorization_header = request.headers.get('Authorization')
 
     if authorization_header is None:
@@ -195,6 +588,13 @@ def get_token():
     except Exception:
         raise Unauthorized('Malformed Authorization header')
 
+    with metrics.timer('jwt'):
+        decoded_token = _decode(encoded_jwt)
+
+    return encoded_jwt, decoded_token
+
+
+def _decode(encoded_jwt):
     try:
         algo = app.config['JWT_SERVICE_ALGO']
         secret_file = app.config['JWT_SERVICE_KEY_FILE']
@@ -205,6 +605,8 @@ def get_token():
     except Exception:
         raise Unauthorized('Bad signing info')
 
+    import jwt
+
     try:
         decoded_token = jwt.decode(
             encoded_jwt,
@@ -216,4 +618,43 @@ def get_token():
     except Exception:
         raise Unauthorized('JWT Bad')
 
-    return encoded_jwt, decoded_token
+    return decoded_token
+
+
+def create_jwt(jwt_dict):
+    """
+    Signs a service JWT, for calls this service makes on its own behalf.
+    The counterpart of get_token(): same key pair, issuer and audience.
+
+    Params:
+        jwt_dict (dictionary): The claims, e.g. 'idt', 'adm', 'acc',
+                               'pvd' and 'rol'.
+
+    Returns:
+        (tuple): The encoded JWT and the seconds it is valid for.
+
+    Raises:
+        IOError - The private key in JWT_SERVICE_KEY_FILE can't be read.
+    """
+    import jwt
+
+    algo = app.config['JWT_SERVICE_ALGO']
+    secret_file = app.config['JWT_SERVICE_KEY_FILE']
+    with open(secret_file + '.private', 'r') as file:
+        secret = file.read()
+
+    token_valid_period = app.config['JWT_SERVICE_TTL']
+    current_time = datetime.utcnow()
+
+    claims = dict(jwt_dict)
+    claims.update({
+        'iss': 'zapi-id',
+        'ttl': token_valid_period,
+        'exp': current_time + timedelta(seconds=token_valid_period),
+        'nbf': current_time - timedelta(seconds=60),
+        'iat': current_time,
+        'aud': ['zapi-rs'],
+    })
+
+    encoded_jwt = jwt.encode(claims, secret, algorithm=algo)
+    return encoded_jwt.decode('utf-8'), token_valid_period
@@ -2,8 +2,29 @@
 response module.
 """
 
-from flask import make_response
-import json
+import app
+
+from flask import make_response, request
+from werkzeug.http import quote_etag
+
+from settings import codec
+
+from functools import wraps
+import hashlib
+import threading
+import time
+import zlib
+
+# zlib wbits for each Content-Encoding we can produce.
+_encodings = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+_stats_lock = threading.Lock()
+_stats = {
+    'responses': 0,    # Responses that were compressed.
+    'bytes_in': 0,     # Their size before compression.
+    'bytes_out': 0,    # Their size after compression.
+    'cpu_seconds': 0.0,
+}
 
 
 def error_response(code, message, description):
@@ -24,7 +45,7 @@ def error_response(code, message, description):
     return json_response(status=code, data=dict)
 
 
-def json_response(status=200, data=None, headers=None):
+def json_response(status=200, data=None, headers=None, etag=None):
     """
     Helper to create an API response.
 
@@ -36,21 +57,181 @@ def json_response(status=200, data=None, headers=None):
                                     Sets or deletes cookie.
         temp_session (bool, optional): Whether session should have a
                                        limited length.
+        etag (string, optional): A strong ETag for the body, see etag().
+                                 If the request's If-None-Match matches,
+                                 a 304 is returned and data is never
+                                 serialized.
 
     Returns:
         (response): A flask response object.
     """
+    if etag is not None and status == 200 and _etag_matches(etag):
+        return not_modified(etag)
+
     if data is not None:
-        json_string = json.dumps(data,
-                                 indent=2,
-                                 default=lambda o: o.json_serialize())
+        # Compact unless JSON_PRETTY is set, e.g. for local development.
+        json_string = codec.dumps(data,
+                                  pretty=app.config.get('JSON_PRETTY', False))
     else:
-        json_string = ''
+        json_string = b''
 
     final_headers = {'Content-Type': 'application/json'}
 
+    if app.config.get('COMPRESSION_ENABLED', True):
+        final_headers['Vary'] = 'Accept-Encoding'
+        encoding = _negotiate_encoding(len(json_string))
+
+        if encoding:
+            json_string = _compress(json_string, encoding)
+            final_headers['Content-Encoding'] = encoding
+
+            if etag is not None:
+                etag = _encoded_etag(etag, encoding)
+
+    if etag is not None:
+        final_headers['ETag'] = quote_etag(etag)
+
     if headers:
         final_headers.update(headers)
 
     response = make_response(json_string, status, final_headers)
     return response
+
+
+def etag(*parts):
+    """
+    Builds a strong ETag from a cheap version token, such as an `updated`
+    timestamp. The request path and query are included so different
+    views of the same data get different tags.
+
+    Params:
+        parts: Anything that changes when the response body changes.
+
+    Returns:
+        (string): An unquoted ETag.
+    """
+    token = '|'.join([request.full_path] + [str(part) for part in parts])
+    return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+
+def _encoded_etag(etag, encoding):
+    # A compressed body is a different representation, so a strong ETag
+    # has to differ from the uncompressed one.
+    return etag + '-' + encoding
+
+
+def _etag_matches(etag):
+    if_none_match = request.if_none_match
+
+    if not if_none_match:
+        return False
+
+    return (if_none_match.contains_weak(etag) or
+            any(if_none_match.contains_weak(_encoded_etag(etag, encoding))
+                for encoding in _encodings))
+
+
+def not_modified(etag):
+    """
+    Returns:
+        (response): An empty 304 response for the given ETag.
+    """
+    headers = {'ETag': quote_etag(etag)}
+
+    if app.config.get('COMPRESSION_ENABLED', True):
+        headers['Vary'] = 'Accept-Encoding'
+
+    return make_response(b'', 304, headers)
+
+
+def conditional(version):
+    """
+    Decorator for read endpoints that answers If-None-Match with a 304
+    before the endpoint runs, so neither the stored procedures nor the
+    serializer are called for an unchanged resource.
+
+    Params:
+        version (function): Called with the endpoint's arguments. Returns
+                            a cheap version token for the resource, or
+                            None to skip the conditional handling.
+
+    Returns:
+        (function): The decorator.
+    """
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            token = version(*args, **kwargs)
+
+            if token is None:
+                return f(*args, **kwargs)
+
+            tag = etag(token)
+            if _etag_matches(tag):
+                return not_modified(tag)
+
+            response = f(*args, **kwargs)
+
+            if response.status_code == 200 and 'ETag' not in response.headers:
+                encoding = response.headers.get('Content-Encoding')
+                if encoding:
+                    tag = _encoded_etag(tag, encoding)
+                response.headers['ETag'] = quote_etag(tag)
+
+            return response
+        return wrapper
+    return conditional_decorator
+
+
+def _negotiate_encoding(size):
+    """
+    Picks the Content-Encoding for a body of the given size.
+
+    Returns:
+        (string): 'gzip' or 'deflate', or None to send the body as is.
+    """
+    if size < app.config.get('COMPRESSION_MIN_SIZE', 1024):
+        return None
+
+    accept = request.accept_encodings
+    gzip_quality = accept['gzip']
+    deflate_quality = accept['deflate']
+
+    if gzip_quality and gzip_quality >= deflate_quality:
+        return 'gzip'
+    elif deflate_quality:
+        return 'deflate'
+
+    return None
+
+
+def _compress(body, encoding):
+    # Python's zlib can't reset a compressor, and copying a primed one
+    # measured slower than creating a new one, so there is one per call.
+    start = time.thread_time()
+    compressor = zlib.compressobj(app.config.get('COMPRESSION_LEVEL', 6),
+                                  zlib.DEFLATED,
+                                  _encodings[encoding])
+    compressed = compressor.compress(body) + compressor.flush()
+    elapsed = time.thread_time() - start
+
+    with _stats_lock:
+        _stats['responses'] += 1
+        _stats['bytes_in'] += len(body)
+        _stats['bytes_out'] += len(compressed)
+        _stats['cpu_seconds'] += elapsed
+
+    return compressed
+
+
+def compression_stats():
+    """
+    Returns:
+        (dictionary): Counters for compressed responses: count, bytes
+                      before and after, bytes saved and CPU seconds spent.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+
+    stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+    return stats
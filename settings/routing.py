@@ -0,0 +1,138 @@
+"""
+routing module. Client-side load balancing for calls to other services.
+
+The routing table lists the instances of each service:
+
+    {"accounts": ["http://10.0.0.5:5003", "http://10.0.0.6:5003"]}
+
+It is read, in order of preference, from the SERVICE_ROUTES config
+value, the SERVICE_ROUTES environment variable (JSON) or the JSON file
+named by SERVICE_ROUTES_FILE (config or environment). Services that are
+not listed are reached the old way, see settings.request.call().
+"""
+
+import app
+
+import json
+import os
+import random
+import threading
+import time
+
+_lock = threading.Lock()
+_routes = None
+
+
+class Instance(object):
+    """
+    One instance of a service, with the bookkeeping used to pick it.
+    """
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.outstanding = 0   # Requests currently in flight.
+        self.failures = 0      # Consecutive failed requests.
+        self.ejected_until = 0.0
+
+
+class Route(object):
+    """
+    The instances of one service. Picks the less busy of two random
+    healthy instances ("power of two choices") and ejects instances
+    that keep failing for a while.
+    """
+
+    def __init__(self, urls):
+        self.instances = [Instance(url) for url in urls]
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns:
+            (Instance): The instance to send the next request to. Pass
+                        it to release() when the request is done.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            healthy = [instance for instance in self.instances
+                       if instance.ejected_until <= now]
+            # If everything is ejected, trying something beats failing.
+            candidates = healthy or self.instances
+
+            if len(candidates) > 1:
+                first, second = random.sample(candidates, 2)
+                instance = min(first, second,
+                               key=lambda item: item.outstanding)
+            else:
+                instance = candidates[0]
+
+            instance.outstanding += 1
+
+        return instance
+
+    def release(self, instance, failed):
+        """
+        Params:
+            instance (Instance): As returned by acquire().
+            failed (bool): The request failed with a connection error or
+                           a 5xx response.
+        """
+        with self.lock:
+            instance.outstanding -= 1
+
+            if not failed:
+                instance.failures = 0
+                return
+
+            instance.failures += 1
+            if instance.failures >= app.config.get('SERVICE_EJECT_FAILURES', 3):
+                instance.failures = 0
+                instance.ejected_until = (
+                    time.monotonic() +
+                    app.config.get('SERVICE_EJECT_SECONDS', 30))
+
+
+def _load_table():
+    table = app.config.get('SERVICE_ROUTES')
+
+    if table is None and os.environ.get('SERVICE_ROUTES'):
+        table = json.loads(os.environ['SERVICE_ROUTES'])
+
+    if table is None:
+        file_name = (app.config.get('SERVICE_ROUTES_FILE') or
+                     os.environ.get('SERVICE_ROUTES_FILE'))
+        if file_name:
+            with open(file_name, 'r') as file:
+                table = json.load(file)
+
+    return table or {}
+
+
+def route(service):
+    """
+    Params:
+        service (string): The service name, e.g. 'accounts'.
+
+    Returns:
+        (Route): The service's route, or None if it isn't in the table.
+    """
+    global _routes
+
+    if _routes is None:
+        with _lock:
+            if _routes is None:
+                _routes = {name: Route(urls)
+                           for name, urls in _load_table().items() if urls}
+
+    return _routes.get(service)
+
+
+def reload():
+    """
+    Drops the routing table so it is read again on the next call.
+    """
+    global _routes
+
+    with _lock:
+        _routes = None
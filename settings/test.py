@@ -11,7 +11,7 @@ global_account_id = 'f4f29c4f508aa8053788d57148140fe5b049ed900d01315eb04242c6951
 global_provider_id = '7148140fe5b049ed900d01315eb04242c69517e370f4f29c4f508aa8053788d5'
 
 
-def create_authorization_token(test, dict_params, roles=[]):
+def create_authorization_token(test, dict_params, roles=[], admin=False):
     algo = test.zapi_service_app.config['JWT_SERVICE_ALGO']
     secret_file = test.zapi_service_app.config['JWT_SERVICE_KEY_FILE']
     file_name = secret_file + '.private'
@@ -32,9 +32,11 @@ def create_authorization_token(test, dict_params, roles=[]):
         'nbf': date_before_valid,
         'iat': current_time,
         'aud': ['zapi-rs'],
+        'idt': dict_params.get('identity_id'),
         'acc': dict_params.get('account_id'),
         'pvd': dict_params.get('provider_id'),
-        'rol': roles
+        'rol': roles,
+        'adm': admin
     }
 
     encoded_jwt = jwt.encode(jwt_dict, secret, algorithm=algo)
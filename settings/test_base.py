@@ -0,0 +1,107 @@
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+from settings.base import Base
+
+
+class Row(Base):
+
+    fields = ('row_id', 'created', 'amount', 'status')
+
+    defaults = {'status': 'active'}
+
+    def __init__(self, dict):
+        self.row_id = dict.get('row_id')
+        self.created = dict.get('created')
+        self.amount = dict.get('amount')
+        self.status = dict.get('status')
+
+    def json_keys(self):
+        return ['row_id', 'created', 'amount', 'status']
+
+
+class DetailedRow(Row):
+
+    fields = Row.fields + ('detail',)
+
+
+class Legacy(Base):
+
+    def __init__(self, dict):
+        self.__dict__.update(dict)
+
+    def json_keys(self):
+        return ['when', 'price']
+
+
+class Timestamp(datetime):
+    pass
+
+
+class Money(Decimal):
+    pass
+
+
+class SerializerTestCase(unittest.TestCase):
+
+    def test_converts_known_types(self):
+        row = Row({'row_id': 1, 'created': datetime(2018, 1, 2, 3, 4, 5),
+                   'amount': Decimal('1.50'), 'status': 'active'})
+        self.assertEqual(row.json_serialize(),
+                         {'row_id': 1, 'created': '2018-01-02T03:04:05',
+                          'amount': '1.50', 'status': 'active'})
+
+    def test_converts_subclasses(self):
+        row = Row({'row_id': 1, 'created': Timestamp(2018, 1, 2),
+                   'amount': Money('2'), 'status': None})
+        self.assertEqual(row.json_serialize(['created', 'amount']),
+                         {'created': '2018-01-02T00:00:00', 'amount': '2'})
+
+    def test_keys_filter(self):
+        row = Row({'row_id': 1, 'status': 'active'})
+        self.assertEqual(row.json_serialize(['status', 'unknown']),
+                         {'status': 'active'})
+
+    def test_unset_fields_are_skipped(self):
+        row = Row.__new__(Row)
+        row.row_id = 7
+        self.assertEqual(row.json_serialize(), {'row_id': 7})
+
+    def test_without_fields(self):
+        legacy = Legacy({'when': date(2018, 1, 2), 'price': Decimal('3'),
+                         'hidden': 1})
+        self.assertEqual(legacy.json_serialize(),
+                         {'when': '2018-01-02', 'price': '3'})
+
+
+class ModelMetaTestCase(unittest.TestCase):
+
+    def test_fields_become_slots(self):
+        self.assertEqual(Row.__slots__,
+                         ('row_id', 'created', 'amount', 'status'))
+        self.assertFalse(hasattr(Row({}), '__dict__'))
+
+    def test_inherited_slots_are_reused(self):
+        self.assertEqual(DetailedRow.__slots__, ('detail',))
+
+    def test_collision_with_base_attribute(self):
+        with self.assertRaises(TypeError):
+            class Broken(Base):
+                fields = ('row_id', 'defaults')
+
+
+class FromRowsTestCase(unittest.TestCase):
+
+    def test_builds_in_column_order(self):
+        rows = Row.from_rows(('amount', 'row_id', 'status'),
+                             [(Decimal('1'), 1, None), (None, 2, 'locked')])
+
+        self.assertEqual([(row.row_id, row.amount, row.status, row.created)
+                          for row in rows],
+                         [(1, Decimal('1'), 'active', None),
+                          (2, None, 'locked', None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
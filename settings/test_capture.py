@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from settings import capture
+
+
+class CaptureTestCase(unittest.TestCase):
+
+    def setUp(self):
+        file = tempfile.NamedTemporaryFile(suffix='.ndjson', delete=False)
+        file.close()
+        self.file = file.name
+        self.addCleanup(os.remove, self.file)
+
+        self.app = Flask(__name__)
+        self.app.config.update(CAPTURE_ENABLED=True,
+                               CAPTURE_FILE=self.file,
+                               CAPTURE_FLUSH_SIZE=100,
+                               CAPTURE_REDACT=('X-Api-Key',),
+                               CAPTURE_QUERY_KEEP=('limit', 'X-Api-Key'))
+
+        @self.app.route('/items')
+        def items():
+            return 'ok'
+
+        with mock.patch('atexit.register'):
+            capture.install(self.app)
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        del capture._pending[:]
+        capture._config.clear()
+
+    def records(self):
+        capture.flush()
+        with open(self.file) as file:
+            return [json.loads(line) for line in file]
+
+    def test_query_values_are_redacted_unless_kept(self):
+        self.client.get('/items?limit=20&cursor=abc&x-api-key=secret')
+
+        record, = self.records()
+
+        self.assertEqual(record['query'],
+                         'limit=20&cursor=%3Cstr%3A3%3E'
+                         '&x-api-key=%3Cstr%3A6%3E')
+        self.assertEqual(record['route'], '/items')
+
+    def test_secret_headers_are_not_kept(self):
+        self.client.get('/items', headers={'Authorization': 'Bearer x',
+                                           'X-Api-Key': 'secret',
+                                           'X-Other': 'kept'})
+
+        headers = self.records()[0]['headers']
+
+        self.assertNotIn('Authorization', headers)
+        self.assertNotIn('X-Api-Key', headers)
+        self.assertEqual(headers['X-Other'], 'kept')
+
+    def test_claims_are_kept_for_replay(self):
+        import jwt
+
+        token = jwt.encode({'idt': 'i1', 'acc': 'a1', 'pvd': 'p1',
+                            'rol': ['role_read'], 'adm': False,
+                            'exp': 0}, 'secret').decode('utf-8')
+
+        self.client.get('/items',
+                        headers={'Authorization': 'Bearer ' + token})
+
+        self.assertEqual(self.records()[0]['auth'],
+                         {'idt': 'i1', 'acc': 'a1', 'pvd': 'p1',
+                          'rol': ['role_read'], 'adm': False})
+
+    def test_flush_writes_outside_the_lock(self):
+        self.client.get('/items')
+        real_open = open
+
+        def checked_open(*args, **kwargs):
+            self.assertFalse(capture._lock.locked())
+            return real_open(*args, **kwargs)
+
+        with mock.patch('builtins.open', checked_open):
+            capture.flush()
+
+        self.assertEqual(len(self.records()), 1)
+        self.assertEqual(capture._pending, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
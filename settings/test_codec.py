@@ -0,0 +1,76 @@
+import json
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+
+from settings import codec
+from settings.base import Base
+
+
+class Item(Base):
+
+    fields = ('item_id', 'price', 'updated')
+
+    def __init__(self, item_id, price, updated):
+        self.item_id = item_id
+        self.price = price
+        self.updated = updated
+
+    def json_keys(self):
+        return ['item_id', 'price', 'updated']
+
+
+PAYLOAD = {
+    'items': [Item(1, Decimal('9.99'), datetime(2018, 1, 2, 3, 4, 5))],
+    'day': date(2018, 1, 2),
+    'counts': {1: 'one', 2: 'two'},
+    'none': None,
+}
+
+EXPECTED = {
+    'items': [{'item_id': 1, 'price': '9.99',
+               'updated': '2018-01-02T03:04:05'}],
+    'day': '2018-01-02',
+    'counts': {'1': 'one', '2': 'two'},
+    'none': None,
+}
+
+
+class CodecTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        codec.set_backend('json')
+
+    def test_standard_library_is_the_default(self):
+        self.assertEqual(codec.backend, 'json')
+
+    def test_every_backend_encodes_the_same(self):
+        for backend in sorted(codec._backends):
+            codec.set_backend(backend)
+
+            for pretty in (False, True):
+                encoded = codec.dumps(PAYLOAD, pretty=pretty)
+                self.assertIsInstance(encoded, bytes)
+                self.assertEqual(json.loads(encoded), EXPECTED,
+                                 (backend, pretty))
+
+    def test_compact_by_default(self):
+        self.assertEqual(codec.dumps({'a': [1, 2]}), b'{"a":[1,2]}')
+
+    def test_loads(self):
+        for backend in sorted(codec._backends):
+            codec.set_backend(backend)
+            self.assertEqual(codec.loads(b'{"a": [1, 2.5, null]}'),
+                             {'a': [1, 2.5, None]})
+
+    def test_unknown_type(self):
+        with self.assertRaises(TypeError):
+            codec.dumps({'a': object()})
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            codec.set_backend('simplejson')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import threading
+import time
+import unittest
+
+from flask import Flask
+
+from settings import downstream
+
+
+class CoalesceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.context = Flask(__name__).app_context()
+        self.context.push()
+        downstream._recent.clear()
+
+    def tearDown(self):
+        downstream._recent.clear()
+        self.context.pop()
+
+    def share(self, fn, followers=3):
+        """
+        Runs fn as the leader of a flight while `followers` threads join
+        it. Returns (leader outcome, follower outcomes), each either
+        ('result', value) or ('error', exception).
+        """
+        key = ('GET', self.id())
+        started = threading.Event()
+        release = threading.Event()
+        outcomes = []
+        lock = threading.Lock()
+
+        def leader_fn():
+            started.set()
+            release.wait(5)
+            return fn()
+
+        def run(call):
+            try:
+                outcome = ('result', call())
+            except BaseException as e:
+                outcome = ('error', e)
+            with lock:
+                outcomes.append(outcome)
+
+        leader = threading.Thread(
+            target=run, args=(lambda: downstream.coalesce(key, leader_fn),))
+        leader.start()
+        started.wait(5)
+
+        threads = [threading.Thread(
+            target=run,
+            args=(lambda: downstream.coalesce(key, self.fail),))
+            for _ in range(followers)]
+        for thread in threads:
+            thread.start()
+
+        # Give the followers time to join the flight before it lands.
+        time.sleep(0.1)
+        release.set()
+
+        for thread in [leader] + threads:
+            thread.join(5)
+
+        return outcomes
+
+    def test_followers_share_the_result(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return 'body'
+
+        outcomes = self.share(fn)
+
+        self.assertEqual(outcomes, [('result', 'body')] * 4)
+        self.assertEqual(calls, [1])
+
+    def test_followers_get_their_own_error(self):
+        def fn():
+            raise ValueError('boom')
+
+        outcomes = self.share(fn)
+        errors = [error for kind, error in outcomes]
+
+        self.assertTrue(all(kind == 'error' for kind, error in outcomes))
+        self.assertTrue(all(isinstance(error, ValueError)
+                            for error in errors))
+        self.assertEqual(len(set(map(id, errors))), 4)
+        self.assertTrue(all(error.args == ('boom',) for error in errors))
+
+    def test_interrupted_leader(self):
+        def fn():
+            raise KeyboardInterrupt()
+
+        outcomes = self.share(fn)
+        kinds = sorted(type(error).__name__ for kind, error in outcomes)
+
+        self.assertEqual(kinds, ['CoalescedCallFailed'] * 3 +
+                                ['KeyboardInterrupt'])
+        self.assertEqual(downstream._flights, {})
+
+    def test_ttl_keeps_cacheable_results(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(downstream.coalesce('key', fn, ttl=60), 1)
+        self.assertEqual(downstream.coalesce('key', fn, ttl=60), 1)
+        self.assertEqual(downstream.coalesce('other', fn, ttl=60,
+                                             cacheable=lambda result: False),
+                         2)
+        self.assertEqual(downstream.coalesce('other', fn, ttl=60), 3)
+
+    def test_errors_are_not_kept(self):
+        def fn():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            downstream.coalesce('key', fn, ttl=60)
+        self.assertEqual(downstream.coalesce('key', lambda: 'ok', ttl=60),
+                         'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from flask import Flask
+
+from settings import metrics
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        for series in (metrics._requests, metrics._in_flight,
+                       metrics._durations, metrics._components):
+            series.clear()
+
+        self.app = Flask(__name__)
+        self.app.config.update(METRICS_ENABLED=True,
+                               METRICS_BUCKETS=(0.1, 1.0))
+
+        @self.app.route('/items/<item_id>', methods=['GET', 'POST'])
+        def item(item_id):
+            with metrics.timer('db'):
+                pass
+            return 'ok'
+
+        @self.app.route('/fan-out')
+        def fan_out():
+            def call():
+                with metrics.timer('http'):
+                    return metrics.timer('http') is not metrics._NULL_TIMER
+
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                bound = executor.submit(metrics.wrap(call)).result()
+                unbound = executor.submit(call).result()
+            return '%s,%s' % (bound, unbound)
+
+        metrics.install(self.app)
+        self.addCleanup(setattr, metrics, '_buckets',
+                        metrics.DEFAULT_BUCKETS)
+
+        self.client = self.app.test_client()
+
+    def test_disabled(self):
+        flask_app = Flask(__name__)
+        metrics.install(flask_app)
+
+        self.assertEqual(flask_app.before_request_funcs, {})
+        self.assertIs(metrics.timer('db'), metrics._NULL_TIMER)
+
+    def test_counts_by_route_rule(self):
+        self.client.get('/items/1')
+        self.client.get('/items/2')
+        self.client.post('/items/3')
+
+        rendered = metrics.render()
+
+        self.assertIn('zapi_http_requests_total{method="GET",'
+                      'route="/items/<item_id>",status="200"} 2', rendered)
+        self.assertIn('zapi_http_requests_total{method="POST",'
+                      'route="/items/<item_id>",status="200"} 1', rendered)
+        self.assertIn('zapi_http_requests_in_flight{method="GET",'
+                      'route="/items/<item_id>"} 0', rendered)
+
+    def test_histograms(self):
+        self.client.get('/items/1')
+
+        rendered = metrics.render()
+
+        self.assertIn('zapi_http_request_duration_seconds_bucket{le="0.1",'
+                      'method="GET",route="/items/<item_id>"} 1', rendered)
+        self.assertIn('zapi_http_request_duration_seconds_bucket{le="+Inf",'
+                      'method="GET",route="/items/<item_id>"} 1', rendered)
+        self.assertIn('zapi_http_request_duration_seconds_count{'
+                      'method="GET",route="/items/<item_id>"} 1', rendered)
+        self.assertIn('zapi_http_request_component_seconds_count{'
+                      'component="db",route="/items/<item_id>"} 1', rendered)
+
+    def test_wrap_counts_other_threads_against_the_request(self):
+        response = self.client.get('/fan-out')
+
+        self.assertEqual(response.data, b'True,False')
+        self.assertIn('zapi_http_request_component_seconds_count{'
+                      'component="http",route="/fan-out"} 1',
+                      metrics.render())
+
+    def test_wrap_outside_a_request(self):
+        def fn():
+            pass
+
+        self.assertIs(metrics.wrap(fn), fn)
+
+    def test_unknown_methods_are_one_series(self):
+        for method in ('BREW', 'PROPFIND', 'X' * 100):
+            self.client.open('/nowhere', method=method)
+
+        rendered = metrics.render()
+
+        self.assertIn('zapi_http_requests_total{method="OTHER",'
+                      'route="unmatched",status="404"} 3', rendered)
+        self.assertNotIn('BREW', rendered)
+
+    def test_label_escaping(self):
+        self.assertEqual(metrics._labels(route='a"b\\c\nd'),
+                         '{route="a\\"b\\\\c\\nd"}')
+
+    def test_endpoint_needs_admin(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+        with mock.patch('settings.request._decode',
+                        return_value={'adm': False}):
+            response = self.client.get(
+                '/metrics', headers={'Authorization': 'Bearer token'})
+        self.assertEqual(response.status_code, 401)
+
+        with mock.patch('settings.request._decode',
+                        return_value={'adm': True}):
+            response = self.client.get(
+                '/metrics', headers={'Authorization': 'Bearer token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE zapi_http_requests_total counter',
+                      response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
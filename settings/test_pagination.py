@@ -0,0 +1,64 @@
+import unittest
+
+from flask import Flask
+from werkzeug.exceptions import BadRequest
+
+from settings import pagination
+
+
+class PaginationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(PAGE_SIZE=50, PAGE_SIZE_MAX=200)
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_schema(self):
+        schema = pagination.schema({'name': {'type': 'string'}})
+        self.assertEqual(sorted(schema['properties']),
+                         ['cursor', 'limit', 'name'])
+
+    def test_page_size(self):
+        self.assertEqual(pagination.page_size({}), 50)
+        self.assertEqual(pagination.page_size({'limit': 10}), 10)
+        self.assertEqual(pagination.page_size({'limit': 1000}), 200)
+
+    def test_cursor_round_trip(self):
+        for key, type in (('abc', str), (42, int),
+                          (['f4f2', 3], list)):
+            cursor = pagination.encode_cursor(key)
+            self.assertNotIn('=', cursor)
+            self.assertEqual(
+                pagination.decode_cursor({'cursor': cursor}, type), key)
+
+    def test_first_page(self):
+        self.assertIsNone(pagination.decode_cursor({}, str))
+
+    def test_invalid_cursor(self):
+        for cursor in ('not base64!', 'e30', pagination.encode_cursor(1)):
+            with self.assertRaises(BadRequest):
+                pagination.decode_cursor({'cursor': cursor}, str)
+
+    def test_bool_is_not_an_int(self):
+        with self.assertRaises(BadRequest):
+            pagination.decode_cursor(
+                {'cursor': pagination.encode_cursor(True)}, int)
+
+    def test_page_with_more(self):
+        page = pagination.page([1, 2, 3], 2, lambda item: item * 10)
+
+        self.assertEqual(page['items'], [1, 2])
+        self.assertEqual(
+            pagination.decode_cursor({'cursor': page['next']}, int), 20)
+
+    def test_last_page(self):
+        self.assertEqual(pagination.page([1, 2], 2, str),
+                         {'items': [1, 2], 'next': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
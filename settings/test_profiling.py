@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from settings import profiling
+
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(profiling._config.clear)
+
+        self.app = Flask(__name__)
+        self.app.config.update(PROFILE_ENABLED=True,
+                               PROFILE_INTERVAL=0.001,
+                               PROFILE_DIR=self.directory)
+
+        @self.app.route('/slow')
+        def slow():
+            time.sleep(0.05)
+            return 'ok'
+
+        @self.app.route('/broken')
+        def broken():
+            raise ValueError('boom')
+
+        profiling.install(self.app)
+
+        self.client = self.app.test_client()
+
+    def get(self, path, profile=None, admin=True):
+        headers = {}
+        if profile is not None:
+            headers = {'X-Profile': profile,
+                       'Authorization': 'Bearer token'}
+
+        with mock.patch('settings.request._decode',
+                        return_value={'adm': admin}):
+            return self.client.get(path, headers=headers)
+
+    def files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_writes_collapsed_stacks(self):
+        response = self.get('/slow', 'cpu')
+        name = response.headers['X-Profile-Id']
+
+        self.assertEqual(self.files(), [name + '.cpu.collapsed'])
+        with open(os.path.join(self.directory,
+                               name + '.cpu.collapsed')) as file:
+            lines = file.read().splitlines()
+
+        # The view sleeps, so most samples end in it.
+        stacks = dict(line.rsplit(' ', 1) for line in lines)
+        self.assertTrue(any(stack.endswith(':slow') for stack in stacks))
+        self.assertTrue(all(int(count) > 0 for count in stacks.values()))
+
+    def test_header_is_ignored_for_non_admins(self):
+        response = self.get('/slow', 'cpu', admin=False)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(self.files(), [])
+
+    def test_header_without_a_token_is_ignored(self):
+        response = self.client.get('/slow', headers={'X-Profile': 'cpu'})
+
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(self.files(), [])
+
+    def test_active_is_reset_after_the_request(self):
+        self.get('/slow', 'cpu')
+        self.assertFalse(profiling._local.active)
+
+        response = self.get('/broken', 'cpu')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(profiling._local.active)
+
+    def test_memory_releases_the_tracemalloc_lock(self):
+        response = self.get('/slow', 'memory')
+        name = response.headers['X-Profile-Id']
+
+        self.assertEqual(self.files(), [name + '.alloc.collapsed',
+                                        name + '.cpu.collapsed'])
+        self.assertFalse(profiling._tracemalloc_lock.locked())
+        self.assertFalse(tracemalloc.is_tracing())
+
+        self.get('/broken', 'memory')
+
+        self.assertFalse(profiling._tracemalloc_lock.locked())
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_sampled_without_the_header(self):
+        profiling._config['sample_rate'] = 1.0
+
+        response = self.client.get('/slow')
+
+        self.assertIn('X-Profile-Id', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+
+from flask import Flask
+from werkzeug.exceptions import BadRequest
+
+from settings.request import _coercer, _coercion_plan, query_params
+
+
+class CoercionTestCase(unittest.TestCase):
+
+    def test_integer(self):
+        coerce = _coercer({'type': 'integer'})
+        self.assertEqual(coerce('12'), 12)
+        self.assertEqual(coerce('-3'), -3)
+
+    def test_integer_is_strict(self):
+        coerce = _coercer({'type': 'integer'})
+        for value in (' 12 ', '1_000', '1.5', '', '١', '+'):
+            with self.assertRaises(BadRequest):
+                coerce(value)
+
+    def test_number_is_strict(self):
+        coerce = _coercer({'type': 'number'})
+        self.assertEqual(coerce('1.5'), 1.5)
+        self.assertEqual(coerce('2e3'), 2000.0)
+        for value in (' 1.5', '1_0', 'nan', 'inf', ''):
+            with self.assertRaises(BadRequest):
+                coerce(value)
+
+    def test_boolean(self):
+        coerce = _coercer({'type': 'boolean'})
+        self.assertIs(coerce('TRUE'), True)
+        self.assertIs(coerce('0'), False)
+        with self.assertRaises(BadRequest):
+            coerce('yes')
+
+    def test_string_is_not_in_plan(self):
+        self.assertIsNone(_coercer({'type': 'string'}))
+        self.assertEqual(_coercion_plan({'properties': {
+            'name': {'type': 'string'},
+            'limit': {'type': 'integer'},
+        }}).keys(), {'limit'})
+
+    def test_union_with_null(self):
+        coerce = _coercer({'type': ['integer', 'null']})
+        self.assertEqual(coerce('7'), 7)
+        self.assertIsNone(coerce('null'))
+        self.assertIsNone(coerce(''))
+        with self.assertRaises(BadRequest) as raised:
+            coerce('x')
+        self.assertIn("'integer' or 'null'", raised.exception.description)
+
+    def test_union_with_string_keeps_the_string(self):
+        coerce = _coercer({'type': ['integer', 'string']})
+        self.assertEqual(coerce('7'), 7)
+        self.assertEqual(coerce('seven'), 'seven')
+
+    def test_array(self):
+        coerce = _coercer({'type': 'array', 'items': {'type': 'integer'}})
+        self.assertEqual(coerce('1,2,3'), [1, 2, 3])
+        self.assertEqual(coerce(''), [])
+
+    def test_array_delimiter(self):
+        coerce = _coercer({'type': 'array', 'delimiter': '|',
+                           'items': {'type': 'boolean'}})
+        self.assertEqual(coerce('true|false'), [True, False])
+
+    def test_tuple_items(self):
+        coerce = _coercer({'type': 'array',
+                           'items': [{'type': 'integer'},
+                                     {'type': 'boolean'}],
+                           'additionalItems': {'type': 'number'}})
+        self.assertEqual(coerce('1,true,2.5,3'), [1, True, 2.5, 3.0])
+
+    def test_tuple_items_without_additional_items(self):
+        coerce = _coercer({'type': 'array', 'items': [{'type': 'integer'}]})
+        self.assertEqual(coerce('1,a'), [1, 'a'])
+
+    def test_enum(self):
+        coerce = _coercer({'type': 'integer', 'enum': [10, 20]})
+        self.assertEqual(coerce('10'), 10)
+        with self.assertRaises(BadRequest):
+            coerce('15')
+
+
+class QueryParamsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+
+        @query_params({'type': 'object',
+                       'properties': {
+                           'limit': {'type': 'integer', 'minimum': 1},
+                           'ids': {'type': 'array',
+                                   'items': {'type': 'integer'}},
+                           'after': {'type': ['string', 'null']},
+                       }})
+        def view(query_params):
+            return query_params
+
+        self.view = view
+
+    def call(self, query_string):
+        with self.app.test_request_context('/?' + query_string):
+            return self.view()
+
+    def test_coerces_and_validates(self):
+        self.assertEqual(self.call('limit=5&ids=1,2&after=abc'),
+                         {'limit': 5, 'ids': [1, 2], 'after': 'abc'})
+
+    def test_schema_violation(self):
+        with self.assertRaises(BadRequest):
+            self.call('limit=0')
+
+    def test_bad_integer(self):
+        with self.assertRaises(BadRequest):
+            self.call('limit=%205')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from settings import routing
+
+
+class RoutingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(SERVICE_EJECT_FAILURES=2,
+                               SERVICE_EJECT_SECONDS=30)
+        self.context = self.app.app_context()
+        self.context.push()
+        routing.reload()
+
+    def tearDown(self):
+        routing.reload()
+        self.context.pop()
+
+    def test_unlisted_service(self):
+        self.app.config['SERVICE_ROUTES'] = {'accounts': ['http://a']}
+        self.assertIsNone(routing.route('billing'))
+
+    def test_table_from_config(self):
+        self.app.config['SERVICE_ROUTES'] = {
+            'accounts': ['http://a/', 'http://b'], 'empty': []}
+
+        route = routing.route('accounts')
+        self.assertEqual([instance.url for instance in route.instances],
+                         ['http://a', 'http://b'])
+        self.assertIsNone(routing.route('empty'))
+
+    def test_table_from_environment(self):
+        self.app.config['SERVICE_ROUTES'] = None
+        table = json.dumps({'accounts': ['http://env']})
+
+        with mock.patch.dict(os.environ, {'SERVICE_ROUTES': table}):
+            route = routing.route('accounts')
+
+        self.assertEqual(route.instances[0].url, 'http://env')
+
+    def test_table_from_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                         delete=False) as file:
+            json.dump({'accounts': ['http://file']}, file)
+        self.addCleanup(os.remove, file.name)
+
+        self.app.config.update(SERVICE_ROUTES=None,
+                               SERVICE_ROUTES_FILE=file.name)
+
+        with mock.patch.dict(os.environ, clear=True):
+            route = routing.route('accounts')
+
+        self.assertEqual(route.instances[0].url, 'http://file')
+
+    def test_picks_the_less_busy_instance(self):
+        route = routing.Route(['http://a', 'http://b'])
+        busy = route.acquire()
+
+        self.assertIsNot(route.acquire(), busy)
+        self.assertEqual([instance.outstanding
+                          for instance in route.instances], [1, 1])
+
+    def test_release(self):
+        route = routing.Route(['http://a'])
+        instance = route.acquire()
+        instance.failures = 1
+
+        route.release(instance, False)
+
+        self.assertEqual((instance.outstanding, instance.failures), (0, 0))
+
+    def test_ejects_after_consecutive_failures(self):
+        route = routing.Route(['http://a', 'http://b'])
+        bad, good = route.instances
+
+        for _ in range(2):
+            bad.outstanding += 1
+            route.release(bad, True)
+
+        self.assertGreater(bad.ejected_until, 0)
+        for _ in range(10):
+            instance = route.acquire()
+            self.assertIs(instance, good)
+            route.release(instance, False)
+
+    def test_all_ejected_still_picks_one(self):
+        route = routing.Route(['http://a'])
+        instance = route.instances[0]
+        instance.ejected_until = float('inf')
+
+        self.assertIs(route.acquire(), instance)
+
+
+if __name__ == '__main__':
+    unittest.main()
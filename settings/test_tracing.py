@@ -0,0 +1,161 @@
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from flask import Flask
+
+from settings import tracing
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+
+class ParseTraceparentTestCase(unittest.TestCase):
+
+    def test_valid(self):
+        self.assertEqual(
+            tracing.parse_traceparent('00-%s-%s-01' % (TRACE_ID, PARENT_ID)),
+            (TRACE_ID, PARENT_ID, True))
+        self.assertEqual(
+            tracing.parse_traceparent('00-%s-%s-00' % (TRACE_ID, PARENT_ID)),
+            (TRACE_ID, PARENT_ID, False))
+
+    def test_later_versions_may_append_fields(self):
+        self.assertEqual(
+            tracing.parse_traceparent('01-%s-%s-03-what-ever'
+                                      % (TRACE_ID, PARENT_ID)),
+            (TRACE_ID, PARENT_ID, True))
+
+    def test_invalid(self):
+        for header in (
+                None,
+                '',
+                'ff-%s-%s-01' % (TRACE_ID, PARENT_ID),
+                '0x-%s-%s-01' % (TRACE_ID, PARENT_ID),
+                '00-%s-%s-01-extra' % (TRACE_ID, PARENT_ID),
+                '00-%s-%s-01' % (TRACE_ID.upper(), PARENT_ID),
+                '00-%s-%s-0x' % (TRACE_ID, PARENT_ID),
+                '00-%s-%s-01' % ('0' * 32, PARENT_ID),
+                '00-%s-%s-01' % (TRACE_ID, '0' * 16),
+                '00-%s-%s-01' % (TRACE_ID[:-1], PARENT_ID),
+                '00-%s-%s' % (TRACE_ID, PARENT_ID),
+                '00-+%s-%s-01' % (TRACE_ID[1:], PARENT_ID),
+                '00_%s_%s_01' % (TRACE_ID, PARENT_ID)):
+            self.assertIsNone(tracing.parse_traceparent(header), header)
+
+
+class TracingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.exported = []
+        patcher = mock.patch.object(tracing, '_export',
+                                    self.exported.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.app = Flask(__name__)
+        self.app.config.update(TRACING_ENABLED=True, TRACE_SAMPLE_RATE=1.0)
+
+        @self.app.route('/work')
+        def work():
+            with tracing.span('http.client', 'CLIENT') as span:
+                return span.traceparent()
+
+        @self.app.route('/fan-out')
+        def fan_out():
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                futures = [executor.submit(tracing.wrap(work))
+                           for _ in range(2)]
+                return ','.join(future.result() for future in futures)
+
+        with mock.patch('atexit.register'):
+            tracing.install(self.app)
+
+        self.client = self.app.test_client()
+
+    def get(self, path, traceparent=None):
+        headers = {}
+        if traceparent is not None:
+            headers['traceparent'] = traceparent
+        return self.client.get(path, headers=headers)
+
+    def test_continues_a_sampled_trace(self):
+        response = self.get('/work', '00-%s-%s-01' % (TRACE_ID, PARENT_ID))
+        client, server = self.exported
+
+        self.assertEqual(response.data.decode('ascii'),
+                         '00-%s-%s-01' % (TRACE_ID, client.span_id))
+        self.assertEqual((server.trace_id, server.parent_id),
+                         (TRACE_ID, PARENT_ID))
+        self.assertEqual(client.parent_id, server.span_id)
+
+    def test_forwards_an_unsampled_trace(self):
+        response = self.get('/work', '00-%s-%s-00' % (TRACE_ID, PARENT_ID))
+        forwarded = tracing.parse_traceparent(response.data.decode('ascii'))
+
+        self.assertEqual(forwarded[0], TRACE_ID)
+        self.assertIs(forwarded[2], False)
+        self.assertTrue(response.headers['traceresponse'].endswith('-00'))
+        self.assertEqual(self.exported, [])
+
+    def test_not_sampled_locally(self):
+        tracing._config['sample_rate'] = 0.0
+
+        response = self.get('/work')
+
+        self.assertIs(
+            tracing.parse_traceparent(response.data.decode('ascii'))[2],
+            False)
+        self.assertEqual(self.exported, [])
+
+    def test_wrap_keeps_the_parent_on_other_threads(self):
+        self.get('/fan-out', '00-%s-%s-01' % (TRACE_ID, PARENT_ID))
+        server = self.exported[-1]
+
+        clients = self.exported[:-1]
+        self.assertEqual(len(clients), 2)
+        for client in clients:
+            self.assertEqual((client.trace_id, client.parent_id),
+                             (TRACE_ID, server.span_id))
+
+    def test_no_span_outside_a_request(self):
+        with tracing.span('db.call') as span:
+            self.assertIsNone(span)
+
+
+
+class FlushTestCase(unittest.TestCase):
+
+    def setUp(self):
+        file = tempfile.NamedTemporaryFile(suffix='.ndjson', delete=False)
+        file.close()
+        self.file = file.name
+        self.addCleanup(os.remove, self.file)
+
+        patcher = mock.patch.dict(tracing._config, file=self.file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_writes_outside_the_export_lock(self):
+        finished = mock.Mock()
+        finished.json_serialize.return_value = {'id': PARENT_ID}
+        tracing._pending.append(finished)
+        real_open = open
+
+        def checked_open(*args, **kwargs):
+            self.assertFalse(tracing._export_lock.locked())
+            return real_open(*args, **kwargs)
+
+        with mock.patch('builtins.open', checked_open):
+            tracing.flush()
+
+        with open(self.file) as file:
+            self.assertEqual([json.loads(line) for line in file],
+                             [{'id': PARENT_ID}])
+        self.assertEqual(tracing._pending, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,358 @@
+"""
+tracing module. Lightweight span tracing with W3C trace context.
+
+An incoming `traceparent` header continues the caller's trace; otherwise
+a new trace is started for TRACE_SAMPLE_RATE of requests. Requests that
+are not sampled still forward the trace context, flagged as unsampled,
+but record no spans. Spans are made
+with span() around database calls, bcrypt and downstream calls, and the
+current context is forwarded by settings.request.call. Finished spans
+are appended to TRACE_FILE as Zipkin v2 JSON, one span per line.
+
+Nothing is installed unless TRACING_ENABLED is set; outside of a traced
+request span() returns a shared do-nothing context manager.
+"""
+
+from flask import request
+
+import atexit
+import json
+import os
+import random
+import re
+import threading
+import time
+from functools import wraps
+
+# Key of the request's server span in the WSGI environ.
+_SPAN_KEY = 'zapi.span'
+
+# version-trace_id-parent_id-flags, lowercase hex only. Versions after 00
+# may append fields, see parse_traceparent().
+_TRACEPARENT = re.compile(
+    r'([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-.*)?\Z')
+
+_local = threading.local()
+
+_export_lock = threading.Lock()
+_pending = []  # Finished spans not yet written.
+# Keeps concurrent flushes from interleaving lines in TRACE_FILE.
+_file_lock = threading.Lock()
+
+_config = {}
+
+
+class Span(object):
+    """
+    A timed operation within a trace.
+    """
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind',
+                 'tags', 'timestamp', 'start', 'duration', 'sampled')
+
+    def __init__(self, trace_id, parent_id, name, kind=None, tags=None,
+                 sampled=True):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.tags = tags or {}
+        self.timestamp = int(time.time() * 1000000)
+        self.start = time.perf_counter()
+        self.duration = None
+        self.sampled = sampled
+
+    def tag(self, key, value):
+        self.tags[key] = str(value)
+
+    def finish(self):
+        self.duration = int((time.perf_counter() - self.start) * 1000000)
+        if self.sampled:
+            _export(self)
+
+    def traceparent(self):
+        """
+        Returns:
+            (string): The W3C traceparent header value for this span.
+        """
+        return '00-%s-%s-%s' % (self.trace_id, self.span_id,
+                                '01' if self.sampled else '00')
+
+    def json_serialize(self):
+        span = {
+            'traceId': self.trace_id,
+            'id': self.span_id,
+            'name': self.name,
+            'timestamp': self.timestamp,
+            'duration': self.duration,
+            'localEndpoint': {'serviceName': _config['service']},
+            'tags': self.tags,
+        }
+
+        if self.parent_id is not None:
+            span['parentId'] = self.parent_id
+        if self.kind is not None:
+            span['kind'] = self.kind
+
+        return span
+
+
+class _Scope(object):
+    """
+    Makes span the current span for the with block and finishes it on
+    the way out.
+    """
+
+    __slots__ = ('span',)
+
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        _stack().append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _stack().pop()
+        if exc_type is not None:
+            self.span.tag('error', exc_type.__name__)
+        self.span.finish()
+        return False
+
+
+class _NullScope(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class _UnsampledScope(object):
+    """
+    Stands in for a child of an unsampled span: yields that span, so
+    its context can still be forwarded, without recording anything.
+    """
+
+    __slots__ = ('span',)
+
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        return self.span
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+
+    if stack is None:
+        stack = _local.stack = []
+
+    return stack
+
+
+def current():
+    """
+    Returns:
+        (Span): The current span on this thread, or None.
+    """
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def span(name, kind=None, **tags):
+    """
+    Starts a child of the current span:
+
+        with tracing.span('db.call', procedure='create_identity') as span:
+            ...
+
+    Params:
+        name (string): The operation name.
+        kind (string, optional): 'CLIENT' for outgoing calls.
+        **tags: Tags for the span.
+
+    Returns:
+        A context manager that yields the span, or None when this thread
+        is not in a traced request. In a request that is not sampled it
+        yields the request's span, which is never recorded.
+    """
+    parent = current()
+
+    if parent is None:
+        return _NULL_SCOPE
+
+    if not parent.sampled:
+        return _UnsampledScope(parent)
+
+    return _Scope(Span(parent.trace_id, parent.span_id, name, kind,
+                       {key: str(value) for key, value in tags.items()}))
+
+
+def wrap(fn):
+    """
+    Binds fn to the current span, so spans it starts on another thread
+    (e.g. in a ThreadPoolExecutor) belong to this trace.
+    """
+    parent = current()
+
+    if parent is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        stack = _stack()
+        stack.append(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stack.pop()
+
+    return wrapper
+
+
+def parse_traceparent(header):
+    """
+    Params:
+        header (string): A W3C traceparent header value.
+
+    Returns:
+        (tuple): (trace_id, parent_id, sampled), or None if the header is
+                 missing or malformed.
+    """
+    if not header:
+        return None
+
+    match = _TRACEPARENT.match(header.strip())
+    if match is None:
+        return None
+
+    version, trace_id, parent_id, flags, extra = match.groups()
+
+    # ff is never valid; version 00 has exactly four fields. Later
+    # versions are read as 00, ignoring what they append.
+    if version == 'ff' or (version == '00' and extra is not None):
+        return None
+
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def install(flask_app):
+    """
+    Hooks tracing into flask_app. Does nothing unless TRACING_ENABLED.
+
+    Params:
+        flask_app (Flask): The application.
+    """
+    config = flask_app.config
+
+    if not config.get('TRACING_ENABLED', False):
+        return
+
+    _config.update(
+        service=config.get('TRACE_SERVICE_NAME', 'zapi-id'),
+        sample_rate=config.get('TRACE_SAMPLE_RATE', 1.0),
+        file=config.get('TRACE_FILE', 'traces.ndjson'),
+        flush_size=config.get('TRACE_FLUSH_SIZE', 100))
+
+    flask_app.before_request(_before_request)
+    flask_app.after_request(_after_request)
+    flask_app.teardown_request(_teardown_request)
+
+    atexit.register(flush)
+
+
+def _before_request():
+    parent = current()  # Set for /batch sub-requests.
+    context = parse_traceparent(request.headers.get('traceparent'))
+
+    if context is not None:
+        trace_id, parent_id, sampled = context
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+        sampled = parent.sampled
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = random.random() < _config['sample_rate']
+
+    if request.url_rule is not None:
+        name = request.method + ' ' + request.url_rule.rule
+    else:
+        name = request.method
+
+    # Unsampled requests get a span too, only to forward the context.
+    server_span = Span(trace_id, parent_id, name, 'SERVER',
+                       {'http.method': request.method,
+                        'http.path': request.path},
+                       sampled)
+
+    request.environ[_SPAN_KEY] = server_span
+    _stack().append(server_span)
+
+
+def _after_request(response):
+    server_span = request.environ.get(_SPAN_KEY)
+
+    if server_span is not None:
+        server_span.tag('http.status_code', response.status_code)
+        response.headers['traceresponse'] = server_span.traceparent()
+
+    return response
+
+
+def _teardown_request(exc):
+    server_span = request.environ.pop(_SPAN_KEY, None)
+
+    if server_span is None:
+        return
+
+    _stack().pop()
+    if exc is not None:
+        server_span.tag('error', type(exc).__name__)
+    server_span.finish()
+
+
+def _export(finished):
+    with _export_lock:
+        _pending.append(finished)
+        full = len(_pending) >= _config['flush_size']
+
+    if full:
+        flush()
+
+
+def flush():
+    """
+    Writes the finished spans to TRACE_FILE. Called whenever
+    TRACE_FLUSH_SIZE spans are waiting, and at exit.
+    """
+    global _pending
+
+    with _export_lock:
+        spans, _pending = _pending, []
+
+    if not spans:
+        return
+
+    # Outside the lock so threads finishing spans don't wait on the
+    # disk. Batches from concurrent flushes may land out of order; spans
+    # carry their own timestamps.
+    lines = ''.join(json.dumps(finished.json_serialize()) + '\n'
+                    for finished in spans)
+
+    with _file_lock, open(_config['file'], 'a') as file:
+        file.write(lines)